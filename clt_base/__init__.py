@@ -2,8 +2,50 @@
 #   change to importing specific objects rather than everything)
 
 from .base_components import *
-from .experiments import *
 from .input_parsers import *
-from .plotting import *
+from .profiling import *
 
+import importlib
 
+# Modules with heavy dependencies (matplotlib.pyplot for plotting, SQL and
+#   process pools for experiments) are only imported when one of their
+#   public names is first accessed (e.g. `clt_base.Experiment`), so that
+#   `import clt_base` stays cheap for processes that only simulate
+# Keys are the public classes and functions of these modules, and values
+#   are the modules that define them -- listed here (rather than found by
+#   importing the modules) so that looking up any other name, `dir(clt_base)`,
+#   and `__all__` do not import the modules
+lazy_names_submodules = {
+    **{name: "experiments" for name in
+       ["ExperimentError", "check_is_subset_list", "format_current_val_for_sql",
+        "format_current_val_for_bulk_sql", "BulkSQLResultsWriter", "NpyResultsWriter",
+        "P2QuantilesEstimator", "OnlineSummaryWriter", "get_sql_table_as_df",
+        "init_experiment_worker", "simulate_rep_batch_in_worker", "Experiment"]},
+    **{name: "plotting" for name in
+       ["plot_subpop_decorator", "plot_metapop_decorator", "plot_subpop_epi_metrics",
+        "plot_metapop_epi_metrics", "plot_subpop_total_infected_deaths",
+        "plot_metapop_total_infected_deaths", "plot_subpop_basic_compartment_history",
+        "plot_metapop_basic_compartment_history"]}
+}
+
+# `from clt_base import *` also imports the lazily loaded names
+#   (which imports their modules), but not the names used to load them
+__all__ = [name for name in globals()
+           if not name.startswith("_") and name not in ("importlib", "lazy_names_submodules")] + \
+    list(lazy_names_submodules)
+
+
+def __getattr__(name):
+    submodule_name = lazy_names_submodules.get(name)
+
+    if submodule_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{submodule_name}", __name__), name)
+    globals()[name] = value
+
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(lazy_names_submodules))
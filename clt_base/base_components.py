@@ -1,5 +1,8 @@
+from __future__ import annotations
+
 from .utils import np, sc, copy, ABC, abstractmethod, dataclass, \
-    Optional, Enum, datetime, pd
+    Optional, Enum, datetime, pd, hashlib, pickle
+from .profiling import remove_instrumentation
 from collections import defaultdict
 
 
@@ -62,6 +65,43 @@ def approx_binomial_probability_from_rate(rate: np.ndarray,
     return 1 - np.exp(-rate * interval_length)
 
 
+def get_broadcast_multinomial_realization(RNG: np.random.Generator,
+                                          counts: np.ndarray,
+                                          probabilities_array: np.ndarray) -> np.ndarray:
+    """
+    Samples one multinomial random variable for every age-risk group
+    (and every replication, if replications are batched) in a single
+    call, rather than looping over age-risk groups. Each element of
+    `counts` is split across the categories along the leading axis of
+    `probabilities_array` -- this is the same distribution as sampling
+    each age-risk group separately.
+
+    Parameters:
+        RNG (np.random.Generator object):
+             used to generate stochastic transitions in the model and control
+             reproducibility.
+        counts (np.ndarray):
+            number of trials for each age-risk group, dimension |A| x |R|
+            (or N x |A| x |R| for N batched replications).
+        probabilities_array (np.ndarray):
+            probabilities of each outcome, dimension (number of outcomes
+            x shape of `counts`) -- probabilities along the leading axis
+            should sum to 1 for each age-risk group.
+
+    Returns:
+        np.ndarray:
+            realizations, same dimension as `probabilities_array`.
+    """
+
+    # np.random.Generator.multinomial broadcasts over leading axes
+    #   of `n` and `pvals`, with categories along the last axis of `pvals`,
+    #   so the outcomes axis is moved to the end and back again
+    realizations = RNG.multinomial(np.asarray(counts, dtype=int),
+                                   np.moveaxis(probabilities_array, 0, -1))
+
+    return np.moveaxis(realizations, -1, 0)
+
+
 @dataclass
 class Config:
     """
@@ -81,6 +121,11 @@ class Config:
         save_daily_history (bool):
             set to `True` to save `StateVariable` state to history after each
             simulation day -- set to `False` if want speedier performance.
+        pack_compartments (bool):
+            set to `True` to store all `Compartment` values of a `SubpopModel`
+            in one contiguous array and update them in place -- see
+            `SubpopModel.pack_compartments`. Only read when the
+            `SubpopModel` is created -- changing it afterwards has no effect.
     """
 
     timesteps_per_day: int = 7
@@ -88,6 +133,7 @@ class Config:
     start_real_date: datetime.time = datetime.datetime.strptime("2024-10-31",
                                                                 "%Y-%m-%d").date()
     save_daily_history: bool = True
+    pack_compartments: bool = False
 
 
 @dataclass
@@ -105,6 +151,140 @@ class SubpopParams(ABC):
     pass
 
 
+class SharedParams:
+    """
+    Read-only store of parameter values that are common to many
+    subpopulations -- subpopulations built from the same `SharedParams`
+    instance share its arrays, rather than each holding a copy,
+    and keep their own values only for the fields they override.
+
+    Arrays in the store are read-only (modifying them in-place
+    raises a `ValueError`), and `SubpopModel` does not copy read-only
+    arrays of its params (see `copy_params`). To change a shared
+    field for one subpopulation, assign a new value to the field of
+    that subpopulation's params (e.g. `subpop_model.params.beta_baseline = 2`
+    or `subpop_model.params.school_contact_matrix = new_matrix`) --
+    the other subpopulations keep the shared value ("copy-on-write").
+
+    Attributes:
+        base_params (dict):
+            keys are parameter names and values are parameter values
+            shared by all subpopulations -- lists are converted to
+            read-only numpy arrays.
+    """
+
+    def __init__(self,
+                 base_params: dict):
+        """
+        Params:
+            base_params (dict):
+                holds epidemiological parameter values -- keys and
+                values respectively must match field names and format
+                of the model's `SubpopParams` dataclass. Is not modified --
+                arrays are copied once into the store.
+        """
+
+        self.base_params = {}
+
+        for name, val in base_params.items():
+            if isinstance(val, (list, np.ndarray)):
+                val = np.array(val)
+                val.setflags(write=False)
+            self.base_params[name] = val
+
+    def get_params_dict(self,
+                        overrides: Optional[dict] = None) -> dict:
+        """
+        Returns new dictionary of parameter values (for example, to pass
+            as `params` to `FluSubpopModel`), whose values are the shared
+            values in `self.base_params` (without copying), except for
+            the fields in `overrides`.
+
+        Args:
+            overrides (Optional[dict]):
+                keys are parameter names and values are values for
+                one subpopulation that replace the shared values.
+
+        Returns:
+            dict:
+                keys are parameter names and values are parameter values.
+
+        Raises:
+            SubpopModelError:
+                if a key of `overrides` is not a parameter name
+                in `self.base_params`.
+        """
+
+        overrides = overrides if overrides is not None else {}
+
+        unknown_names = [name for name in overrides if name not in self.base_params]
+
+        if unknown_names:
+            raise SubpopModelError(f"Overridden parameters {unknown_names} are not "
+                                   f"parameters of the SharedParams instance.")
+
+        params_dict = dict(self.base_params)
+
+        for name, val in overrides.items():
+            params_dict[name] = np.asarray(val) if isinstance(val, list) else val
+
+        return params_dict
+
+    def get_overrides(self,
+                      params: SubpopParams) -> dict:
+        """
+        Returns fields of `params` that do not have the shared value --
+            array fields are shared if they are the same (read-only)
+            array as in `self.base_params`, and other fields are shared
+            if they are equal to the value in `self.base_params`.
+            For example, a batched engine can broadcast shared fields
+            across subpopulations and only stack overridden fields.
+
+        Args:
+            params (SubpopParams):
+                params of a subpopulation (for example,
+                `subpop_model.params`).
+
+        Returns:
+            dict:
+                keys are names of overridden fields and values are
+                their values in `params`.
+        """
+
+        overrides = {}
+
+        for name, val in vars(params).items():
+            if name not in self.base_params:
+                overrides[name] = val
+                continue
+
+            base_val = self.base_params[name]
+
+            if isinstance(base_val, np.ndarray) or isinstance(val, np.ndarray):
+                is_shared = val is base_val
+            else:
+                is_shared = val == base_val
+
+            if not is_shared:
+                overrides[name] = val
+
+        return overrides
+
+
+def copy_params(params: SubpopParams) -> SubpopParams:
+    """
+    Returns deep copy of `params`, except that read-only numpy arrays
+        (for example, arrays of a `SharedParams` instance) are shared
+        with `params` rather than copied -- they cannot be modified
+        in-place, so sharing them is safe.
+    """
+
+    memo = {id(val): val for val in vars(params).values()
+            if isinstance(val, np.ndarray) and not val.flags.writeable}
+
+    return copy.deepcopy(params, memo)
+
+
 class InterSubpopRepo(ABC):
     """
     Holds collection of `SubpopState` instances, with
@@ -176,6 +356,154 @@ class SubpopState(ABC):
             setattr(self, name, item.current_val)
 
 
+class HistoryBuffer:
+    """
+    Array-backed, list-like container for the daily history of a
+    `StateVariable` or `TransitionVariable`. Values are copied into
+    one contiguous, preallocated `np.ndarray` (days x shape of value,
+    e.g. days x |A| x |R|) rather than appended as separate arrays
+    to a Python list. Capacity can be reserved ahead of time (see
+    `SubpopModel.reserve_daily_history`) and otherwise grows geometrically.
+
+    Supports the list operations used on `history_vals_list` --
+    `append`, `len`, indexing, and iteration -- and converts to a
+    numpy array without copying: `np.asarray(history_vals_list)`
+    is a view of the stored values, so it reflects later changes
+    to the buffer (copy it to keep a snapshot).
+
+    Attributes:
+        vals (np.ndarray):
+            preallocated storage -- only the first `self.num_vals`
+            elements along axis 0 are valid history. `None` until
+            the first value is appended.
+        num_vals (int):
+            number of values saved in history.
+        reserved_capacity (int):
+            minimum number of values to allocate storage for.
+    """
+
+    def __init__(self):
+        self.vals = None
+        self.num_vals = 0
+        self.reserved_capacity = 0
+
+    def reserve(self,
+                capacity: int) -> None:
+        """
+        Makes sure storage can hold `capacity` values in total
+            without reallocating.
+
+        Args:
+            capacity (int):
+                total number of values (including those already
+                saved) to allocate storage for.
+        """
+
+        self.reserved_capacity = max(self.reserved_capacity, capacity)
+
+        if self.vals is not None and len(self.vals) < capacity:
+            self.resize(capacity)
+
+    def resize(self,
+               capacity: int) -> None:
+        """
+        Reallocates storage to hold `capacity` values, copying
+            over values saved so far.
+        """
+
+        new_vals = np.empty((capacity,) + self.vals.shape[1:], dtype=self.vals.dtype)
+        new_vals[:self.num_vals] = self.vals[:self.num_vals]
+        self.vals = new_vals
+
+    def append(self,
+               val) -> None:
+        """
+        Copies `val` into the next slot of storage -- storage
+            is allocated on the first call (with shape and dtype
+            given by `val`) and doubled in size whenever full.
+        """
+
+        val = np.asarray(val)
+
+        if self.vals is None:
+            self.vals = np.empty((max(self.reserved_capacity, 1),) + val.shape,
+                                 dtype=val.dtype)
+
+        elif val.shape != self.vals.shape[1:]:
+            raise SubpopModelError(f"Cannot save value of shape {val.shape} to history "
+                                   f"of values with shape {self.vals.shape[1:]}.")
+
+        # Upcast storage if needed (e.g. integer history, floating point value)
+        #   so that values are never silently truncated
+        elif not np.can_cast(val.dtype, self.vals.dtype):
+            self.vals = self.vals.astype(np.result_type(self.vals.dtype, val.dtype))
+
+        if self.num_vals == len(self.vals):
+            self.resize(2 * len(self.vals))
+
+        self.vals[self.num_vals] = val
+        self.num_vals += 1
+
+    def clear(self) -> None:
+        """
+        Removes all values from history -- storage is freed.
+        """
+
+        self.vals = None
+        self.num_vals = 0
+        self.reserved_capacity = 0
+
+    def set_vals(self,
+                 vals: np.ndarray) -> None:
+        """
+        Replaces history with `vals` (for example, history saved
+            by `StateVariable.get_snapshot`).
+
+        Args:
+            vals (np.ndarray):
+                saved values, shape (number of values x shape of value).
+                If there are no values, history is cleared.
+        """
+
+        if len(vals) == 0:
+            self.clear()
+            return
+
+        self.vals = np.array(vals)
+        self.num_vals = len(vals)
+
+    def as_array(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray:
+                view of saved values, shape (number of values
+                saved x shape of value).
+        """
+
+        if self.vals is None:
+            return np.empty((0,))
+
+        return self.vals[:self.num_vals]
+
+    def __array__(self, dtype=None, copy=None):
+        vals = self.as_array()
+        if dtype is not None:
+            vals = vals.astype(dtype, copy=False)
+        return np.array(vals, copy=True) if copy else vals
+
+    def __len__(self) -> int:
+        return self.num_vals
+
+    def __getitem__(self, index):
+        return self.as_array()[index]
+
+    def __iter__(self):
+        return iter(self.as_array())
+
+    def __repr__(self) -> str:
+        return f"HistoryBuffer({self.as_array()!r})"
+
+
 class StateVariable:
     """
     Parent class of `InteractionTerm`, `Compartment`, `EpiMetric`,
@@ -188,37 +516,81 @@ class StateVariable:
         current_val (np.ndarray):
             same size as `self.init_val`, holds current value of `StateVariable`
             for age-risk groups.
-        history_vals_list (list[np.ndarray]):
+        history_vals_list (HistoryBuffer):
             each element is the same size of `self.current_val`, holds
             history of compartment states for age-risk groups --
             element t corresponds to previous `self.current_val` value at
             end of simulation day t.
     """
 
+    # Names of attributes saved by `self.get_snapshot` -- subclasses
+    #   with other simulation state (for example, counters or buffers
+    #   carried across timesteps) add them here
+    snapshot_attrs_names = ("current_val",)
+
     def __init__(self, init_val=None):
         self.init_val = init_val
         self.current_val = copy.deepcopy(init_val)
-        self.history_vals_list = []
+        self.history_vals_list = HistoryBuffer()
+
+    def get_snapshot(self,
+                     include_history: bool = False) -> dict:
+        """
+        Returns dictionary of the attributes in `self.snapshot_attrs_names`
+            (and history, if `include_history` is True) -- values are
+            not copied, so the snapshot should be serialized (see
+            `SubpopModel.snapshot`) before simulating further.
+
+        Args:
+            include_history (bool):
+                if True, also saves `self.history_vals_list`.
+
+        Returns:
+            dict:
+                keys are attribute names and values are attribute values.
+        """
+
+        snapshot = {name: getattr(self, name) for name in self.snapshot_attrs_names}
+
+        if include_history:
+            snapshot["history_vals_list"] = self.history_vals_list.as_array()
+
+        return snapshot
+
+    def restore_snapshot(self,
+                         snapshot: dict) -> None:
+        """
+        Sets attributes to values saved by `self.get_snapshot`. If history
+            was not saved, `self.history_vals_list` is cleared.
+        """
+
+        for name in self.snapshot_attrs_names:
+            setattr(self, name, snapshot[name])
+
+        if "history_vals_list" in snapshot:
+            self.history_vals_list.set_vals(snapshot["history_vals_list"])
+        else:
+            self.history_vals_list.clear()
 
     def save_history(self) -> None:
         """
-        Saves current value to history by appending `self.current_val` attribute
-            to `self.history_vals_list` in place.
+        Saves current value to history by copying `self.current_val` attribute
+            into `self.history_vals_list` in place.
 
-        Deep copying is CRUCIAL because `self.current_val` is a mutable
-            `np.ndarray` -- without deep copying, `self.history_vals_list` would
-            have the same value for all elements.
+        `HistoryBuffer.append` copies `self.current_val` into preallocated
+            storage, so later in-place changes to `self.current_val` do not
+            affect history.
         """
-        self.history_vals_list.append(copy.deepcopy(self.current_val))
+        self.history_vals_list.append(self.current_val)
 
     def reset(self) -> None:
         """
         Resets `self.current_val` to `self.init_val`
-        and resets `self.history_vals_list` attribute to empty list.
+        and clears `self.history_vals_list`.
         """
 
         self.current_val = copy.deepcopy(self.init_val)
-        self.history_vals_list = []
+        self.history_vals_list.clear()
 
 
 class Compartment(StateVariable):
@@ -229,43 +601,55 @@ class Compartment(StateVariable):
     Inherits attributes from `StateVariable`.
 
     Attributes:
-        current_inflow (np.ndarray):
-            same size as `self.current_val`, used to sum up all
-            transition variable realizations incoming to this compartment
-            for age-risk groups.
-        current_outflow (np.ndarray):
-            same size of `self.current_val`, used to sum up all
-            transition variable realizations outgoing from this compartment
-            for age-risk groups.
+        is_packed (bool):
+            if `True`, `self.current_val` is a view into its `SubpopModel`'s
+            `compartments_buffer` -- see `SubpopModel.pack_compartments`.
+            Assigning to `self.current_val` then copies the assigned
+            value into the buffer rather than replacing the array.
     """
 
     def __init__(self,
                  init_val):
+        self.is_packed = False
+
         super().__init__(np.asarray(init_val, dtype=float))
 
-        self.current_inflow = np.zeros(np.shape(init_val))
-        self.current_outflow = np.zeros(np.shape(init_val))
+    @property
+    def current_val(self) -> np.ndarray:
+        return self._current_val
+
+    @current_val.setter
+    def current_val(self, value) -> None:
+        if self.is_packed:
+            if value is not self._current_val:
+                self._current_val[...] = value
+        else:
+            self._current_val = value
 
-    def update_current_val(self) -> None:
-        """
-        Updates `self.current_val` attribute in-place by adding
-            `self.current_inflow` (sum of all incoming transition variables'
-            realizations) and subtracting current outflow (sum of all
-            outgoing transition variables' realizations).
+    def pack(self,
+             buffer_view: np.ndarray) -> None:
         """
-        self.current_val = self.current_val + self.current_inflow - self.current_outflow
+        Copies `self.current_val` into `buffer_view` and makes
+            `buffer_view` the new `self.current_val`.
 
-    def reset_inflow(self) -> None:
-        """
-        Resets `self.current_inflow` attribute to np.ndarray of zeros.
+        Args:
+            buffer_view (np.ndarray):
+                view into a `SubpopModel`'s `compartments_buffer`,
+                same shape as `self.current_val`.
         """
-        self.current_inflow = np.zeros(np.shape(self.current_inflow))
 
-    def reset_outflow(self) -> None:
+        buffer_view[...] = self._current_val
+        self._current_val = buffer_view
+        self.is_packed = True
+
+    def unpack(self) -> None:
         """
-        Resets `self.current_outflow` attribute to np.ndarray of zeros.
+        Replaces `self.current_val` with a copy that no longer
+            shares memory with a `SubpopModel`'s `compartments_buffer`.
         """
-        self.current_outflow = np.zeros(np.shape(self.current_outflow))
+
+        self._current_val = np.array(self._current_val)
+        self.is_packed = False
 
 
 class TransitionVariable(ABC):
@@ -296,7 +680,7 @@ class TransitionVariable(ABC):
         current_val (np.ndarray):
             holds realization of random variable parameterized by
             `self.current_rate`.
-        history_vals_list (list[np.ndarray]):
+        history_vals_list (HistoryBuffer):
             each element is the same size of `self.current_val`, holds
             history of transition variable realizations for age-risk
             groups -- element t corresponds to previous `self.current_val`
@@ -340,7 +724,7 @@ class TransitionVariable(ABC):
         self.current_rate = None
         self.current_val = 0
 
-        self.history_vals_list = []
+        self.history_vals_list = HistoryBuffer()
 
     @property
     def transition_type(self) -> TransitionTypes:
@@ -376,43 +760,19 @@ class TransitionVariable(ABC):
         """
         pass
 
-    def update_origin_outflow(self) -> None:
-        """
-        Adds current realization of `TransitionVariable` to
-            its origin `Compartment`'s current_outflow.
-            Used to compute total number leaving that
-            origin `Compartment`.
-        """
-
-        self.origin.current_outflow = self.origin.current_outflow + self.current_val
-
-    def update_destination_inflow(self) -> None:
-        """
-        Adds current realization of `TransitionVariable` to
-            its destination `Compartment`'s `current_inflow`.
-            Used to compute total number leaving that
-            destination `Compartment`.
-        """
-
-        self.destination.current_inflow = self.destination.current_inflow + self.current_val
-
     def save_history(self) -> None:
         """
-        Saves current value to history by appending `self.current_val`
-            attribute to `self.history_vals_list` in place.
-
-        Deep copying is CRUCIAL because `self.current_val` is a mutable
-            np.ndarray -- without deep copying, `self.history_vals_list` would
-            have the same value for all elements.
+        Saves current value to history by copying `self.current_val`
+            attribute into `self.history_vals_list` in place.
         """
-        self.history_vals_list.append(copy.deepcopy(self.current_val))
+        self.history_vals_list.append(self.current_val)
 
     def reset(self) -> None:
         """
-        Resets `self.history_vals_list` attribute to empty list.
+        Clears `self.history_vals_list`.
         """
 
-        self.history_vals_list = []
+        self.history_vals_list.clear()
 
     def get_realization(self,
                         RNG: np.random.Generator,
@@ -741,9 +1101,15 @@ class TransitionVariableGroup:
             transition variables list x number of age groups x number of risk groups).
         """
 
+        # Rates are broadcast to the origin's shape -- if the origin
+        #   holds batched replications, some rates may only depend on
+        #   fixed parameters (|A| x |R|) while others depend on the
+        #   batched state (N x |A| x |R|)
+        origin_shape = np.shape(self.origin.current_val)
+
         current_rates_list = []
         for tvar in self.transition_variables:
-            current_rates_list.append(tvar.current_rate)
+            current_rates_list.append(np.broadcast_to(tvar.current_rate, origin_shape))
 
         return np.asarray(current_rates_list)
 
@@ -797,21 +1163,9 @@ class TransitionVariableGroup:
 
         probabilities_array = self.get_probabilities_array(num_timesteps)
 
-        num_outflows = len(self.transition_variables)
-
-        num_age_groups, num_risk_groups = np.shape(self.origin.current_val)
-
-        # We use num_outflows + 1 because for the multinomial distribution we explicitly model
-        #   the number who stay/remain in the compartment
-        realizations_array = np.zeros((num_outflows + 1, num_age_groups, num_risk_groups))
-
-        for age_group in range(num_age_groups):
-            for risk_group in range(num_risk_groups):
-                realizations_array[:, age_group, risk_group] = RNG.multinomial(
-                    np.asarray(self.origin.current_val[age_group, risk_group], dtype=int),
-                    probabilities_array[:, age_group, risk_group])
-
-        return realizations_array
+        return get_broadcast_multinomial_realization(RNG,
+                                                     self.origin.current_val,
+                                                     probabilities_array)
 
     def get_multinomial_taylor_approx_realization(self,
                                                   RNG: np.random.Generator,
@@ -838,8 +1192,6 @@ class TransitionVariableGroup:
                 compartment).
         """
 
-        num_outflows = len(self.transition_variables)
-
         current_rates_array = self.get_current_rates_array()
 
         total_rate = self.get_total_rate()
@@ -852,19 +1204,9 @@ class TransitionVariableGroup:
         current_scaled_rates_array = np.vstack((current_rates_array / num_timesteps,
                                                 np.expand_dims(1 - total_rate / num_timesteps, axis=0)))
 
-        num_age_groups, num_risk_groups = np.shape(self.origin.current_val)
-
-        # We use num_outflows + 1 because for the multinomial distribution we explicitly model
-        #   the number who stay/remain in the compartment
-        realizations_array = np.zeros((num_outflows + 1, num_age_groups, num_risk_groups))
-
-        for age_group in range(num_age_groups):
-            for risk_group in range(num_risk_groups):
-                realizations_array[:, age_group, risk_group] = RNG.multinomial(
-                    np.asarray(self.origin.current_val[age_group, risk_group], dtype=int),
-                    current_scaled_rates_array[:, age_group, risk_group])
-
-        return realizations_array
+        return get_broadcast_multinomial_realization(RNG,
+                                                     self.origin.current_val,
+                                                     current_scaled_rates_array)
 
     def get_poisson_realization(self,
                                 RNG: np.random.Generator,
@@ -888,23 +1230,14 @@ class TransitionVariableGroup:
                 number of age groups x number of risk groups).
         """
 
-        num_outflows = len(self.transition_variables)
-
-        num_age_groups, num_risk_groups = np.shape(self.origin.current_val)
-
-        realizations_array = np.zeros((num_outflows, num_age_groups, num_risk_groups))
-
-        transition_variables = self.transition_variables
+        # Independent Poisson draws for every outflow and age-risk group
+        #   (and replication, if batched) in a single call -- the origin's
+        #   current_val broadcasts against the leading outflows axis
+        # The outflows axis is moved to the end so that draws are made in
+        #   the same order as sampling one age-risk group at a time
+        means_array = self.origin.current_val * self.get_current_rates_array() / num_timesteps
 
-        for age_group in range(num_age_groups):
-            for risk_group in range(num_risk_groups):
-                for outflow_ix in range(num_outflows):
-                    realizations_array[outflow_ix, age_group, risk_group] = RNG.poisson(
-                        self.origin.current_val[age_group, risk_group] *
-                        transition_variables[outflow_ix].current_rate[
-                            age_group, risk_group] / num_timesteps)
-
-        return realizations_array
+        return np.moveaxis(RNG.poisson(np.moveaxis(means_array, 0, -1)), -1, 0)
 
     def get_multinomial_deterministic_realization(self,
                                                   RNG: np.random.Generator,
@@ -1004,7 +1337,7 @@ class TransitionVariableGroup:
         # Update the current realization of the transition variables contained in this group
         for ix in range(len(self.transition_variables)):
             self.transition_variables[ix].current_val = \
-                self.current_vals_list[ix, :, :]
+                self.current_vals_list[ix]
 
 
 class EpiMetric(StateVariable, ABC):
@@ -1142,6 +1475,37 @@ class DynamicVal(StateVariable, ABC):
         """
 
 
+# Timelines of `Schedule` values shared across `SubpopModel` instances
+#   (and across replications) -- see `SubpopModel.prepare_schedule_timelines`
+# Keys are (schedule type, `Schedule.get_timeline_key()`, params fingerprint,
+#   start date) tuples and values are read-only arrays of daily values
+#   starting at the start date
+schedule_timelines_cache = {}
+
+# Maximum number of timelines kept in `schedule_timelines_cache` -- the
+#   oldest timeline is removed when the cache is full
+max_num_schedule_timelines = 256
+
+
+def compute_params_fingerprint(params: SubpopParams,
+                               params_names: tuple) -> str:
+    """
+    Returns a hash of the values of the `params` attributes
+    named in `params_names` -- used to tell whether these
+    parameters have changed.
+    """
+
+    fingerprint = hashlib.sha1()
+
+    for name in params_names:
+        val = np.asarray(getattr(params, name))
+        fingerprint.update(name.encode())
+        fingerprint.update(str((val.shape, val.dtype.str)).encode())
+        fingerprint.update(np.ascontiguousarray(val).tobytes())
+
+    return fingerprint.hexdigest()
+
+
 @dataclass
 class Schedule(StateVariable, ABC):
     """
@@ -1152,9 +1516,24 @@ class Schedule(StateVariable, ABC):
 
     Inherits attributes from `StateVariable`.
 
+    Attributes:
+        timeline_params_names (Optional[tuple[str]]):
+            class attribute -- if not `None`, the schedule's value is a
+            function of only the date, the data returned by
+            `self.get_timeline_key`, and the `SubpopParams` attributes named
+            here. Its values over the simulation are then computed once,
+            cached, and shared by all `SubpopModel` instances with the same
+            parameter values -- see `SubpopModel.prepare_schedule_timelines`.
+            If `None` (default), the value is recomputed every day.
+        params_fingerprint_cache (Optional[tuple]):
+            (values of the parameters named in `self.timeline_params_names`,
+            fingerprint of these values) tuple -- see `self.get_params_fingerprint`.
+
     See `__init__` docstring for other attributes.
     """
 
+    timeline_params_names = None
+
     def __init__(self,
                  init_val: Optional[np.ndarray | float] = None,
                  timeseries_df: Optional[dict] = None):
@@ -1171,6 +1550,8 @@ class Schedule(StateVariable, ABC):
         super().__init__(init_val)
         self.timeseries_df = timeseries_df
 
+        self.params_fingerprint_cache = None
+
     @abstractmethod
     def update_current_val(self,
                            params: SubpopParams,
@@ -1188,6 +1569,94 @@ class Schedule(StateVariable, ABC):
         """
         pass
 
+    def get_timeline_key(self) -> tuple:
+        """
+        Returns hashable data (other than the date and parameters named in
+        `self.timeline_params_names`) that the schedule's values depend on --
+        for example, a fingerprint of a calendar. Used to key cached timelines.
+        Subclasses that hold such data should override this method.
+        """
+
+        return ()
+
+    def get_params_fingerprint(self,
+                               params: SubpopParams) -> str:
+        """
+        Returns fingerprint of the parameters named in
+            `self.timeline_params_names` (see `compute_params_fingerprint`) --
+            the fingerprint is only recomputed if one of these attributes
+            of `params` has been assigned a different object since the last
+            call (e.g. by `Experiment.apply_inputs_to_model`). Parameter
+            arrays that are edited in place are not detected -- assign
+            a new array instead.
+        """
+
+        params_vals = tuple(getattr(params, name) for name in self.timeline_params_names)
+
+        cached = self.params_fingerprint_cache
+
+        if cached is None or any(val is not cached_val for val, cached_val in zip(params_vals, cached[0])):
+            self.params_fingerprint_cache = \
+                (params_vals, compute_params_fingerprint(params, self.timeline_params_names))
+
+        return self.params_fingerprint_cache[1]
+
+    def get_timeline(self,
+                     params: SubpopParams,
+                     start_date: datetime.date,
+                     num_days: int) -> np.ndarray:
+        """
+        Returns read-only array of the schedule's values on `num_days`
+        consecutive days starting at `start_date` (or more days, if a
+        longer timeline is already cached), computing (or extending) and
+        caching the timeline only if it is not already in
+        `schedule_timelines_cache`.
+
+        Args:
+            params (SubpopParams):
+                fixed parameters of subpopulation model.
+            start_date (date):
+                real-world date of the first value in the timeline.
+            num_days (int):
+                minimum number of days in the timeline.
+
+        Returns:
+            np.ndarray:
+                array whose element d is the schedule's value
+                `d` days after `start_date`.
+        """
+
+        key = (type(self).__module__,
+               type(self).__qualname__,
+               self.get_timeline_key(),
+               self.get_params_fingerprint(params),
+               start_date)
+
+        timeline = schedule_timelines_cache.get(key)
+
+        num_cached_days = 0 if timeline is None else len(timeline)
+
+        if num_cached_days >= num_days:
+            return timeline
+
+        new_vals = []
+
+        for day in range(num_cached_days, num_days):
+            self.update_current_val(params, start_date + datetime.timedelta(days=day))
+            new_vals.append(np.asarray(self.current_val, dtype=float))
+
+        timeline = np.stack(new_vals) if timeline is None \
+            else np.concatenate((timeline, np.stack(new_vals)))
+        timeline.flags.writeable = False
+
+        # Re-insert so that the most recently extended timelines are removed last
+        schedule_timelines_cache.pop(key, None)
+        if len(schedule_timelines_cache) >= max_num_schedule_timelines:
+            schedule_timelines_cache.pop(next(iter(schedule_timelines_cache)))
+        schedule_timelines_cache[key] = timeline
+
+        return timeline
+
 
 class InteractionTerm(StateVariable, ABC):
 
@@ -1258,7 +1727,9 @@ class MetapopModel(ABC):
         self.inter_subpop_repo = inter_subpop_repo
         
         self.name = name
-        
+
+        self.profiler = None
+
         for model in self.subpop_models.values():
             model.metapop_model = self
             model.interaction_terms = model.create_interaction_terms()
@@ -1313,6 +1784,17 @@ class MetapopModel(ABC):
             raise MetapopModelError(f"Current day counter ({self.current_simulation_day}) "
                                    f"exceeds last simulation day ({simulation_end_day}).")
 
+        for subpop_model in self.subpop_models.values():
+            if subpop_model.config.save_daily_history:
+                subpop_model.reserve_daily_history(simulation_end_day -
+                                                   self.current_simulation_day)
+            subpop_model.prepare_schedule_timelines(simulation_end_day)
+
+        # Metapopulation-level history aggregates all subpopulations,
+        #   so it is only saved if every subpopulation saves history
+        save_metapop_daily_history = all(subpop_model.config.save_daily_history
+                                         for subpop_model in self.subpop_models.values())
+
         while self.current_simulation_day < simulation_end_day:
 
             for subpop_model in self.subpop_models.values():
@@ -1333,6 +1815,110 @@ class MetapopModel(ABC):
 
                 subpop_model.increment_simulation_day()
 
+            if save_metapop_daily_history:
+                self.save_daily_history()
+
+    def save_daily_history(self) -> None:
+        """
+        Updates metapopulation-level history at the end of each day,
+            after every `SubpopModel` has simulated the day (only if every
+            `SubpopModel`'s `config.save_daily_history` is `True`). Does
+            nothing by default -- subclasses with quantities
+            aggregated across subpopulations should override this method.
+        """
+
+        pass
+
+    def set_profiler(self,
+                     profiler) -> None:
+        """
+        Enables (or disables, if `profiler` is `None`) profiling of the
+            phases of the simulation -- see `SubpopModel.set_profiler`.
+            Also times `compute_shared_quantities` and
+            `update_all_interaction_terms` of `self.inter_subpop_repo`
+            and `self.save_daily_history`, under the `MetapopModel`'s
+            name (or "metapop" if it has no name).
+
+        Args:
+            profiler (Optional[PhaseProfiler]):
+                accumulates timings, or `None` to disable profiling.
+        """
+
+        for subpop_model in self.subpop_models.values():
+            subpop_model.set_profiler(profiler)
+
+        repo_phases_names = ["compute_shared_quantities", "update_all_interaction_terms"]
+
+        if profiler is None:
+            remove_instrumentation(self.inter_subpop_repo, repo_phases_names)
+            remove_instrumentation(self, ["save_daily_history"])
+        else:
+            frames = (self.name or "metapop",)
+            profiler.instrument(self.inter_subpop_repo, repo_phases_names, frames)
+            profiler.instrument(self, ["save_daily_history"], frames)
+
+        self.profiler = profiler
+
+    def get_snapshot(self,
+                     include_history: bool = False) -> dict:
+        """
+        Returns dictionary with snapshot of every `SubpopModel` in
+            `self.subpop_models` -- see `SubpopModel.get_snapshot`.
+            Subclasses with metapopulation-level simulation state
+            should extend this method (and `self.restore_snapshot`).
+        """
+
+        return {"subpop_models": {name: subpop_model.get_snapshot(include_history)
+                                  for name, subpop_model in self.subpop_models.items()}}
+
+    def restore_snapshot(self,
+                         snapshot: dict) -> None:
+        """
+        Restores every `SubpopModel` in `self.subpop_models` from
+            snapshot returned by `self.get_snapshot`.
+        """
+
+        if set(snapshot["subpop_models"]) != set(self.subpop_models):
+            raise MetapopModelError("Snapshot subpopulation models do not match "
+                                    "the MetapopModel's subpopulation models.")
+
+        for name, subpop_model in self.subpop_models.items():
+            subpop_model.restore_snapshot(snapshot["subpop_models"][name])
+
+    def snapshot(self,
+                 include_history: bool = False) -> bytes:
+        """
+        Serializes the full simulation state of every `SubpopModel`
+            (see `SubpopModel.snapshot`) into a binary blob, so
+            that many scenarios can be branched from a common simulated
+            prefix (for example, a burn-in period) with `self.restore`,
+            instead of simulating the prefix again for each scenario.
+
+        Args:
+            include_history (bool):
+                if True, also saves history of state variables (and any
+                metapopulation-level history), so the blob grows with
+                the number of simulated days.
+
+        Returns:
+            bytes:
+                binary blob to pass to `self.restore`.
+        """
+
+        return pickle.dumps(self.get_snapshot(include_history), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self,
+                snapshot: bytes) -> None:
+        """
+        Restores simulation state from binary blob returned by
+            `self.snapshot` -- the same blob can be restored any number
+            of times, on this `MetapopModel` or on another one with the same
+            subpopulation models and state variables.
+            See `SubpopModel.restore` for details.
+        """
+
+        self.restore_snapshot(pickle.loads(snapshot))
+
     def display(self):
         """
         Prints structure (compartments and linkages), transition variables,
@@ -1342,6 +1928,23 @@ class MetapopModel(ABC):
         for subpop_model in self.subpop_models.values():
             subpop_model.display()
 
+    def set_num_batched_reps(self,
+                             num_batched_reps: Optional[int]) -> None:
+        """
+        Sets number of replications simulated at once on every
+            `SubpopModel` instance in `self.subpop_models` --
+            see `SubpopModel.set_num_batched_reps` for details.
+            Resets the simulation.
+
+        Args:
+            num_batched_reps (Optional[positive int]):
+                number of replications to simulate at once, or `None`
+                to return to simulating a single replication.
+        """
+
+        for subpop_model in self.subpop_models.values():
+            subpop_model.set_num_batched_reps(num_batched_reps)
+
     def reset_simulation(self):
         """
         Resets `MetapopModel` by resetting and clearing
@@ -1440,6 +2043,23 @@ class SubpopModel(ABC):
             tracks real-world date -- advanced by +1 day when
             `config.timesteps_per_day` discretized timesteps
             have completed.
+        num_batched_reps (Optional[int]):
+            if `None`, the model simulates a single replication and
+            `Compartment` and `EpiMetric` values are |A| x |R|. Otherwise,
+            the model simulates `num_batched_reps` independent replications
+            at once, and `Compartment` and `EpiMetric` values (and therefore
+            `TransitionVariable` realizations) have a leading replications
+            axis, i.e. are `num_batched_reps` x |A| x |R|. Set with
+            `self.set_num_batched_reps`.
+        stoichiometry_matrix (np.ndarray):
+            number of compartments x number of transition variables
+            array -- see `self.create_stoichiometry_matrix`.
+        compartments_buffer (Optional[np.ndarray]):
+            contiguous array holding all compartments' current values
+            if compartments are packed (see `self.pack_compartments`),
+            otherwise `None` -- model methods check this attribute,
+            rather than `config.pack_compartments`, to know whether
+            compartments are packed.
 
     See `__init__` docstring for other attributes.
     """
@@ -1459,7 +2079,9 @@ class SubpopModel(ABC):
             params (SubpopParams):
                 data container for the model's epidemiological parameters,
                 such as the "Greek letters" characterizing sojourn times
-                in compartments.
+                in compartments. Deep-copied, except for read-only arrays
+                (such as arrays of a `SharedParams` instance), which are
+                shared -- see `copy_params`.
             config (Config):
                 data container for the model's simulation configuration values.
             RNG (np.random.Generator):
@@ -1473,7 +2095,7 @@ class SubpopModel(ABC):
         """
 
         self.state = copy.deepcopy(state)
-        self.params = copy.deepcopy(params)
+        self.params = copy_params(params)
         self.config = copy.deepcopy(config)
 
         self.RNG = RNG
@@ -1485,11 +2107,17 @@ class SubpopModel(ABC):
         self.metapop_model = None
         self.name = name
 
+        self.num_batched_reps = None
+
+        self.profiler = None
+
         self.interaction_terms = self.create_interaction_terms()
         self.compartments = self.create_compartments()
         self.transition_variables = self.create_transition_variables()
         self.transition_variable_groups = self.create_transition_variable_groups()
 
+        self.stoichiometry_matrix = self.create_stoichiometry_matrix()
+
         # Some epi metrics depend on transition variables, so
         #   set up epi metrics after transition variables
         self.epi_metrics = self.create_epi_metrics()
@@ -1514,6 +2142,83 @@ class SubpopModel(ABC):
 
         self.params.total_pop_age_risk = self.compute_total_pop_age_risk()
 
+        self.compartments_buffer = None
+
+        if self.config.pack_compartments:
+            self.pack_compartments()
+
+        self.schedule_timelines = sc.objdict()
+
+    def create_stoichiometry_matrix(self) -> np.ndarray:
+        """
+        Creates the stoichiometry matrix of the model's compartmental
+            structure from each `TransitionVariable`'s `origin` and
+            `destination`. Rows correspond to compartments (in the order
+            of `self.compartments`) and columns correspond to transition
+            variables (in the order of `self.transition_variables`).
+            Element (i, j) is -1 if transition variable j leaves compartment i,
+            1 if it enters compartment i, and 0 otherwise.
+
+        Returns:
+            np.ndarray:
+                number of compartments x number of transition variables
+                array of -1, 0, and 1.
+        """
+
+        compartments = list(self.compartments.values())
+
+        stoichiometry_matrix = np.zeros((len(compartments),
+                                         len(self.transition_variables)))
+
+        for tvar_ix, (name, tvar) in enumerate(self.transition_variables.items()):
+
+            for compartment, sign in ((tvar.origin, -1), (tvar.destination, 1)):
+
+                compartment_ix = next((ix for ix, candidate in enumerate(compartments)
+                                       if candidate is compartment), None)
+
+                if compartment_ix is None:
+                    raise SubpopModelError(f"TransitionVariable \"{name}\" has an origin "
+                                           f"or destination that is not in "
+                                           f"\"self.compartments\".")
+
+                stoichiometry_matrix[compartment_ix, tvar_ix] += sign
+
+        return stoichiometry_matrix
+
+    def pack_compartments(self) -> None:
+        """
+        Allocates `self.compartments_buffer`, a single contiguous
+            C x |A| x |R| float array (C x N x |A| x |R| in batched mode),
+            where C is the number of compartments, and makes each
+            `Compartment`'s `current_val` (and the corresponding
+            `SubpopState` field) a view into it, in the order
+            of `self.compartments`.
+
+        Compartments are then updated in place, `SubpopState` does not
+            need to be synced with compartments after every timestep, and the
+            values of all compartments can be copied at once.
+
+        Called by `__init__` if `self.config.pack_compartments` is `True`,
+            and by `self.reset_simulation` and `self.restore_snapshot`
+            if compartments are already packed.
+        """
+
+        compartments = self.compartments.values()
+
+        for compartment in compartments:
+            if compartment.is_packed:
+                compartment.unpack()
+
+        self.compartments_buffer = \
+            np.stack([np.asarray(compartment.current_val, dtype=float)
+                      for compartment in compartments])
+
+        for compartment, buffer_view in zip(compartments, self.compartments_buffer):
+            compartment.pack(buffer_view)
+
+        self.state.sync_to_current_vals(self.compartments)
+
     def compute_total_pop_age_risk(self) -> np.ndarray:
         """
         Returns:
@@ -1599,6 +2304,122 @@ class SubpopModel(ABC):
         self._bit_generator = np.random.MT19937(seed=new_seed_number)
         self.RNG = np.random.Generator(self._bit_generator)
 
+    def set_num_batched_reps(self,
+                             num_batched_reps: Optional[int]) -> None:
+        """
+        Switches the model between simulating a single replication
+        (`num_batched_reps` is `None`) and simulating `num_batched_reps`
+        independent replications at once. In batched mode, every
+        `Compartment` and `EpiMetric` holds a leading replications axis
+        (`num_batched_reps` x |A| x |R|), so each timestep advances all
+        replications together with a single (vectorized) random draw
+        per `TransitionVariable`. Batched replications share the
+        model's `RNG`, so they are statistically equivalent to, but not
+        draw-for-draw identical to, replications simulated one after another.
+
+        Calls `self.reset_simulation`, so the model restarts from day 0.
+
+        Note: `DynamicVal` instances are shared across batched replications,
+        so enabled `DynamicVal` instances are not supported in batched mode.
+
+        Args:
+            num_batched_reps (Optional[positive int]):
+                number of replications to simulate at once, or `None`
+                to return to simulating a single replication.
+        """
+
+        if num_batched_reps is not None:
+            for name, dval in self.dynamic_vals.items():
+                if dval.is_enabled:
+                    raise SubpopModelError(f"DynamicVal \"{name}\" is enabled -- batched "
+                                           f"replications do not support enabled DynamicVal "
+                                           f"instances. Disable it or set \"num_batched_reps\" "
+                                           f"to None.")
+
+        self.num_batched_reps = num_batched_reps
+
+        self.reset_simulation()
+
+    def set_profiler(self,
+                     profiler) -> None:
+        """
+        Enables (or disables, if `profiler` is `None`) profiling of the
+            phases of the simulation. Each phase is timed under the model's
+            name (or "subpop" if it has no name):
+
+            - `self.prepare_daily_state`, `self.simulate_timesteps`,
+                and `self.save_daily_history`
+            - nested in `self.simulate_timesteps`:
+                `self.update_transition_rates`, `self.sample_transitions`,
+                `self.update_epi_metrics`, and `self.update_compartments`
+            - nested in these: `get_current_rate` and `get_realization` of
+                each `TransitionVariable`, `get_joint_realization` of each
+                `TransitionVariableGroup`, and `get_change_in_current_val`
+                and `update_current_val` of each `EpiMetric`, under
+                their names.
+
+        Methods are timed by replacing them with timed versions on
+            this model's objects (see `PhaseProfiler.instrument`), so
+            a model without a profiler has no profiling overhead.
+
+        Args:
+            profiler (Optional[PhaseProfiler]):
+                accumulates timings, or `None` to disable profiling.
+        """
+
+        subpop_phases_names = ["prepare_daily_state", "simulate_timesteps", "save_daily_history"]
+        timestep_phases_names = ["update_transition_rates", "sample_transitions",
+                                 "update_epi_metrics", "update_compartments"]
+        tvar_methods_names = ["get_current_rate", "get_realization"]
+        tvargroup_methods_names = ["get_joint_realization"]
+        epi_metric_methods_names = ["get_change_in_current_val", "update_current_val"]
+
+        instrumented_objects = [(self, subpop_phases_names, (self.name or "subpop",)),
+                                (self, timestep_phases_names, ())]
+        instrumented_objects += [(tvar, tvar_methods_names, (name,))
+                                 for name, tvar in self.transition_variables.items()]
+        instrumented_objects += [(tvargroup, tvargroup_methods_names, (name,))
+                                 for name, tvargroup in self.transition_variable_groups.items()]
+        instrumented_objects += [(metric, epi_metric_methods_names, (name,))
+                                 for name, metric in self.epi_metrics.items()]
+
+        for obj, methods_names, frames in instrumented_objects:
+            if profiler is None:
+                remove_instrumentation(obj, methods_names)
+            else:
+                profiler.instrument(obj, methods_names, frames)
+
+        self.profiler = profiler
+
+    def get_reset_val(self,
+                      svar: StateVariable) -> np.ndarray:
+        """
+        Returns a fresh copy of `svar.init_val` to use as its
+        `current_val` at the start of a simulation. If the model is in
+        batched mode and `svar` is a `Compartment` or `EpiMetric` with
+        an array initial value, the copy is repeated along a leading
+        replications axis.
+
+        Args:
+            svar (StateVariable):
+                state variable to reset.
+
+        Returns:
+            np.ndarray:
+                |A| x |R| array, or `self.num_batched_reps` x |A| x |R|
+                array in batched mode.
+        """
+
+        num_batched_reps = self.num_batched_reps
+
+        if num_batched_reps is not None and \
+                isinstance(svar, (Compartment, EpiMetric)) and \
+                isinstance(svar.init_val, np.ndarray):
+            return np.repeat(svar.init_val[np.newaxis], num_batched_reps, axis=0)
+
+        # AGAIN, MUST BE CAREFUL ABOUT MUTABLE NUMPY ARRAYS -- MUST USE DEEP COPY
+        return copy.deepcopy(svar.init_val)
+
     def simulate_until_day(self,
                            simulation_end_day: int) -> None:
         """
@@ -1624,6 +2445,11 @@ class SubpopModel(ABC):
         save_daily_history = self.config.save_daily_history
         timesteps_per_day = self.config.timesteps_per_day
 
+        if save_daily_history:
+            self.reserve_daily_history(simulation_end_day - self.current_simulation_day)
+
+        self.prepare_schedule_timelines(simulation_end_day)
+
         # simulation_end_day is exclusive endpoint
         while self.current_simulation_day < simulation_end_day:
 
@@ -1665,7 +2491,11 @@ class SubpopModel(ABC):
             self.update_compartments()
 
             self.state.sync_to_current_vals(self.epi_metrics)
-            self.state.sync_to_current_vals(self.compartments)
+
+            # Packed compartments are updated in place, so
+            #   `SubpopState` already holds their current values
+            if self.compartments_buffer is None:
+                self.state.sync_to_current_vals(self.compartments)
 
     def prepare_daily_state(self) -> None:
         """
@@ -1690,10 +2520,17 @@ class SubpopModel(ABC):
         schedules = self.schedules
         dynamic_vals = self.dynamic_vals
 
-        # Update schedules for current day
-        for schedule in schedules.values():
-            schedule.update_current_val(subpop_params,
-                                        current_real_date)
+        schedule_timelines = self.schedule_timelines
+        current_simulation_day = self.current_simulation_day
+
+        # Update schedules for current day -- look up values of schedules
+        #   with a cached timeline, and compute others
+        for name, schedule in schedules.items():
+            if name in schedule_timelines:
+                schedule.current_val = schedule_timelines[name][current_simulation_day]
+            else:
+                schedule.update_current_val(subpop_params,
+                                            current_real_date)
 
         self.state.sync_to_current_vals(schedules)
 
@@ -1765,23 +2602,34 @@ class SubpopModel(ABC):
     def update_compartments(self) -> None:
         """
         Update current value of each `Compartment`, by
-            looping through all `TransitionVariable` instances
-            and subtracting/adding their current values
-            from origin/destination compartments respectively.
+            subtracting/adding current values of all `TransitionVariable`
+            instances from their origin/destination compartments respectively.
+            Uses `self.stoichiometry_matrix` to compute the net change in
+            all compartments with a single matrix product.
         """
 
-        for tvar in self.transition_variables.values():
-            tvar.update_origin_outflow()
-            tvar.update_destination_inflow()
+        compartments = self.compartments.values()
+        transition_variables = self.transition_variables.values()
 
-        for compartment in self.compartments.values():
-            compartment.update_current_val()
+        # Realizations may not all have the same shape (e.g. if a
+        #   realization is 0 for all age-risk groups), so broadcast
+        #   them to the compartments' shape before stacking
+        shape = np.broadcast_shapes(*[np.shape(compartment.current_val) for compartment in compartments],
+                                    *[np.shape(tvar.current_val) for tvar in transition_variables])
+
+        realizations_array = np.stack([np.broadcast_to(tvar.current_val, shape)
+                                       for tvar in transition_variables])
+
+        # Net change in every compartment, computed at once --
+        #   element i is the sum of realizations of transition variables
+        #   entering compartment i minus those leaving compartment i
+        changes_array = np.tensordot(self.stoichiometry_matrix, realizations_array, axes=1)
 
-            # After updating the compartment's current value,
-            #   reset its inflow and outflow attributes, to
-            #   prepare for the next iteration.
-            compartment.reset_inflow()
-            compartment.reset_outflow()
+        if self.compartments_buffer is not None:
+            self.compartments_buffer += changes_array
+        else:
+            for compartment, change in zip(compartments, changes_array):
+                compartment.current_val = compartment.current_val + change
 
     def increment_simulation_day(self) -> None:
         """
@@ -1807,6 +2655,55 @@ class SubpopModel(ABC):
                     self.dynamic_vals.values():
             svar.save_history()
 
+    def prepare_schedule_timelines(self,
+                                   simulation_end_day: int) -> None:
+        """
+        For each `Schedule` with `timeline_params_names` that is not `None`,
+            gets (from the shared cache, or by computing it) the timeline of
+            its values from `self.start_real_date` through the day before
+            `simulation_end_day`, and stores it in `self.schedule_timelines`,
+            so that `self.prepare_daily_state` only looks up daily values.
+
+        Called at the start of `self.simulate_until_day` (and
+            `MetapopModel.simulate_until_day`). Timelines are keyed by the
+            current values of the parameters each schedule depends on, so
+            assigning new values to these parameters between calls (for
+            example, with `Experiment.apply_inputs_to_model`) uses a
+            different timeline -- see `Schedule.get_params_fingerprint`.
+
+        Args:
+            simulation_end_day (int):
+                last day (exclusive) the timelines must cover.
+        """
+
+        schedule_timelines = sc.objdict()
+
+        for name, schedule in self.schedules.items():
+            if schedule.timeline_params_names is not None:
+                schedule_timelines[name] = schedule.get_timeline(self.params,
+                                                                 self.start_real_date,
+                                                                 simulation_end_day)
+
+        self.schedule_timelines = schedule_timelines
+
+    def reserve_daily_history(self,
+                              num_days: int) -> None:
+        """
+        Preallocates storage in the history of each state variable
+            saved by `self.save_daily_history` for `num_days` more days,
+            so that saving history does not reallocate.
+
+        Args:
+            num_days (int):
+                number of additional days of history to allocate.
+        """
+
+        for svar in self.interaction_terms.values() + \
+                    self.compartments.values() + \
+                    self.epi_metrics.values() + \
+                    self.dynamic_vals.values():
+            svar.history_vals_list.reserve(len(svar.history_vals_list) + num_days)
+
     def reset_simulation(self) -> None:
         """
         Reset simulation in-place. Subsequent method calls of
@@ -1814,7 +2711,8 @@ class SubpopModel(ABC):
         day 0 state.
 
         Returns `self.current_simulation_day` to 0.
-        Restores state values to initial values.
+        Restores state values to initial values (repeated along
+        a leading replications axis if `self.num_batched_reps` is not `None`).
         Clears history on model's state variables.
         Resets transition variables' `current_val` attribute to 0.
 
@@ -1830,23 +2728,151 @@ class SubpopModel(ABC):
         self.current_simulation_day = 0
         self.current_real_date = self.start_real_date
 
-        # AGAIN, MUST BE CAREFUL ABOUT MUTABLE NUMPY ARRAYS -- MUST USE DEEP COPY
+        # Clear history (and any other per-simulation bookkeeping) first,
+        #   so that resetting state variables below is not undone
+        self.reset()
+
+        # Packed compartments are unpacked so that they can take on
+        #   reset values of a different shape (e.g. when switching to
+        #   batched replications) -- they are packed again below
+        for compartment in self.compartments.values():
+            if compartment.is_packed:
+                compartment.unpack()
+
         for svar in self.all_state_variables.values():
-            setattr(svar, "current_val", copy.deepcopy(svar.init_val))
+            setattr(svar, "current_val", self.get_reset_val(svar))
+
+        if self.compartments_buffer is not None:
+            self.pack_compartments()
 
         self.state.sync_to_current_vals(self.all_state_variables)
-        self.reset()
+
+    def get_snapshot(self,
+                     include_history: bool = False) -> dict:
+        """
+        Returns dictionary with the model's simulation state -- day
+            counters, number of batched replications, state of `self.RNG`'s
+            bit generator, current values of `TransitionVariable` instances,
+            and snapshots of all `StateVariable` instances
+            (see `StateVariable.get_snapshot`).
+
+        Values are not copied -- use `self.snapshot` for a
+            serialized copy.
+
+        Args:
+            include_history (bool):
+                if True, also saves history of state variables.
+        """
+
+        return {"current_simulation_day": self.current_simulation_day,
+                "current_real_date": self.current_real_date,
+                "num_batched_reps": self.num_batched_reps,
+                "RNG_state": self.RNG.bit_generator.state,
+                "transition_variables": {name: tvar.current_val
+                                         for name, tvar in self.transition_variables.items()},
+                "state_variables": {name: svar.get_snapshot(include_history)
+                                    for name, svar in {**self.all_state_variables,
+                                                       **self.interaction_terms}.items()}}
+
+    def restore_snapshot(self,
+                         snapshot: dict) -> None:
+        """
+        Restores simulation state from dictionary returned by
+            `self.get_snapshot`. Values in `snapshot` are assigned,
+            not copied -- use `self.restore` to restore a serialized copy.
+        """
+
+        state_variables = {**self.all_state_variables, **self.interaction_terms}
+
+        if set(snapshot["state_variables"]) != set(state_variables) or \
+                set(snapshot["transition_variables"]) != set(self.transition_variables):
+            raise SubpopModelError(f"Snapshot state variables and transition variables "
+                                   f"do not match those of SubpopModel \"{self.name}\".")
+
+        self.current_simulation_day = snapshot["current_simulation_day"]
+        self.current_real_date = snapshot["current_real_date"]
+        self.num_batched_reps = snapshot["num_batched_reps"]
+        self.RNG.bit_generator.state = snapshot["RNG_state"]
+
+        for name, tvar in self.transition_variables.items():
+            tvar.current_val = snapshot["transition_variables"][name]
+
+        # Packed compartments are unpacked so that they can take on
+        #   restored values of a different shape (e.g. with batched
+        #   replications) -- they are packed again below
+        for compartment in self.compartments.values():
+            if compartment.is_packed:
+                compartment.unpack()
+
+        for name, svar in state_variables.items():
+            svar.restore_snapshot(snapshot["state_variables"][name])
+
+        if self.compartments_buffer is not None:
+            self.pack_compartments()
+
+        self.state.sync_to_current_vals(self.all_state_variables)
+
+    def snapshot(self,
+                 include_history: bool = False) -> bytes:
+        """
+        Serializes the model's full simulation state into a binary
+            blob, so that many scenarios can be branched from a common
+            simulated prefix (for example, a burn-in period) with
+            `self.restore`, instead of simulating the prefix again
+            for each scenario. Costs O(state size) -- history is only
+            included if `include_history` is True.
+
+        Saves day counters, current values of all `StateVariable`
+            instances (and internal simulation state of `EpiMetric`
+            and `DynamicVal` instances, such as `Wastewater` buffers),
+            and the state of `self.RNG`'s bit generator.
+
+        Args:
+            include_history (bool):
+                if True, also saves history of state variables,
+                so the blob grows with the number of simulated days.
+
+        Returns:
+            bytes:
+                binary blob to pass to `self.restore`.
+        """
+
+        return pickle.dumps(self.get_snapshot(include_history), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def restore(self,
+                snapshot: bytes) -> None:
+        """
+        Restores simulation state from binary blob returned by
+            `self.snapshot`, so that `self.simulate_until_day` continues
+            from the snapshot's day exactly as the snapshotted model would
+            have (including its random transitions). The same blob can
+            be restored any number of times, on this model or on another
+            model with the same state variables and transition variables.
+
+        If history was not saved in the snapshot, history is cleared, so
+            history saved afterwards starts at the snapshot's day.
+
+        Parameters (`self.params`) are not part of the snapshot -- they
+            can be changed after restoring, for example to branch
+            scenarios with different interventions. To branch scenarios
+            with different random transitions, change `self.RNG` after
+            restoring (see `self.modify_random_seed`).
+        """
+
+        self.restore_snapshot(pickle.loads(snapshot))
 
     def reset(self) -> None:
         """
-        Resets `self.history_vals_list` attribute of each `InteractionTerm`,
-            `Compartment`, `EpiMetric`, and `DynamicVal` to an empty list.
+        Clears `self.history_vals_list` attribute of each `InteractionTerm`,
+            `Compartment`, `EpiMetric`, and `DynamicVal`.
             Clears current rates and current values of
             `TransitionVariable` and `TransitionVariableGroup` instances.
         """
 
         # Schedules do not have history since they are deterministic
-        for svar in self.all_state_variables.values():
+        # Interaction terms are included separately because a `MetapopModel`
+        #   creates them after `self.all_state_variables` is created
+        for svar in {**self.all_state_variables, **self.interaction_terms}.values():
             svar.reset()
 
         for tvar in self.transition_variables.values():
@@ -1,5 +1,7 @@
-from .utils import np, sc, Optional, List, sqlite3, functools, os, pd, fields
+from .utils import np, sc, Optional, List, sqlite3, functools, os, pd, fields, \
+    ProcessPoolExecutor, Path, pickle
 from .base_components import SubpopModel, MetapopModel
+from .profiling import PhaseProfiler
 
 
 class ExperimentError(Exception):
@@ -35,13 +37,18 @@ def format_current_val_for_sql(subpop_model: SubpopModel,
     into list of |A| x |R| rows, where each row has 7 elements, for
     consistent row formatting for batch SQL insertion.
 
+    If subpop_model simulates batched replications, current_val is
+    N x |A| x |R| and N x |A| x |R| rows are returned -- the nth
+    slice is recorded as replication `rep` + n.
+
     Params:
         subpop_model (SubpopModel):
             SubpopModel to record.
         state_var_name (str):
             StateVariable name to record.
         rep (int):
-            replication counter to record.
+            replication counter to record (of the first
+            replication, if replications are batched).
 
     Returns:
         data (list):
@@ -53,35 +60,640 @@ def format_current_val_for_sql(subpop_model: SubpopModel,
 
     current_val = subpop_model.all_state_variables[state_var_name].current_val
 
-    A, R = np.shape(current_val)
+    A, R = np.shape(current_val)[-2:]
+
+    # Number of replications held in current_val -- 1 unless
+    #   replications are batched
+    N = int(np.size(current_val) / (A * R))
 
     # numpy's default is row-major / C-style order
     # This means the elements are unpacked ROW BY ROW
-    current_val_reshaped = current_val.reshape(-1, 1)
+    #   (and replication by replication, if batched)
+    current_val_reshaped = np.reshape(current_val, (-1, 1))
 
-    # (AxR, 1) column vector of row indices, indicating the original row in current_val
+    # (NxAxR, 1) column vector of row indices, indicating the original row in current_val
     #   before reshaping
     # Each integer in np.arange(A) repeated R times
-    age_group_indices = np.repeat(np.arange(A), R).reshape(-1, 1)
+    age_group_indices = np.tile(np.repeat(np.arange(A), R), N).reshape(-1, 1)
 
-    # (AxR, 1) column vector of column indices, indicating the original column
+    # (NxAxR, 1) column vector of column indices, indicating the original column
     #   each element belonged to in current_val before reshaping
     # Repeat np.arange(R) A times
-    risk_group_indices = np.tile(np.arange(R), A).reshape(-1, 1)
+    risk_group_indices = np.tile(np.arange(R), A * N).reshape(-1, 1)
+
+    # (NxAxR, 1) column vector of replication IDs
+    rep_indices = np.repeat(rep + np.arange(N), A * R).reshape(-1, 1)
 
     # (subpop_name, state_var_name, age_group, risk_group, rep, timepoint)
     data = np.column_stack(
-        (np.full((A * R, 1), subpop_model.name),
-         np.full((A * R, 1), state_var_name),
+        (np.full((N * A * R, 1), subpop_model.name),
+         np.full((N * A * R, 1), state_var_name),
          age_group_indices,
          risk_group_indices,
-         np.full((A * R, 1), rep),
-         np.full((A * R, 1), subpop_model.current_simulation_day),
+         rep_indices,
+         np.full((N * A * R, 1), subpop_model.current_simulation_day),
          current_val_reshaped)).tolist()
 
     return data
 
 
+def format_current_val_for_bulk_sql(current_val: np.ndarray,
+                                    subpop_id: int,
+                                    state_var_id: int,
+                                    rep: int,
+                                    timepoint: int) -> np.ndarray:
+    """
+    Numeric counterpart of `format_current_val_for_sql` used by
+    `BulkSQLResultsWriter` -- instead of a list of mixed-type rows,
+    returns one float array, with subpopulation and state variable names
+    replaced by their integer IDs in the "subpops" and "state_vars" tables.
+
+    Params:
+        current_val (np.ndarray):
+            |A| x |R| array (or N x |A| x |R| array, if replications
+            are batched) to record.
+        subpop_id (int):
+            integer ID of subpopulation.
+        state_var_id (int):
+            integer ID of state variable.
+        rep (int):
+            replication counter to record (of the first
+            replication, if replications are batched).
+        timepoint (int):
+            simulation day to record.
+
+    Returns:
+        rows (np.ndarray):
+            (N x |A| x |R|) x 7 array -- columns correspond to subpop_id,
+            state_var_id, age_group, risk_group, rep, timepoint, and value,
+            in the same row order as `format_current_val_for_sql`.
+    """
+
+    current_val = np.asarray(current_val, dtype=float)
+
+    A, R = np.shape(current_val)[-2:]
+    N = int(np.size(current_val) / (A * R))
+
+    rows = np.empty((N * A * R, 7))
+    rows[:, 0] = subpop_id
+    rows[:, 1] = state_var_id
+    rows[:, 2] = np.tile(np.repeat(np.arange(A), R), N)
+    rows[:, 3] = np.tile(np.arange(R), A * N)
+    rows[:, 4] = np.repeat(rep + np.arange(N), A * R)
+    rows[:, 5] = timepoint
+    rows[:, 6] = current_val.ravel()
+
+    return rows
+
+
+class BulkSQLResultsWriter:
+    """
+    High-throughput writer of `Experiment` results to the SQL database
+    created by `Experiment.create_results_sql_table`.
+
+    - Rows are numeric (see `format_current_val_for_bulk_sql`), with
+        integer-coded subpopulations and state variables, and are buffered
+        across save points and replications -- they are only inserted (in
+        one `executemany` and one transaction) once `max_buffered_rows`
+        rows are buffered, or when the writer is closed.
+    - The database uses write-ahead logging (WAL) and relaxed
+        synchronization (`synchronous=NORMAL`).
+    - The "results_data" table has no primary key -- its unique index
+        is only created when the writer is closed, after all rows
+        are inserted, which is much faster than maintaining it
+        during insertion.
+
+    Attributes:
+        conn (sqlite3.Connection):
+            connection to SQL database.
+        cursor (sqlite3.Cursor):
+            cursor of `self.conn` -- can also be used to write
+            other tables (for example, inputs realizations).
+        buffered_rows (list[np.ndarray]):
+            arrays of rows not yet inserted.
+        num_buffered_rows (int):
+            total number of rows in `self.buffered_rows`.
+
+    See `__init__` docstring for other attributes.
+    """
+
+    def __init__(self,
+                 database_filename: str,
+                 max_buffered_rows: int = int(1e6)):
+        """
+        Params:
+            database_filename (str):
+                SQL database with tables created by
+                `Experiment.create_results_sql_table`.
+            max_buffered_rows (positive int):
+                number of rows to buffer before inserting them.
+        """
+
+        self.database_filename = database_filename
+        self.max_buffered_rows = max_buffered_rows
+
+        self.conn = sqlite3.connect(database_filename)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.cursor = self.conn.cursor()
+
+        self.buffered_rows = []
+        self.num_buffered_rows = 0
+
+    def add_rows(self,
+                 rows: np.ndarray) -> None:
+        """
+        Buffers rows (see `format_current_val_for_bulk_sql`), and
+        inserts all buffered rows if there are at least
+        `self.max_buffered_rows` of them.
+        """
+
+        self.buffered_rows.append(rows)
+        self.num_buffered_rows += len(rows)
+
+        if self.num_buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Inserts all buffered rows into "results_data" table
+        and commits.
+        """
+
+        if not self.buffered_rows:
+            return
+
+        rows = np.concatenate(self.buffered_rows)
+
+        # sqlite3 needs Python ints and floats -- the first six columns
+        #   (IDs, age group, risk group, rep, timepoint) are integers
+        int_columns = rows[:, :6].astype(np.int64).T.tolist()
+
+        self.cursor.executemany("INSERT INTO results_data VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                zip(*int_columns, rows[:, 6].tolist()))
+        self.conn.commit()
+
+        self.buffered_rows = []
+        self.num_buffered_rows = 0
+
+    def close(self) -> None:
+        """
+        Inserts remaining buffered rows, creates deferred indexes
+        on "results_data" table, and closes the connection.
+        Runs ANALYZE so that SQLite's query planner can choose
+        between indexes for filtered queries.
+        """
+
+        self.flush()
+
+        # Also used by `Experiment.get_state_var_df` for queries
+        #   filtered by state variable (and subpopulation)
+        self.cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS results_data_key ON results_data
+            (state_var_id, subpop_id, age_group, risk_group, rep, timepoint)
+        """)
+
+        # Secondary index for queries filtered by age or risk group
+        #   but not by subpopulation
+        self.cursor.execute("""
+        CREATE INDEX IF NOT EXISTS results_data_age_risk ON results_data
+            (state_var_id, age_group, risk_group)
+        """)
+
+        self.cursor.execute("ANALYZE results_data")
+
+        self.conn.commit()
+        self.conn.close()
+
+
+class NpyResultsWriter:
+    """
+    Writer of `Experiment` results to a dense columnar store -- one
+    memory-mapped ".npy" file per state variable, with axes
+    (rep, timepoint, subpop, age group, risk group), in a directory
+    that also holds "timepoints.npy" (the simulation day of each
+    timepoint index). Has the same `add_rows` and `close` methods as
+    `BulkSQLResultsWriter`, so `Experiment` can use either one.
+
+    Subpopulations are ordered by `Experiment.subpop_ids`. Values of
+    a state variable with fewer age or risk groups in some
+    subpopulation are stored in the first age or risk groups.
+
+    Attributes:
+        arrays (list[np.memmap]):
+            memory-mapped array of each state variable, ordered
+            by `Experiment.state_var_ids`.
+        timepoints (np.ndarray):
+            simulation day of each timepoint index.
+
+    See `__init__` docstring for other attributes.
+    """
+
+    def __init__(self,
+                 results_dirname: str,
+                 state_var_shapes: dict,
+                 num_subpops: int,
+                 num_reps: int,
+                 timepoints: np.ndarray,
+                 resume: bool = False):
+        """
+        Params:
+            results_dirname (str):
+                directory in which to create ".npy" files -- must
+                not exist yet (unless `resume` is True).
+            state_var_shapes (dict):
+                keys are state variable names (in order of their IDs)
+                and values are (|A|, |R|) tuples.
+            num_subpops (positive int):
+                number of subpopulations.
+            num_reps (positive int):
+                number of replications.
+            timepoints (np.ndarray):
+                increasing simulation days on which results are recorded.
+            resume (bool):
+                if True, opens existing ".npy" files (of a checkpointed
+                experiment) instead of creating them.
+        """
+
+        self.results_dirname = results_dirname
+        self.timepoints = np.asarray(timepoints)
+
+        if resume:
+            self.arrays = [np.lib.format.open_memmap(Path(results_dirname) / f"{state_var_name}.npy",
+                                                     mode="r+")
+                           for state_var_name in state_var_shapes]
+            return
+
+        os.makedirs(results_dirname)
+
+        np.save(Path(results_dirname) / "timepoints.npy", self.timepoints)
+
+        # Files are created sparse (without writing zeros) on most filesystems
+        self.arrays = [np.lib.format.open_memmap(Path(results_dirname) / f"{state_var_name}.npy",
+                                                 mode="w+",
+                                                 dtype=float,
+                                                 shape=(num_reps, len(self.timepoints), num_subpops) + shape)
+                       for state_var_name, shape in state_var_shapes.items()]
+
+    def add_rows(self,
+                 rows: np.ndarray) -> None:
+        """
+        Writes rows (see `format_current_val_for_bulk_sql`) into the
+        memory-mapped arrays, with one vectorized assignment per
+        state variable.
+        """
+
+        int_columns = rows[:, :6].astype(np.int64)
+        timepoint_indices = np.searchsorted(self.timepoints, int_columns[:, 5])
+
+        for state_var_id, array in enumerate(self.arrays):
+            is_state_var = int_columns[:, 1] == state_var_id
+            array[int_columns[is_state_var, 4],
+                  timepoint_indices[is_state_var],
+                  int_columns[is_state_var, 0],
+                  int_columns[is_state_var, 2],
+                  int_columns[is_state_var, 3]] = rows[is_state_var, 6]
+
+    def flush(self) -> None:
+        """
+        Flushes memory-mapped arrays to disk.
+        """
+
+        for array in self.arrays:
+            array.flush()
+
+    def close(self) -> None:
+        """
+        Flushes memory-mapped arrays to disk.
+        """
+
+        self.flush()
+
+        self.arrays = []
+
+
+class P2QuantilesEstimator:
+    """
+    Streaming estimates of quantiles with the P-squared algorithm
+    (Jain and Chlamtac, 1985), vectorized over an array of cells --
+    each cell keeps 5 markers per quantile (O(1) memory per cell
+    and quantile), updated one observation at a time, instead of
+    storing all observations.
+
+    Attributes:
+        quantiles (np.ndarray):
+            quantiles (probabilities in (0, 1)) to estimate.
+        num_observations (int):
+            number of observations so far.
+        marker_heights (np.ndarray):
+            5 x |Q| x ... array of marker heights -- the middle
+            marker is the estimate of each quantile.
+        marker_positions (np.ndarray):
+            5 x |Q| x ... array of (1-based) marker positions.
+        desired_positions (np.ndarray):
+            5 x |Q| x ... array of desired marker positions.
+        desired_increments (np.ndarray):
+            5 x |Q| x 1 ... array of desired position increments.
+        first_observations (list[np.ndarray]):
+            observations before the markers are initialized
+            (the first 5 observations).
+
+    See `__init__` docstring for other attributes.
+    """
+
+    def __init__(self,
+                 shape: tuple,
+                 quantiles: tuple):
+        """
+        Params:
+            shape (tuple):
+                shape of each observation.
+            quantiles (tuple[float]):
+                quantiles to estimate.
+        """
+
+        self.shape = tuple(shape)
+        self.quantiles = np.asarray(quantiles, dtype=float)
+
+        self.num_observations = 0
+        self.first_observations = []
+
+        self.marker_heights = None
+        self.marker_positions = None
+        self.desired_positions = None
+
+        # Broadcasts against the |Q| x ... marker arrays
+        p = self.quantiles.reshape((1, -1) + (1,) * len(self.shape))
+        self.desired_increments = np.concatenate((np.zeros_like(p), p / 2, p, (1 + p) / 2, np.ones_like(p)))
+
+    def update(self,
+               observation: np.ndarray) -> None:
+        """
+        Updates estimates with `observation` (array of `self.shape`).
+        """
+
+        observation = np.broadcast_to(np.asarray(observation, dtype=float), self.shape)
+        self.num_observations += 1
+
+        if self.num_observations <= 5:
+            self.first_observations.append(observation.copy())
+
+            if self.num_observations == 5:
+                num_quantiles = len(self.quantiles)
+                sorted_observations = np.sort(np.stack(self.first_observations), axis=0)
+                self.marker_heights = np.repeat(sorted_observations[:, np.newaxis], num_quantiles, axis=1)
+                self.marker_positions = np.broadcast_to(
+                    np.arange(1.0, 6.0).reshape((5, 1) + (1,) * len(self.shape)),
+                    self.marker_heights.shape).copy()
+                self.desired_positions = np.broadcast_to(1 + 4 * self.desired_increments,
+                                                         self.marker_heights.shape).copy()
+                self.first_observations = []
+            return
+
+        q = self.marker_heights
+        n = self.marker_positions
+
+        # Extreme markers track the minimum and maximum
+        q[0] = np.minimum(q[0], observation)
+        q[4] = np.maximum(q[4], observation)
+
+        # Cell k (0 to 3) of the observation: q[k] <= observation < q[k + 1]
+        cell = np.sum(observation >= q[1:4], axis=0)
+
+        # Markers above the observation's cell move up one position
+        n[1:] += np.arange(1, 5).reshape((4, 1) + (1,) * len(self.shape)) > cell
+
+        self.desired_positions += self.desired_increments
+
+        for i in (1, 2, 3):
+            d = self.desired_positions[i] - n[i]
+
+            is_adjusted = ((d >= 1) & (n[i + 1] - n[i] > 1)) | ((d <= -1) & (n[i - 1] - n[i] < -1))
+            d = np.sign(d)
+
+            # Piecewise-parabolic prediction of the new marker height
+            parabolic_height = q[i] + d / (n[i + 1] - n[i - 1]) * \
+                               ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+            # Linear prediction, if the parabolic prediction is out of order
+            neighbor_height = np.where(d > 0, q[i + 1], q[i - 1])
+            neighbor_position = np.where(d > 0, n[i + 1], n[i - 1])
+            linear_height = q[i] + d * (neighbor_height - q[i]) / (neighbor_position - n[i])
+
+            is_parabolic = (q[i - 1] < parabolic_height) & (parabolic_height < q[i + 1])
+            new_height = np.where(is_parabolic, parabolic_height, linear_height)
+
+            q[i] = np.where(is_adjusted, new_height, q[i])
+            n[i] = np.where(is_adjusted, n[i] + d, n[i])
+
+    def get_estimates(self) -> np.ndarray:
+        """
+        Returns |Q| x ... array of quantile estimates -- exact
+        sample quantiles if there are fewer than 5 observations.
+        """
+
+        if self.num_observations == 0:
+            return np.full((len(self.quantiles),) + self.shape, np.nan)
+
+        if self.num_observations < 5:
+            return np.quantile(np.stack(self.first_observations), self.quantiles, axis=0)
+
+        return self.marker_heights[2].copy()
+
+
+class OnlineSummaryWriter:
+    """
+    Writer of `Experiment` results that only keeps running summary
+    statistics over replications -- no per-replication rows are
+    stored. Has the same `add_rows` and `close` methods as
+    `BulkSQLResultsWriter`, so `Experiment` can use it the same way.
+
+    For each state variable, timepoint, and subpopulation (and for the
+    total over all subpopulations), the summarized quantity is the
+    value summed over age and risk groups. Each replication updates:
+
+    - Welford running mean and variance.
+    - P-squared quantile estimates (see `P2QuantilesEstimator`).
+    - Exceedance counts -- the number of replications
+        whose value exceeds each threshold.
+
+    Replications must be added in order, but can be added in batches.
+
+    Attributes:
+        num_reps (int):
+            number of replications added so far.
+        means (dict):
+            keys are state variable names, values are |T| x (|L| + 1)
+            arrays of running means -- the last column is the
+            total over subpopulations.
+        sums_squared_deviations (dict):
+            same as `self.means`, for Welford's running sums
+            of squared deviations from the mean.
+        quantiles_estimators (dict):
+            keys are state variable names, values are
+            `P2QuantilesEstimator` instances.
+        exceedance_counts (dict):
+            keys are state variable names, values are
+            |thresholds| x |T| x (|L| + 1) arrays of counts.
+
+    See `__init__` docstring for other attributes.
+    """
+
+    def __init__(self,
+                 database_filename: str,
+                 state_var_names: list,
+                 subpop_names: list,
+                 timepoints: np.ndarray,
+                 quantiles: tuple = (0.05, 0.5, 0.95),
+                 exceedance_thresholds: dict = None):
+        """
+        Params:
+            database_filename (str):
+                SQL database in which `self.close` saves the
+                summary in "summary" table.
+            state_var_names (list[str]):
+                state variable names, in order of their IDs.
+            subpop_names (list[str]):
+                subpopulation names, in order of their IDs.
+            timepoints (np.ndarray):
+                increasing simulation days on which results are recorded.
+            quantiles (tuple[float]):
+                quantiles to estimate.
+            exceedance_thresholds (Optional[dict]):
+                keys are state variable names, values are lists of
+                thresholds -- state variables not in this dictionary
+                have no exceedance counts.
+        """
+
+        self.database_filename = database_filename
+        self.state_var_names = list(state_var_names)
+        self.subpop_names = list(subpop_names)
+        self.timepoints = np.asarray(timepoints)
+        self.quantiles = tuple(quantiles)
+
+        if exceedance_thresholds is None:
+            exceedance_thresholds = {}
+        self.exceedance_thresholds = {state_var_name: np.asarray(exceedance_thresholds.get(state_var_name, []),
+                                                                 dtype=float)
+                                      for state_var_name in self.state_var_names}
+
+        shape = (len(self.timepoints), len(self.subpop_names) + 1)
+
+        self.num_reps = 0
+        self.means = {name: np.zeros(shape) for name in self.state_var_names}
+        self.sums_squared_deviations = {name: np.zeros(shape) for name in self.state_var_names}
+        self.quantiles_estimators = {name: P2QuantilesEstimator(shape, self.quantiles)
+                                     for name in self.state_var_names}
+        self.exceedance_counts = {name: np.zeros((len(self.exceedance_thresholds[name]),) + shape, dtype=int)
+                                  for name in self.state_var_names}
+
+    def add_rows(self,
+                 rows: np.ndarray) -> None:
+        """
+        Updates summary statistics with rows (see
+        `format_current_val_for_bulk_sql`) of one or more
+        replications, one replication at a time.
+        """
+
+        int_columns = rows[:, :6].astype(np.int64)
+
+        reps = np.unique(int_columns[:, 4])
+        num_timepoints = len(self.timepoints)
+        num_subpops = len(self.subpop_names)
+
+        # Totals over age and risk groups: element (state var, rep, timepoint, subpop)
+        totals = np.zeros((len(self.state_var_names), len(reps), num_timepoints, num_subpops))
+        np.add.at(totals,
+                  (int_columns[:, 1],
+                   np.searchsorted(reps, int_columns[:, 4]),
+                   np.searchsorted(self.timepoints, int_columns[:, 5]),
+                   int_columns[:, 0]),
+                  rows[:, 6])
+
+        # Last column is the total over subpopulations
+        totals = np.concatenate((totals, np.sum(totals, axis=-1, keepdims=True)), axis=-1)
+
+        for rep_index in range(len(reps)):
+            self.num_reps += 1
+
+            for state_var_id, state_var_name in enumerate(self.state_var_names):
+                vals = totals[state_var_id, rep_index]
+
+                # Welford's algorithm
+                mean = self.means[state_var_name]
+                delta = vals - mean
+                mean += delta / self.num_reps
+                self.sums_squared_deviations[state_var_name] += delta * (vals - mean)
+
+                self.quantiles_estimators[state_var_name].update(vals)
+
+                thresholds = self.exceedance_thresholds[state_var_name]
+                self.exceedance_counts[state_var_name] += \
+                    vals > thresholds.reshape((-1,) + (1,) * vals.ndim)
+
+    def get_summary_df(self) -> pd.DataFrame:
+        """
+        Returns DataFrame with one row per state variable, subpopulation
+        (or "all", for the total over subpopulations), and timepoint, and
+        columns "num_reps", "mean", "variance" (sample variance), one
+        "quantile_{q}" column per quantile, and one "exceedance_prob_{threshold}"
+        column per threshold (the proportion of replications whose value
+        exceeds the threshold) -- exceedance columns are NaN for state
+        variables without that threshold.
+        """
+
+        subpop_names = self.subpop_names + ["all"]
+
+        dfs = []
+
+        for state_var_name in self.state_var_names:
+            timepoint_indices, subpop_ids = \
+                np.indices((len(self.timepoints), len(subpop_names))).reshape(2, -1)
+
+            columns = {"subpop_name": np.asarray(subpop_names)[subpop_ids],
+                       "state_var_name": state_var_name,
+                       "timepoint": self.timepoints[timepoint_indices],
+                       "num_reps": self.num_reps,
+                       "mean": self.means[state_var_name].ravel()}
+
+            if self.num_reps > 1:
+                columns["variance"] = self.sums_squared_deviations[state_var_name].ravel() / (self.num_reps - 1)
+            else:
+                columns["variance"] = np.nan
+
+            quantile_estimates = self.quantiles_estimators[state_var_name].get_estimates()
+            for quantile, estimates in zip(self.quantiles, quantile_estimates):
+                columns[f"quantile_{quantile:g}"] = estimates.ravel()
+
+            for threshold, counts in zip(self.exceedance_thresholds[state_var_name],
+                                         self.exceedance_counts[state_var_name]):
+                columns[f"exceedance_prob_{threshold:g}"] = counts.ravel() / max(self.num_reps, 1)
+
+            dfs.append(pd.DataFrame(columns))
+
+        return pd.concat(dfs, ignore_index=True)
+
+    def flush(self) -> None:
+        """
+        Does nothing -- summary statistics are only saved by
+        `self.close` (or checkpointed with the `Experiment`).
+        """
+
+        pass
+
+    def close(self) -> None:
+        """
+        Saves summary (see `self.get_summary_df`) to "summary"
+        table in SQL database.
+        """
+
+        conn = sqlite3.connect(self.database_filename)
+        self.get_summary_df().to_sql("summary", conn, index=False, if_exists="replace")
+        conn.commit()
+        conn.close()
+
+
 def get_sql_table_as_df(conn: sqlite3.Connection,
                         sql_query: str,
                         sql_query_params: tuple[str] = None,
@@ -116,7 +728,13 @@ def get_sql_table_as_df(conn: sqlite3.Connection,
                                        chunksize=chunk_size,
                                        params=sql_query_params):
             chunks.append(chunk)
+
+        # Concatenate once, after all chunks are read -- if the query
+        #   returns no rows, read it without chunks to keep its columns
+        if chunks:
             df = pd.concat(chunks, ignore_index=True)
+        else:
+            df = pd.read_sql_query(sql_query, conn, params=sql_query_params)
 
     # Handle exception gracefully -- print a warning and
     #   return an empty DataFrame if table given by sql_query
@@ -126,10 +744,81 @@ def get_sql_table_as_df(conn: sqlite3.Connection,
             print(f"Warning: table does not exist for query: {sql_query}. "
                   f"Returning empty DataFrame.")
             df = pd.DataFrame()
+        else:
+            raise
 
     return df
 
 
+# Copy of the `Experiment` held by each worker process when
+#   replications are distributed across processes -- see
+#   `Experiment.simulate_reps_and_save_results`
+worker_experiment = None
+
+
+def init_experiment_worker(experiment) -> None:
+    """
+    Initializer for worker processes -- stores the worker's
+    copy of `experiment` so that it is only sent to each
+    worker once, rather than once per replication.
+
+    Params:
+        experiment (Experiment):
+            `Experiment` whose replications are simulated
+            by the worker.
+    """
+
+    global worker_experiment
+    worker_experiment = experiment
+
+
+def simulate_rep_batch_in_worker(first_rep: int,
+                                 num_batched_reps: Optional[int],
+                                 seed_seqs: list,
+                                 end_day: int,
+                                 days_per_save: int,
+                                 inputs_are_static: bool) -> np.ndarray:
+    """
+    Simulates one replication (or batch of replications) in a worker
+    process. Each `SubpopModel`'s `RNG` is replaced by a new generator
+    (with the same type of bit generator) seeded by the corresponding
+    element of `seed_seqs`, so that results only depend on the
+    replication and not on which worker simulates it.
+
+    Params:
+        first_rep (int):
+            replication ID (of the first replication, if batched).
+        num_batched_reps (Optional[positive int]):
+            number of replications simulated at once, or `None`.
+        seed_seqs (list[np.random.SeedSequence]):
+            one seed sequence for each `SubpopModel`, in the
+            same order as `experiment_subpop_models`.
+        end_day (int):
+            stop simulation at end_day (exclusive).
+        days_per_save (int):
+            indicates how often to save simulation results.
+        inputs_are_static (bool):
+            indicates if inputs are same across replications.
+
+    Returns:
+        rows (np.ndarray):
+            array of rows for the "results_data" table -- see
+            `format_current_val_for_bulk_sql`.
+    """
+
+    experiment = worker_experiment
+
+    for subpop_model, seed_seq in zip(experiment.experiment_subpop_models, seed_seqs):
+        bit_generator_type = type(subpop_model.RNG.bit_generator)
+        subpop_model.RNG = np.random.Generator(bit_generator_type(seed_seq))
+
+    return experiment.simulate_rep_batch(first_rep,
+                                         num_batched_reps,
+                                         end_day,
+                                         days_per_save,
+                                         inputs_are_static)
+
+
 class Experiment:
     """
     Class to manage running multiple simulation replications
@@ -168,7 +857,9 @@ class Experiment:
             element corresponds to the ith random sample for that input.
         results_df (pd.DataFrame):
             DataFrame holding simulation results from each
-            `simulation` replication
+            `simulation` replication -- `None` if `self.storage_backend`
+            is "npy", to avoid loading all results into memory
+            (see `self.get_state_var_array`).
         has_been_run (bool):
             indicates if `self.run_static_inputs`, `self.run_random_inputs`,
             or `self.run_sequences_of_inputs` has been executed.
@@ -179,7 +870,12 @@ class Experiment:
     def __init__(self,
                  model: SubpopModel | MetapopModel,
                  state_variables_to_record: list,
-                 database_filename: str):
+                 database_filename: str,
+                 storage_backend: str = "sqlite",
+                 summary_quantiles: tuple = (0.05, 0.5, 0.95),
+                 exceedance_thresholds: dict = None,
+                 checkpoint_every_reps: Optional[int] = None,
+                 profiler: Optional[PhaseProfiler] = None):
 
         """
         Params:
@@ -194,11 +890,56 @@ class Experiment:
             database_filename (str):
                 must be valid filename with suffix ".db" --
                 experiment results are saved to this SQL database
+            storage_backend (str):
+                either "sqlite" (default) or "npy". If "sqlite", results
+                are saved in the "results" table of the SQL database.
+                If "npy", results are saved in dense memory-mapped ".npy"
+                arrays (see `NpyResultsWriter`) in directory
+                `self.results_dirname` (`database_filename` without
+                its suffix, plus "_results") -- the SQL database
+                still holds inputs realizations and subpopulation
+                and state variable IDs. If "summary", no per-replication
+                results are saved -- only running summary statistics
+                over replications (see `OnlineSummaryWriter`), saved in
+                the "summary" table of the SQL database (see
+                `self.get_state_var_summary_df`).
+            summary_quantiles (tuple[float]):
+                quantiles estimated if `storage_backend` is "summary".
+            exceedance_thresholds (Optional[dict]):
+                if `storage_backend` is "summary", keys are state
+                variable names and values are lists of thresholds --
+                the proportion of replications that exceed each
+                threshold is reported in the summary.
+            checkpoint_every_reps (Optional[positive int]):
+                if specified, completed replications, inputs realizations,
+                and RNG states are checkpointed in the SQL database after
+                (about) every `checkpoint_every_reps` replications,
+                so that a stopped experiment can be resumed with
+                `self.resume`. If `None` (default), there are no checkpoints.
+            profiler (Optional[PhaseProfiler]):
+                if specified, phases of the model's simulation are profiled
+                (see `SubpopModel.set_profiler`), as well as
+                `self.simulate_rep_batch`, `self.get_current_vals_rows`,
+                and logging of inputs and results ("log_inputs_to_sql" and
+                "log_results" phases), under "experiment". The model is only
+                instrumented while replications are simulated -- it is
+                uninstrumented (with `set_profiler(None)`) when the run
+                finishes or stops. Not supported with worker processes
+                (`num_workers`).
         """
 
+        if storage_backend not in ("sqlite", "npy", "summary"):
+            raise ExperimentError("\"storage_backend\" must be \"sqlite\", \"npy\", or \"summary\".")
+
         self.model = model
         self.state_variables_to_record = state_variables_to_record
         self.database_filename = database_filename
+        self.storage_backend = storage_backend
+        self.summary_quantiles = summary_quantiles
+        self.exceedance_thresholds = exceedance_thresholds
+        self.checkpoint_every_reps = checkpoint_every_reps
+        self.profiler = profiler
+        self.results_dirname = str(Path(database_filename).with_suffix("")) + "_results"
 
         self.has_been_run = False
 
@@ -216,6 +957,17 @@ class Experiment:
                                   "or MetapopModel class.")
         self.experiment_subpop_models = experiment_subpop_models
 
+        if profiler is not None:
+            profiler.instrument(self, ["simulate_rep_batch", "log_inputs_to_sql"], ("experiment",))
+            profiler.instrument(self, ["get_current_vals_rows"])
+
+        # Integer IDs of subpopulations and state variables to record,
+        #   used in the "results_data" table -- see `self.create_results_sql_table`
+        self.subpop_ids = {subpop_model.name: subpop_id
+                           for subpop_id, subpop_model in enumerate(experiment_subpop_models)}
+        self.state_var_ids = {state_var_name: state_var_id
+                              for state_var_id, state_var_name in enumerate(state_variables_to_record)}
+
         # Initialize results_df attribute -- this will store
         #   results of experiment run
         self.results_df = None
@@ -224,6 +976,10 @@ class Experiment:
         #   sampled inputs' realizations are stored in this dictionary
         self.inputs_realizations = {}
 
+        # Set of (subpop_name, input_name) tuples of inputs that are scalar
+        #   parameters -- see `self.apply_inputs_to_model`
+        self.scalar_inputs = set()
+
         for subpop_model in self.experiment_subpop_models:
             self.inputs_realizations[subpop_model.name] = {}
 
@@ -241,7 +997,9 @@ class Experiment:
                           num_reps: int,
                           simulation_end_day: int,
                           days_between_save_history: int = 1,
-                          results_filename: str = None):
+                          results_filename: str = None,
+                          reps_per_batch: int = 1,
+                          num_workers: Optional[int] = None):
         """
         Runs the associated `SubpopModel` or `MetapopModel` for a
         given number of independent replications until `simulation_end_day`.
@@ -261,6 +1019,15 @@ class Experiment:
             results_filename (str):
                 if specified, must be valid filename with suffix ".csv" --
                 experiment results are saved to this CSV file.
+            reps_per_batch (positive int):
+                number of replications to simulate at once -- see
+                `SubpopModel.set_num_batched_reps`. If 1 (default),
+                replications are simulated one after another.
+            num_workers (Optional[positive int]):
+                if specified, replications are distributed across
+                this many worker processes -- see
+                `self.simulate_reps_and_save_results`. If `None`
+                (default), replications run in this process.
         """
 
         if self.has_been_run:
@@ -277,7 +1044,9 @@ class Experiment:
                                                 end_day=simulation_end_day,
                                                 days_per_save=days_between_save_history,
                                                 inputs_are_static=True,
-                                                filename=results_filename)
+                                                filename=results_filename,
+                                                reps_per_batch=reps_per_batch,
+                                                num_workers=num_workers)
 
     def run_random_inputs(self,
                           num_reps: int,
@@ -286,7 +1055,9 @@ class Experiment:
                           random_inputs_spec: dict,
                           days_between_save_history: int = 1,
                           results_filename: str = None,
-                          inputs_filename_suffix: str = None):
+                          inputs_filename_suffix: str = None,
+                          reps_per_batch: int = 1,
+                          num_workers: Optional[int] = None):
         """
         Runs the associated `SubpopModel` or `MetapopModel` for a
         given number of independent replications until `simulation_end_day`,
@@ -332,6 +1103,15 @@ class Experiment:
                 filename "{name}_{inputs_filename}" where name is the name
                 of the `SubpopModel` -- saves the values of each parameter that
                 varies between replications
+            reps_per_batch (positive int):
+                number of replications to simulate at once -- see
+                `SubpopModel.set_num_batched_reps`. If 1 (default),
+                replications are simulated one after another.
+            num_workers (Optional[positive int]):
+                if specified, replications are distributed across
+                this many worker processes -- see
+                `self.simulate_reps_and_save_results`. If `None`
+                (default), replications run in this process.
         """
 
         if self.has_been_run:
@@ -353,7 +1133,9 @@ class Experiment:
                                                 end_day=simulation_end_day,
                                                 days_per_save=days_between_save_history,
                                                 inputs_are_static=False,
-                                                filename=results_filename)
+                                                filename=results_filename,
+                                                reps_per_batch=reps_per_batch,
+                                                num_workers=num_workers)
 
             if inputs_filename_suffix:
                 self.write_inputs_csvs(inputs_filename_suffix)
@@ -364,7 +1146,9 @@ class Experiment:
                                 sequences_of_inputs: dict,
                                 days_between_save_history: int = 1,
                                 results_filename: str = None,
-                                inputs_filename_suffix: str = None):
+                                inputs_filename_suffix: str = None,
+                                reps_per_batch: int = 1,
+                                num_workers: Optional[int] = None):
         """
         Runs the associated `SubpopModel` or `MetapopModel` for a
         given number of independent replications until `simulation_end_day`,
@@ -400,6 +1184,15 @@ class Experiment:
                 filename "{name}_{inputs_filename}" where name is the name
                 of the `SubpopModel` -- saves the values of each parameter that
                 varies between replications
+            reps_per_batch (positive int):
+                number of replications to simulate at once -- see
+                `SubpopModel.set_num_batched_reps`. If 1 (default),
+                replications are simulated one after another.
+            num_workers (Optional[positive int]):
+                if specified, replications are distributed across
+                this many worker processes -- see
+                `self.simulate_reps_and_save_results`. If `None`
+                (default), replications run in this process.
         """
 
         if self.has_been_run:
@@ -419,7 +1212,9 @@ class Experiment:
                                                 end_day=simulation_end_day,
                                                 days_per_save=days_between_save_history,
                                                 inputs_are_static=False,
-                                                filename=results_filename)
+                                                filename=results_filename,
+                                                reps_per_batch=reps_per_batch,
+                                                num_workers=num_workers)
 
             if inputs_filename_suffix:
                 self.write_inputs_csvs(inputs_filename_suffix)
@@ -551,39 +1346,47 @@ class Experiment:
             raise ExperimentError("\"state_var_name\" is not in \"self.state_variables_to_record\" --"
                                   "function call is invalid.")
 
-        conn = sqlite3.connect(self.database_filename)
+        if self.storage_backend == "summary":
+            raise ExperimentError("Per-replication results are not saved for \"summary\" "
+                                  "storage backend -- use \"get_state_var_summary_df\".")
 
-        # Query all results table entries where state_var_name matches
-        # This will return results across all subpopulations, age groups,
-        #   and risk groups
-        df = get_sql_table_as_df(conn,
-                                 "SELECT * FROM results WHERE state_var_name = ?",
-                                 chunk_size=int(1e4),
-                                 sql_query_params=(state_var_name,))
+        if self.storage_backend == "npy":
+            df_final = self.get_npy_state_var_df(state_var_name,
+                                                 subpop_name,
+                                                 age_group,
+                                                 risk_group)
 
-        conn.close()
+            if results_filename:
+                df_final.to_csv(results_filename)
 
-        # Define filter conditions
+            return df_final
+
+        # Define filter conditions -- subpopulations and state variables
+        #   are stored as integer IDs (see `self.create_results_sql_table`)
+        #   and a subpopulation that is not in the experiment matches no rows
         filters = {
-            "subpop_name": subpop_name,
+            "state_var_id": self.state_var_ids[state_var_name],
+            "subpop_id": None if subpop_name is None else self.subpop_ids.get(subpop_name, -1),
             "age_group": age_group,
             "risk_group": risk_group
         }
 
-        # Filter DataFrame based on user-specified conditions
-        #   (for example, if user specifies subpop_name, return subset of
-        #   DataFrame where subpop_name matches)
-        conditions = [(df[col] == value) for col, value in filters.items() if value is not None]
-        df_filtered = df if not conditions else df[np.logical_and.reduce(conditions)]
+        # Filters and the sum over unique combinations of "rep" and "timepoint"
+        #   are done in SQL, using the indexes created by
+        #   `BulkSQLResultsWriter.close`, so only the aggregated rows are read
+        where_clause = " AND ".join(f"{col} = ?" for col, value in filters.items() if value is not None)
+        sql_query_params = tuple(int(value) for value in filters.values() if value is not None)
+
+        conn = sqlite3.connect(self.database_filename)
 
-        # Group DataFrame based on unique combinations of "rep" and "timepoint" columns
-        # Then sum (numeric values only), return the "value" column, and reset the index
-        #   so that "rep" and "timepoint" become regular columns and are not the index
-        df_aggregated = \
-            df_filtered.groupby(["rep",
-                                 "timepoint"]).sum(numeric_only=True)["value"].reset_index()
+        df_aggregated = get_sql_table_as_df(conn,
+                                            "SELECT rep, timepoint, SUM(value) AS value "
+                                            f"FROM results_data WHERE {where_clause} "
+                                            "GROUP BY rep, timepoint",
+                                            chunk_size=int(1e4),
+                                            sql_query_params=sql_query_params)
 
-        # breakpoint()
+        conn.close()
 
         # Use pivot() function to reshape the DataFrame for its final form
         # The "timepoint" values are spread across new columns
@@ -598,13 +1401,176 @@ class Experiment:
 
         return df_final
 
+    def get_state_var_summary_df(self,
+                                 state_var_name: str,
+                                 subpop_name: str = "all") -> pd.DataFrame:
+        """
+        Returns summary statistics over replications of `StateVariable`
+        given by `state_var_name` (summed over age and risk groups), in the
+        `SubpopModel` given by `subpop_name` (or summed over all
+        `SubpopModel` instances, if "all") -- only for "summary"
+        storage backend. See `OnlineSummaryWriter`.
+
+        Returns:
+            DataFrame whose index is the simulation day (timepoint) of
+            recording, with columns "num_reps", "mean", "variance", one
+            "quantile_{q}" column per quantile, and one
+            "exceedance_prob_{threshold}" column per threshold.
+        """
+
+        if self.storage_backend != "summary":
+            raise ExperimentError("Summary statistics are only saved for \"summary\" storage backend.")
+
+        conn = sqlite3.connect(self.database_filename)
+
+        df = get_sql_table_as_df(conn,
+                                 "SELECT * FROM summary WHERE state_var_name = ? AND subpop_name = ?",
+                                 sql_query_params=(state_var_name, subpop_name))
+
+        conn.close()
+
+        df = df.drop(columns=["subpop_name", "state_var_name"]).set_index("timepoint")
+
+        # Exceedance thresholds of other state variables
+        return df.dropna(axis=1, how="all")
+
+    def get_state_var_array(self,
+                            state_var_name: str) -> np.ndarray:
+        """
+        Returns read-only memory-mapped array of recorded values of
+        `StateVariable` given by `state_var_name` -- only for
+        "npy" storage backend.
+
+        Returns:
+            np.memmap:
+                array with axes (rep, timepoint, subpop, age group,
+                risk group) -- subpopulations are ordered by
+                `self.subpop_ids`, and timepoints are given by
+                `self.get_timepoints()`.
+        """
+
+        if self.storage_backend != "npy":
+            raise ExperimentError("Results arrays are only saved for \"npy\" storage backend.")
+
+        return np.load(Path(self.results_dirname) / f"{state_var_name}.npy", mmap_mode="r")
+
+    def get_timepoints(self) -> np.ndarray:
+        """
+        Returns simulation days on which results are recorded --
+        only for "npy" storage backend.
+        """
+
+        if self.storage_backend != "npy":
+            raise ExperimentError("Results arrays are only saved for \"npy\" storage backend.")
+
+        return np.load(Path(self.results_dirname) / "timepoints.npy")
+
+    def get_npy_state_var_df(self,
+                             state_var_name: str,
+                             subpop_name: str = None,
+                             age_group: int = None,
+                             risk_group: int = None) -> pd.DataFrame:
+        """
+        "npy" storage backend version of `self.get_state_var_df` -- slices
+        the memory-mapped array of the state variable (without copying
+        when subpopulation, age group, and risk group are all specified)
+        and sums over the remaining subpopulation, age, and risk axes.
+        See `self.get_state_var_df` for arguments and return value.
+        """
+
+        array = self.get_state_var_array(state_var_name)
+
+        num_subpops, num_age_groups, num_risk_groups = np.shape(array)[2:]
+
+        index = [slice(None), slice(None)]
+
+        for value, num_vals in ((None if subpop_name is None else self.subpop_ids.get(subpop_name, -1),
+                                 num_subpops),
+                                (age_group, num_age_groups),
+                                (risk_group, num_risk_groups)):
+            if value is None:
+                index.append(slice(None))
+            elif 0 <= value < num_vals:
+                # Keep the axis, so that sums below are over the same axes
+                index.append(slice(value, value + 1))
+            else:
+                # Same as filtering the "results" table to no rows
+                return pd.DataFrame()
+
+        vals = np.sum(array[tuple(index)], axis=(2, 3, 4))
+
+        df_final = pd.DataFrame(vals,
+                                index=pd.Index(np.arange(len(vals)), name="rep"),
+                                columns=pd.Index(self.get_timepoints(), name="timepoint"))
+
+        return df_final
+
+    def get_npy_results_df(self) -> pd.DataFrame:
+        """
+        Returns DataFrame of all results saved with "npy" storage backend,
+        with the same columns as the "results" table.
+        """
+
+        subpop_names = sorted(self.subpop_ids, key=self.subpop_ids.get)
+        timepoints = self.get_timepoints()
+
+        dfs = []
+
+        for state_var_name in self.state_variables_to_record:
+            array = self.get_state_var_array(state_var_name)
+
+            reps, timepoint_indices, subpop_ids, age_groups, risk_groups = \
+                np.indices(np.shape(array)).reshape(5, -1)
+
+            dfs.append(pd.DataFrame({"subpop_name": np.asarray(subpop_names)[subpop_ids],
+                                     "state_var_name": state_var_name,
+                                     "age_group": age_groups,
+                                     "risk_group": risk_groups,
+                                     "rep": reps,
+                                     "timepoint": timepoints[timepoint_indices],
+                                     "value": np.asarray(array).ravel()}))
+
+        return pd.concat(dfs, ignore_index=True)
+
+    def get_current_vals_rows(self,
+                              rep_counter: int) -> np.ndarray:
+        """
+        For each subpopulation and state variable to record
+        associated with this `Experiment`, format current values
+        as rows of the "results_data" table -- see
+        `format_current_val_for_bulk_sql`.
+
+        Params:
+            rep_counter (int):
+                Current replication ID.
+
+        Returns:
+            rows (np.ndarray):
+                array of rows, where each row has 7 elements.
+        """
+
+        rows = []
+
+        for subpop_model in self.experiment_subpop_models:
+            for state_var_name in self.state_variables_to_record:
+                rows.append(format_current_val_for_bulk_sql(
+                    subpop_model.all_state_variables[state_var_name].current_val,
+                    self.subpop_ids[subpop_model.name],
+                    self.state_var_ids[state_var_name],
+                    rep_counter,
+                    subpop_model.current_simulation_day))
+
+        return np.concatenate(rows)
+
     def log_current_vals_to_sql(self,
                                 rep_counter: int,
                                 experiment_cursor: sqlite3.Cursor) -> None:
         """
         For each subpopulation and state variable to record
         associated with this `Experiment`, save current values to
-        "results" table in SQL database specified by `experiment_cursor`.
+        "results_data" table in SQL database specified by `experiment_cursor`.
+        (`self.simulate_reps_and_save_results` buffers rows with
+        `BulkSQLResultsWriter` instead.)
 
         Params:
             rep_counter (int):
@@ -614,13 +1580,11 @@ class Experiment:
                 where results should be inserted.
         """
 
-        for subpop_model in self.experiment_subpop_models:
-            for state_var_name in self.state_variables_to_record:
-                data = format_current_val_for_sql(subpop_model,
-                                                  state_var_name,
-                                                  rep_counter)
-                experiment_cursor.executemany(
-                    "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)", data)
+        rows = self.get_current_vals_rows(rep_counter)
+
+        experiment_cursor.executemany(
+            "INSERT INTO results_data VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip(*rows[:, :6].astype(np.int64).T.tolist(), rows[:, 6].tolist()))
 
     def log_inputs_to_sql(self,
                           experiment_cursor: sqlite3.Cursor):
@@ -666,7 +1630,8 @@ class Experiment:
             experiment_cursor.executemany(sql_statement, inputs_vals_over_reps_list)
 
     def apply_inputs_to_model(self,
-                              rep_counter: int):
+                              rep_counter: int,
+                              num_batched_reps: Optional[int] = None):
         """
         Changes inputs (parameters or initial values) for a given
         replication according to `self.inputs_realizations` attribute.
@@ -679,10 +1644,20 @@ class Experiment:
         (e.g., varies across age or risk groups), it is assigned a numpy array of
         the appropriate shape with the replicated input value.
 
+        If `num_batched_reps` is specified, inputs for replications `rep_counter`,
+        ..., `rep_counter` + `num_batched_reps` - 1 are applied at once along a
+        leading replications axis: state variables and multidimensional
+        parameters become `num_batched_reps` x |A| x |R| arrays, and scalar
+        parameters become `num_batched_reps` x 1 x 1 arrays.
+
         Params:
             rep_counter (int):
                 Replication ID, used to retrieve the correct
-                realizations of inputs for the current run.
+                realizations of inputs for the current run
+                (ID of the first replication, if batched).
+            num_batched_reps (Optional[positive int]):
+                number of replications simulated at once, or `None`
+                if replications are simulated one after another.
         """
 
         for subpop_model in self.experiment_subpop_models:
@@ -693,25 +1668,129 @@ class Experiment:
 
                 dimensions = (params.num_age_groups, params.num_risk_groups)
 
+                # Scalar parameters are recorded the first time they are seen,
+                #   because batched replications turn them into arrays
+                if input_name not in subpop_model.all_state_variables.keys() and \
+                        np.isscalar(getattr(params, input_name)):
+                    self.scalar_inputs.add((subpop_model.name, input_name))
+
+                is_scalar = (subpop_model.name, input_name) in self.scalar_inputs
+
+                if num_batched_reps is None:
+                    val = input_val[rep_counter]
+                    batched_val = None
+                else:
+                    val = np.asarray(input_val[rep_counter:rep_counter + num_batched_reps])
+                    batched_val = val.reshape(-1, 1, 1)
+
                 if input_name in subpop_model.all_state_variables.keys():
-                    subpop_model.all_state_variables[input_name].current_val = np.full(dimensions,
-                                                                                       input_val[rep_counter])
+                    if batched_val is None:
+                        subpop_model.all_state_variables[input_name].current_val = \
+                            np.full(dimensions, val)
+                    else:
+                        subpop_model.all_state_variables[input_name].current_val = \
+                            batched_val * np.ones(dimensions)
                 else:
-                    if np.isscalar(getattr(subpop_model.params, input_name)):
-                        setattr(subpop_model.params, input_name, input_val[rep_counter])
+                    if batched_val is None:
+                        if is_scalar:
+                            setattr(params, input_name, val)
+                        else:
+                            setattr(params, input_name, np.full(dimensions, val))
                     else:
-                        setattr(subpop_model.params, input_name, np.full(dimensions, input_val[rep_counter]))
+                        if is_scalar:
+                            setattr(params, input_name, batched_val)
+                        else:
+                            setattr(params, input_name, batched_val * np.ones(dimensions))
+
+            # Keep SubpopState consistent with any state variables changed above
+            subpop_model.state.sync_to_current_vals(subpop_model.all_state_variables)
+
+    def simulate_rep_batch(self,
+                           first_rep: int,
+                           num_batched_reps: Optional[int],
+                           end_day: int,
+                           days_per_save: int,
+                           inputs_are_static: bool) -> np.ndarray:
+        """
+        Resets the model, applies inputs (if they change across
+        replications), and simulates one replication (or one batch of
+        `num_batched_reps` replications) until `end_day`, recording
+        results every `days_per_save` days.
+
+        Params:
+            first_rep (int):
+                replication ID (of the first replication, if batched).
+            num_batched_reps (Optional[positive int]):
+                number of replications simulated at once, or `None`
+                to simulate a single replication without a leading
+                replications axis.
+            end_day (int):
+                stop simulation at end_day (i.e. exclusive,
+                simulate up to but not including end_day).
+            days_per_save (int):
+                indicates how often to save simulation results.
+            inputs_are_static (bool):
+                indicates if inputs are same across replications.
+
+        Returns:
+            rows (np.ndarray):
+                array of rows for the "results_data" table -- see
+                `format_current_val_for_bulk_sql`.
+        """
+
+        model = self.model
+
+        # Reset model and clear its history
+        if num_batched_reps is None:
+            model.reset_simulation()
+        else:
+            model.set_num_batched_reps(num_batched_reps)
+
+        # Apply new values of inputs, if some
+        #   inputs change between replications
+        if not inputs_are_static:
+            self.apply_inputs_to_model(first_rep, num_batched_reps)
+
+        rows = []
+
+        # Simulate model and save results every `days_per_save` days
+        while model.current_simulation_day < end_day:
+            model.simulate_until_day(min(model.current_simulation_day + days_per_save,
+                                         end_day))
+
+            rows.append(self.get_current_vals_rows(first_rep))
+
+        return np.concatenate(rows)
 
     def simulate_reps_and_save_results(self,
                                        reps: int,
                                        end_day: int,
                                        days_per_save: int,
                                        inputs_are_static: bool,
-                                       filename: str = None):
+                                       filename: str = None,
+                                       reps_per_batch: int = 1,
+                                       num_workers: Optional[int] = None,
+                                       checkpoint: Optional[dict] = None):
         """
         Helper function that executes main loop over
         replications in `Experiment` and saves results.
 
+        If `self.checkpoint_every_reps` is specified, run settings and
+        inputs realizations are checkpointed at the start, and
+        progress is checkpointed after about every
+        `self.checkpoint_every_reps` replications -- see `self.resume`.
+
+        If `num_workers` is specified, replications (or batches of
+        replications) are distributed across a pool of `num_workers`
+        worker processes, each holding its own copy of the model.
+        Each replication (or batch) gets its own RNG stream for each
+        `SubpopModel`, derived from the `SubpopModel`'s `RNG` and the
+        (first) replication ID using `np.random.SeedSequence`, and
+        results are inserted into the database in replication order.
+        Results are therefore reproducible for a fixed seed regardless
+        of `num_workers`. Note that these per-replication streams differ
+        from the single stream used when `num_workers` is `None`.
+
         Params:
             reps (int):
                 number of independent simulation replications
@@ -726,8 +1805,29 @@ class Experiment:
             filename (str):
                 if specified, must be valid filename with suffix ".csv" --
                 experiment results are saved to this CSV file.
+            reps_per_batch (positive int):
+                number of replications to simulate at once. If greater
+                than 1, the model is switched to batched mode for the
+                experiment and switched back (and reset, with the last
+                replication's inputs applied) afterwards.
+            num_workers (Optional[positive int]):
+                number of worker processes, or `None` to run all
+                replications in this process. If specified, the model
+                is reset afterwards, with the last replication's inputs
+                applied.
+            checkpoint (Optional[dict]):
+                if specified, replications completed before
+                the checkpoint are skipped -- see `self.resume`.
         """
 
+        if num_workers is not None and (not isinstance(num_workers, int) or num_workers < 1):
+            raise ExperimentError("\"num_workers\" must be a positive integer or None.")
+
+        if num_workers is not None and self.profiler is not None:
+            raise ExperimentError("Profiling is not supported with \"num_workers\" -- "
+                                  "set \"num_workers\" to None or create the Experiment "
+                                  "without a profiler.")
+
         # Override each subpop config's save_daily_history attribute --
         #   set it to False -- because we will manually save history
         #   to results database according to user-defined
@@ -737,44 +1837,304 @@ class Experiment:
 
         model = self.model
 
-        # Connect to SQL database
-        conn = sqlite3.connect(self.database_filename)
-        cursor = conn.cursor()
-
-        # Loop through replications
-        for rep in range(reps):
+        subpop_models = self.experiment_subpop_models
 
-            # Reset model and clear its history
-            model.reset_simulation()
+        if checkpoint is None:
+            first_rep_to_simulate = 0
 
-            # Apply new values of inputs, if some
-            #   inputs change between replications
             if not inputs_are_static:
-                self.apply_inputs_to_model(rep)
-                self.log_inputs_to_sql(cursor)
+                conn = sqlite3.connect(self.database_filename)
+                self.log_inputs_to_sql(conn.cursor())
+                conn.commit()
+                conn.close()
+        else:
+            first_rep_to_simulate = checkpoint["num_completed_reps"]
+
+        # Simulation days on which results are recorded --
+        #   see `self.simulate_rep_batch`
+        timepoints = list(range(days_per_save, end_day, days_per_save)) + [end_day]
+
+        # Rows are buffered across save points and replications,
+        #   and inserted in bulk -- see `BulkSQLResultsWriter` --
+        #   or written into dense arrays -- see `NpyResultsWriter` --
+        #   or only summarized -- see `OnlineSummaryWriter`
+        if self.storage_backend == "summary":
+            if checkpoint is None:
+                results_writer = OnlineSummaryWriter(self.database_filename,
+                                                     self.state_variables_to_record,
+                                                     sorted(self.subpop_ids, key=self.subpop_ids.get),
+                                                     timepoints,
+                                                     self.summary_quantiles,
+                                                     self.exceedance_thresholds)
+            else:
+                results_writer = checkpoint["results_writer"]
+        elif self.storage_backend == "npy":
+            state_var_shapes = {}
+            for state_var_name in self.state_variables_to_record:
+                state_var_shapes[state_var_name] = np.broadcast_shapes(
+                    *[np.shape(subpop_model.all_state_variables[state_var_name].current_val)[-2:]
+                      for subpop_model in subpop_models])
+
+            results_writer = NpyResultsWriter(self.results_dirname,
+                                              state_var_shapes,
+                                              len(subpop_models),
+                                              reps,
+                                              timepoints,
+                                              resume=checkpoint is not None)
+        else:
+            results_writer = BulkSQLResultsWriter(self.database_filename)
+
+            # Rows of replications after the checkpoint may have been
+            #   inserted before the run stopped -- they are simulated again
+            if checkpoint is not None:
+                results_writer.cursor.execute("DELETE FROM results_data WHERE rep >= ?",
+                                              (first_rep_to_simulate,))
+                results_writer.conn.commit()
+
+        # Batches of replications -- if reps_per_batch is 1,
+        #   each batch is a single replication simulated without a leading
+        #   replications axis
+        first_reps = list(range(first_rep_to_simulate, reps, reps_per_batch))
+        nums_batched_reps = [min(reps_per_batch, reps - first_rep)
+                             if reps_per_batch > 1 else None
+                             for first_rep in first_reps]
+
+        # One root of entropy per SubpopModel, drawn from its RNG --
+        #   streams for each replication (or batch) are spawned from
+        #   these roots, keyed by the (first) replication ID
+        if num_workers is None:
+            root_entropies = None
+        elif checkpoint is None:
+            root_entropies = [int(subpop_model.RNG.integers(2 ** 63))
+                              for subpop_model in subpop_models]
+        else:
+            root_entropies = checkpoint["root_entropies"]
+
+        if checkpoint is None and self.checkpoint_every_reps is not None:
+            self.save_checkpoint({"run_settings": {"reps": reps,
+                                                   "end_day": end_day,
+                                                   "days_per_save": days_per_save,
+                                                   "inputs_are_static": inputs_are_static,
+                                                   "filename": filename,
+                                                   "reps_per_batch": reps_per_batch,
+                                                   "num_workers": num_workers},
+                                  "subpop_ids": self.subpop_ids,
+                                  "state_var_ids": self.state_var_ids,
+                                  "inputs_realizations": self.inputs_realizations,
+                                  "root_entropies": root_entropies,
+                                  **self.get_checkpoint_progress(results_writer, 0)})
+
+        if num_workers is None:
+            batches_rows = (self.simulate_rep_batch(first_rep,
+                                                    num_batched_reps,
+                                                    end_day,
+                                                    days_per_save,
+                                                    inputs_are_static)
+                            for first_rep, num_batched_reps in zip(first_reps, nums_batched_reps))
+        else:
+            seed_seqs = [[np.random.SeedSequence(entropy=root_entropy, spawn_key=(first_rep,))
+                          for root_entropy in root_entropies]
+                         for first_rep in first_reps]
+
+            executor = ProcessPoolExecutor(max_workers=num_workers,
+                                           initializer=init_experiment_worker,
+                                           initargs=(self,))
+
+            # executor.map yields results in replication order,
+            #   so rows are inserted in the same order for any
+            #   number of workers
+            batches_rows = executor.map(simulate_rep_batch_in_worker,
+                                        first_reps,
+                                        nums_batched_reps,
+                                        seed_seqs,
+                                        [end_day] * len(first_reps),
+                                        [days_per_save] * len(first_reps),
+                                        [inputs_are_static] * len(first_reps))
+
+        # Writer methods are timed without modifying the writer,
+        #   which may be pickled in checkpoints
+        add_rows = results_writer.add_rows
+        close_results_writer = results_writer.close
+
+        if self.profiler is not None:
+            add_rows = self.profiler.wrap(add_rows, ("experiment", "log_results", "add_rows"))
+            close_results_writer = self.profiler.wrap(close_results_writer,
+                                                      ("experiment", "log_results", "close"))
+
+        num_reps_since_checkpoint = 0
+
+        # Replications are simulated lazily, in the loop below
+        if self.profiler is not None:
+            model.set_profiler(self.profiler)
+
+        try:
+            for first_rep, num_batched_reps, rows in zip(first_reps, nums_batched_reps, batches_rows):
+                add_rows(rows)
+
+                num_reps_since_checkpoint += 1 if num_batched_reps is None else num_batched_reps
+
+                if self.checkpoint_every_reps is not None and \
+                        num_reps_since_checkpoint >= self.checkpoint_every_reps:
+                    num_completed_reps = first_rep + (1 if num_batched_reps is None else num_batched_reps)
+                    results_writer.flush()
+                    self.save_checkpoint(self.get_checkpoint_progress(results_writer, num_completed_reps))
+                    num_reps_since_checkpoint = 0
+        except BaseException:
+            # Rows after the last checkpoint are discarded on resume,
+            #   but the connection must still be closed
+            if self.storage_backend == "sqlite":
+                results_writer.conn.close()
+            raise
+        finally:
+            if num_workers is not None:
+                executor.shutdown(cancel_futures=True)
+
+            if self.profiler is not None:
+                model.set_profiler(None)
+
+        if reps_per_batch > 1 or num_workers is not None:
+            model.set_num_batched_reps(None)
+            if not inputs_are_static:
+                self.apply_inputs_to_model(reps - 1)
+
+        # Insert remaining rows, create indexes, commit, and close
+        close_results_writer()
 
-            # Simulate model and save results every `days_per_save` days
-            while model.current_simulation_day < end_day:
-                model.simulate_until_day(min(model.current_simulation_day + days_per_save,
-                                             end_day))
+        if self.checkpoint_every_reps is not None:
+            self.save_checkpoint({"num_completed_reps": reps})
 
-                self.log_current_vals_to_sql(rep, cursor)
+        if self.storage_backend == "npy":
+            if filename:
+                self.get_npy_results_df().to_csv(filename)
+            return
+
+        if self.storage_backend == "summary":
+            if filename:
+                results_writer.get_summary_df().to_csv(filename)
+            return
+
+        conn = sqlite3.connect(self.database_filename)
 
         self.results_df = get_sql_table_as_df(conn, "SELECT * FROM results", chunk_size=int(1e4))
 
+        conn.close()
+
         if filename:
             self.results_df.to_csv(filename)
 
-        # Commit changes to database and close
+    def get_checkpoint_progress(self,
+                                results_writer,
+                                num_completed_reps: int) -> dict:
+        """
+        Returns the parts of a checkpoint that change as replications
+        are completed -- the number of completed replications, the
+        state of each `SubpopModel`'s RNG bit generator, and (for
+        "summary" storage backend) the running summary statistics.
+
+        Params:
+            results_writer (BulkSQLResultsWriter | NpyResultsWriter | OnlineSummaryWriter):
+                writer of the experiment's results.
+            num_completed_reps (int):
+                number of replications whose results are saved.
+        """
+
+        checkpoint_progress = {"num_completed_reps": num_completed_reps,
+                               "RNG_states": {subpop_model.name: subpop_model.RNG.bit_generator.state
+                                              for subpop_model in self.experiment_subpop_models}}
+
+        if self.storage_backend == "summary":
+            checkpoint_progress["results_writer"] = results_writer
+
+        return checkpoint_progress
+
+    def save_checkpoint(self,
+                        checkpoint: dict) -> None:
+        """
+        Saves (or updates) values in `checkpoint` to "checkpoint" table of
+        SQL database -- each value is pickled and stored in its own row,
+        keyed by its key in `checkpoint`.
+        """
+
+        conn = sqlite3.connect(self.database_filename)
+        conn.execute("CREATE TABLE IF NOT EXISTS checkpoint (key TEXT PRIMARY KEY, value BLOB)")
+        conn.executemany("INSERT OR REPLACE INTO checkpoint VALUES (?, ?)",
+                         [(key, pickle.dumps(value)) for key, value in checkpoint.items()])
         conn.commit()
         conn.close()
 
+    def load_checkpoint(self) -> Optional[dict]:
+        """
+        Returns checkpoint saved in "checkpoint" table of SQL
+        database (see `self.save_checkpoint`), or `None` if there is
+        no checkpoint.
+        """
+
+        if not os.path.exists(self.database_filename):
+            return None
+
+        conn = sqlite3.connect(self.database_filename)
+
+        try:
+            checkpoint = {key: pickle.loads(value)
+                          for key, value in conn.execute("SELECT key, value FROM checkpoint")}
+        except sqlite3.OperationalError:
+            checkpoint = None
+
+        conn.close()
+
+        return checkpoint
+
+    def resume(self) -> None:
+        """
+        Resumes an experiment that was checkpointed (see `checkpoint_every_reps`
+        in `__init__`) but stopped before all replications were
+        completed -- for example, if the process was killed.
+
+        Must be called on a new `Experiment` instance created with the
+        same model (with the same names and initial values), state
+        variables to record, database filename, and storage backend as the
+        original experiment. Inputs realizations and run settings are loaded
+        from the checkpoint, completed replications are skipped, and each
+        `SubpopModel`'s RNG continues from its state at the checkpoint, so
+        results are the same as if the experiment had not stopped.
+        """
+
+        if self.has_been_run:
+            raise ExperimentError("Experiment has already been run. "
+                                  "Create a new Experiment instance to resume.")
+
+        checkpoint = self.load_checkpoint()
+
+        if checkpoint is None or "run_settings" not in checkpoint:
+            raise ExperimentError(f"No checkpoint found in database {self.database_filename}.")
+
+        if checkpoint["subpop_ids"] != self.subpop_ids or \
+                checkpoint["state_var_ids"] != self.state_var_ids:
+            raise ExperimentError("Subpopulations and state variables to record must "
+                                  "match the checkpointed experiment.")
+
+        self.has_been_run = True
+
+        self.inputs_realizations = checkpoint["inputs_realizations"]
+
+        for subpop_model in self.experiment_subpop_models:
+            subpop_model.RNG.bit_generator.state = checkpoint["RNG_states"][subpop_model.name]
+
+        self.simulate_reps_and_save_results(**checkpoint["run_settings"],
+                                            checkpoint=checkpoint)
+
     def create_results_sql_table(self):
         """
         Create SQL database and save to `self.database_filename`.
-        Create table named `results` with columns `subpop_name`,
+        Create view named `results` with columns `subpop_name`,
         `state_var_name`, `age_group`, `risk_group`, `rep`, `timepoint`,
         and `value` to store results from each replication of experiment.
+
+        Results are stored in table `results_data`, where subpopulation
+        and state variable names are replaced by integer IDs
+        (`self.subpop_ids` and `self.state_var_ids`) that are
+        mapped to names by tables `subpops` and `state_vars`.
+        The `results` view joins these tables.
         """
 
         # Make sure user is not overwriting database
@@ -783,6 +2143,11 @@ class Experiment:
                                   "Delete existing .db file or change database_filename "
                                   "attribute.")
 
+        if self.storage_backend == "npy" and os.path.exists(self.results_dirname):
+            raise ExperimentError("Results directory already exists! Overwriting is not "
+                                  "allowed. Delete existing directory or change "
+                                  "database_filename attribute.")
+
         # Connect to the SQLite database and create database
         # Create a cursor object to execute SQL commands
         # Initialize a table with columns given by column_names
@@ -790,17 +2155,47 @@ class Experiment:
         conn = sqlite3.connect(self.database_filename)
         cursor = conn.cursor()
         cursor.execute("""
-        CREATE TABLE IF NOT EXISTS results (
-            subpop_name TEXT,
-            state_var_name TEXT,
+        CREATE TABLE IF NOT EXISTS subpops (
+            subpop_id INTEGER PRIMARY KEY,
+            subpop_name TEXT UNIQUE
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS state_vars (
+            state_var_id INTEGER PRIMARY KEY,
+            state_var_name TEXT UNIQUE
+        )
+        """)
+        cursor.executemany("INSERT INTO subpops VALUES (?, ?)",
+                           [(subpop_id, subpop_name)
+                            for subpop_name, subpop_id in self.subpop_ids.items()])
+        cursor.executemany("INSERT INTO state_vars VALUES (?, ?)",
+                           [(state_var_id, state_var_name)
+                            for state_var_name, state_var_id in self.state_var_ids.items()])
+
+        # No primary key -- its unique index is created after
+        #   all results are inserted (see `BulkSQLResultsWriter.close`)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS results_data (
+            subpop_id INT,
+            state_var_id INT,
             age_group INT,
             risk_group INT,
             rep INT,
             timepoint INT,
-            value FLOAT,
-            PRIMARY KEY (subpop_name, state_var_name, age_group, risk_group, rep, timepoint)
+            value FLOAT
         )
         """)
+
+        # CROSS JOIN makes SQLite scan results_data in the outer loop,
+        #   so rows are returned in insertion order
+        cursor.execute("""
+        CREATE VIEW IF NOT EXISTS results AS
+        SELECT subpop_name, state_var_name, age_group, risk_group, rep, timepoint, value
+        FROM results_data
+            CROSS JOIN subpops ON results_data.subpop_id = subpops.subpop_id
+            CROSS JOIN state_vars ON results_data.state_var_id = state_vars.state_var_id
+        """)
         conn.commit()
         conn.close()
 
@@ -849,11 +2244,13 @@ class Experiment:
                 Common suffix used to generate CSV filenames.
         """
 
-        for subpop_model in self.experiment_subpop_models:
-            conn = sqlite3.connect(self.database_filename)
+        conn = sqlite3.connect(self.database_filename)
 
+        for subpop_model in self.experiment_subpop_models:
             table_name = f"{subpop_model.name}_inputs"
 
             subpop_inputs_df = get_sql_table_as_df(conn, f"SELECT * FROM {table_name}", chunk_size=int(1e4))
 
             subpop_inputs_df.to_csv(f"{subpop_model.name}_{suffix}", index=False)
+
+        conn.close()
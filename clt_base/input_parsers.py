@@ -1,4 +1,7 @@
-from .utils import np, json, Type
+from __future__ import annotations
+
+from .utils import np, pd, json, Type
+from .base_components import MetapopModelError
 from typing import Protocol
 
 
@@ -94,3 +97,55 @@ def make_dataclass_from_json(dataclass_ref: Type[DataClassProtocol],
 
     return make_dataclass_from_dict(dataclass_ref, d)
 
+
+
+def load_sparse_travel_proportions_csv(csv_filepath: str,
+                                       subpop_names_mapping: dict):
+    """
+    Create sparse travel proportions array (in CSR format) from a CSV
+    file listing only nonzero travel proportions, one per row, so that
+    memory scales with the number of travel flows rather than
+    the square of the number of subpopulations.
+
+    Args:
+        csv_filepath (str):
+            path to CSV file with columns "origin_subpop_name",
+            "dest_subpop_name", and "travel_proportion" -- each row
+            gives the proportion of residents of the origin subpopulation
+            who travel to the destination subpopulation. Pairs of
+            subpopulations that are not listed have travel proportion 0.
+        subpop_names_mapping (dict):
+            keys are subpopulation names and values are integers
+            0, 1, ..., |L|-1 giving the row/column position of each
+            subpopulation in the travel proportions array.
+
+    Returns:
+        scipy.sparse.csr_array:
+            |L| x |L| array, where element i,j corresponds to proportion of
+            subpopulation i that travels to subpopulation j.
+
+    Raises:
+        MetapopModelError:
+            if an origin or destination subpopulation name in the CSV
+            file is not a key of `subpop_names_mapping`.
+    """
+
+    # scipy is only needed for sparse travel proportions,
+    #   so it is imported here rather than with the shared imports
+    from scipy import sparse
+
+    df = pd.read_csv(csv_filepath)
+
+    subpop_names = pd.concat([df["origin_subpop_name"], df["dest_subpop_name"]])
+    unmapped_subpop_names = sorted(set(subpop_names[~subpop_names.isin(subpop_names_mapping.keys())]))
+
+    if unmapped_subpop_names:
+        raise MetapopModelError(f"Subpopulation names {unmapped_subpop_names} in {csv_filepath} "
+                                f"are not in subpop_names_mapping.")
+
+    num_subpops = len(subpop_names_mapping)
+
+    return sparse.csr_array((df["travel_proportion"].to_numpy(dtype=float),
+                             (df["origin_subpop_name"].map(subpop_names_mapping).to_numpy(dtype=int),
+                              df["dest_subpop_name"].map(subpop_names_mapping).to_numpy(dtype=int))),
+                            shape=(num_subpops, num_subpops))
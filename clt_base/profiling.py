@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+from .utils import np, pd, Optional, time
+
+
+class PhaseProfiler:
+    """
+    Opt-in profiler of the phases of a simulation -- accumulates
+    wall time and number of calls for each stack of (nested) phases,
+    such as ("subpopA", "simulate_timesteps", "sample_transitions", "S_to_E").
+
+    Phases are timed by wrapping methods of the instrumented objects
+    (see `self.wrap`, `SubpopModel.set_profiler`, `MetapopModel.set_profiler`,
+    and `profiler` in `Experiment.__init__`) -- models that are not
+    instrumented run their methods unchanged, so there is no overhead
+    when profiling is disabled.
+
+    Attributes:
+        stats (dict):
+            keys are stacks (tuples of phase names, outermost first)
+            and values are [total wall time in seconds, number of calls]
+            lists.
+        stack (list[str]):
+            names of phases that are currently running, outermost first.
+
+    See `__init__` docstring for other attributes.
+    """
+
+    def __init__(self,
+                 timer=time.perf_counter,
+                 callbacks: Optional[list] = None):
+        """
+        Params:
+            timer (callable):
+                takes no arguments and returns current time in seconds --
+                for example, `time.perf_counter` (default) for wall time
+                or `time.process_time` for CPU time.
+            callbacks (Optional[list[callable]]):
+                each callback is called with the stack (tuple of phase names)
+                and the elapsed time in seconds at the end of each phase --
+                for example, to send timings to an external tracing tool.
+        """
+
+        self.timer = timer
+        self.callbacks = list(callbacks) if callbacks is not None else []
+
+        self.stats = {}
+        self.stack = []
+
+    def wrap(self,
+             func,
+             frames: tuple):
+        """
+        Returns function that calls `func` and records its wall time
+            (and one call) under the current stack extended with `frames` --
+            each prefix of the extended stack is recorded, so that
+            a frame such as a subpopulation name can group phases.
+
+        Args:
+            func (callable):
+                function or bound method to time.
+            frames (tuple[str]):
+                names of phases pushed onto the stack while `func` runs.
+
+        Returns:
+            callable:
+                timed version of `func`.
+        """
+
+        stats = self.stats
+        stack = self.stack
+        timer = self.timer
+        callbacks = self.callbacks
+        num_frames = len(frames)
+
+        def timed_func(*args, **kwargs):
+            stack.extend(frames)
+            start = timer()
+
+            try:
+                return func(*args, **kwargs)
+
+            finally:
+                elapsed = timer() - start
+                key = tuple(stack)
+
+                for ix in range(len(key) - num_frames + 1, len(key) + 1):
+                    key_stats = stats.get(key[:ix])
+                    if key_stats is None:
+                        stats[key[:ix]] = [elapsed, 1]
+                    else:
+                        key_stats[0] += elapsed
+                        key_stats[1] += 1
+
+                for callback in callbacks:
+                    callback(key, elapsed)
+
+                del stack[-num_frames:]
+
+        timed_func.wrapped_func = func
+
+        return timed_func
+
+    def instrument(self,
+                   obj,
+                   methods_names: list,
+                   frames: tuple = ()) -> None:
+        """
+        Replaces each method of `obj` in `methods_names` with a timed
+            version (see `self.wrap`), recorded under `frames` followed
+            by the method name. Timed methods are instance attributes --
+            see `remove_instrumentation`. Methods that are already
+            instance attributes (for example, assigned in `__init__`)
+            are also timed, and restored when instrumentation is removed.
+
+        Args:
+            obj (object):
+                object with methods to time.
+            methods_names (list[str]):
+                names of methods of `obj` to time.
+            frames (tuple[str]):
+                names of phases to push before the method name.
+        """
+
+        for method_name in methods_names:
+            remove_instrumentation(obj, [method_name])
+
+            timed_method = self.wrap(getattr(obj, method_name), frames + (method_name,))
+            timed_method.is_instance_attr = method_name in vars(obj)
+
+            setattr(obj, method_name, timed_method)
+
+    def reset(self) -> None:
+        """
+        Clears all recorded timings.
+        """
+
+        self.stats.clear()
+
+    def get_report_df(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame:
+                one row per stack of phases, sorted by stack, with columns
+                "stack" (phase names joined by ";"), "phase" (innermost phase),
+                "depth", "num_calls", "total_seconds", "self_seconds" (total
+                time minus time in nested phases), and "mean_seconds".
+        """
+
+        children_totals = {}
+
+        for key, (total, num_calls) in self.stats.items():
+            if len(key) > 1:
+                children_totals[key[:-1]] = children_totals.get(key[:-1], 0.0) + total
+
+        rows = []
+
+        for key in sorted(self.stats):
+            total, num_calls = self.stats[key]
+            rows.append({"stack": ";".join(key),
+                         "phase": key[-1],
+                         "depth": len(key),
+                         "num_calls": num_calls,
+                         "total_seconds": total,
+                         "self_seconds": max(total - children_totals.get(key, 0.0), 0.0),
+                         "mean_seconds": total / num_calls})
+
+        return pd.DataFrame(rows, columns=["stack", "phase", "depth", "num_calls",
+                                           "total_seconds", "self_seconds", "mean_seconds"])
+
+    def get_phase_totals_df(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame:
+                total time and number of calls of each phase
+                (summed over subpopulations and enclosing phases),
+                indexed by phase name and sorted by decreasing total time.
+        """
+
+        report_df = self.get_report_df()
+
+        return report_df.groupby("phase")[["num_calls", "total_seconds", "self_seconds"]].sum() \
+            .sort_values("total_seconds", ascending=False)
+
+    def write_flamegraph(self,
+                         filename: str) -> None:
+        """
+        Writes self time of each stack of phases (in microseconds) in
+            "collapsed stack" format (one "phase1;phase2;phase3 value" line
+            per stack), which can be read by flamegraph.pl, speedscope,
+            and other flame graph tools.
+
+        Params:
+            filename (str):
+                name of text file to write.
+        """
+
+        report_df = self.get_report_df()
+
+        with open(filename, "w") as file:
+            for stack, self_seconds in zip(report_df["stack"], report_df["self_seconds"]):
+                self_microseconds = int(np.round(self_seconds * 1e6))
+                if self_microseconds > 0:
+                    file.write(f"{stack} {self_microseconds}\n")
+
+
+def remove_instrumentation(obj,
+                           methods_names: list) -> None:
+    """
+    Removes timed versions of methods in `methods_names` added to
+        `obj` by `PhaseProfiler.instrument`, so that `obj` uses its
+        original methods again. Methods that are not timed are unchanged.
+    """
+
+    obj_attrs = vars(obj)
+
+    for method_name in methods_names:
+        timed_method = obj_attrs.get(method_name)
+
+        if not hasattr(timed_method, "wrapped_func"):
+            continue
+
+        if timed_method.is_instance_attr:
+            obj_attrs[method_name] = timed_method.wrapped_func
+        else:
+            del obj_attrs[method_name]
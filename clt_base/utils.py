@@ -1,11 +1,64 @@
 # Shared imports
 
+import importlib
+import sys
+import types
+
 import numpy as np
-import pandas as pd
-import sciris as sc
+
+
+def lazy_import(module_name: str):
+    """
+    Returns module `module_name` if it is already imported, and otherwise
+        a `LazyModule` placeholder that imports it when one of its
+        attributes is first accessed -- so that importing `clt_base` (or
+        `flu_model`) does not pay the import time of large packages until
+        they are used, and packages that a run never uses (for example,
+        scipy with dense travel proportions) are never imported.
+
+    Nothing is added to `sys.modules` until the module is actually
+        imported, so other code in the process is not affected.
+
+    Args:
+        module_name (str):
+            full name of module, e.g. "pandas" or "scipy.sparse".
+    """
+
+    module = sys.modules.get(module_name)
+
+    if module is not None:
+        return module
+
+    return LazyModule(module_name)
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module that is imported (with a regular import)
+        when one of its attributes is first accessed -- see `lazy_import`.
+        A missing package only raises an error when it is used.
+    """
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+
+        # Later accesses are regular attribute lookups
+        vars(self).update(vars(module))
+
+        return getattr(module, name)
+
+
+# Note: building a model creates sciris objdicts, and importing sciris
+#   imports pandas and matplotlib (but not matplotlib.pyplot) -- so
+#   processes that build models (including experiment worker processes)
+#   import them anyway, and only processes that import clt_base or
+#   flu_model without building models skip them
+pd = lazy_import("pandas")
+sc = lazy_import("sciris")
 
 import json
 import copy
+import pickle
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, fields
@@ -14,11 +67,15 @@ from typing import Optional, Union, Type, List
 from enum import Enum
 
 import datetime
+import time
 
 from pathlib import Path
 
 import sqlite3
 
 import functools
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
 
 import os
\ No newline at end of file
@@ -8,6 +8,8 @@ import clt_base as clt
 import numpy as np
 import pandas as pd
 import copy
+import shutil
+import sqlite3
 import pytest
 
 from pathlib import Path
@@ -330,3 +332,448 @@ def test_csv_db_creation(experiment_model):
     assert csv_filepath.is_file(), \
         f"Results CSV file {csv_filepath} was not created."
     csv_filepath.unlink()
+
+
+@pytest.mark.parametrize("experiment_model", experiment_models_list)
+def test_batched_reps_match_serial(experiment_model):
+    """
+    Models are deterministic, so running replications in batches
+    (with a leading replications axis) should record exactly the
+    same results as running them one after another, including
+    when inputs change across replications.
+    """
+
+    sequences_of_inputs = {"subpopA": {"beta_baseline": [1, 2, 3, 4, 5]},
+                           "subpopB": {"H_to_D_rate": [0.01, 0.02, 0.03, 0.04, 0.05]}}
+
+    results = []
+
+    for reps_per_batch, database_filename in ((1, "results_serial.db"),
+                                              (2, "results_batched.db")):
+        experiment = clt.Experiment(experiment_model,
+                                    ["S", "H", "pop_immunity_hosp"],
+                                    database_filename)
+
+        experiment_inputs = {name: sequences_of_inputs[name]
+                             for name in experiment.inputs_realizations.keys()}
+
+        experiment.run_sequences_of_inputs(num_reps=5,
+                                           simulation_end_day=20,
+                                           sequences_of_inputs=experiment_inputs,
+                                           days_between_save_history=3,
+                                           reps_per_batch=reps_per_batch)
+
+        results.append(experiment.get_state_var_df("H"))
+
+        # Scalar parameters should be restored as scalars
+        assert np.isscalar(experiment.experiment_subpop_models[0].params.beta_baseline)
+
+        Path(database_filename).unlink()
+
+    assert np.allclose(results[0], results[1])
+
+
+def test_parallel_reps_reproducible_across_num_workers():
+    """
+    With stochastic transitions, results of replications distributed
+    across worker processes should be identical for a fixed seed,
+    no matter how many workers are used.
+    """
+
+    stochastic_config_dict = copy.deepcopy(config_dict)
+    stochastic_config_dict["transition_type"] = "binomial"
+
+    results = []
+
+    for num_workers, database_filename in ((1, "results_1_worker.db"),
+                                           (3, "results_3_workers.db")):
+        subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                          params_dict,
+                                          stochastic_config_dict,
+                                          calendar_df,
+                                          np.random.Generator(np.random.MT19937(88888)),
+                                          name="subpopC")
+
+        experiment = clt.Experiment(subpop_model,
+                                    ["S", "H"],
+                                    database_filename)
+
+        experiment.run_random_inputs(num_reps=4,
+                                     simulation_end_day=20,
+                                     random_inputs_RNG=np.random.Generator(np.random.MT19937(10)),
+                                     random_inputs_spec={"subpopC": {"beta_baseline": [0.5, 2]}},
+                                     days_between_save_history=2,
+                                     num_workers=num_workers)
+
+        results.append(experiment.results_df)
+
+        Path(database_filename).unlink()
+
+    assert results[0].equals(results[1])
+
+    # Replications should not be copies of each other
+    df = results[0]
+    final_S = df[(df["state_var_name"] == "S") & (df["timepoint"] == df["timepoint"].max())]
+    assert final_S.groupby("rep")["value"].sum().nunique() > 1
+
+
+def test_bulk_sql_results_schema():
+    """
+    Results are stored with integer-coded subpopulations and state
+    variables in WAL mode, the "results" view maps them back to names,
+    and the unique index is created once the experiment has run.
+    Rows inserted by `BulkSQLResultsWriter` should not depend on
+    how many rows are buffered before each insertion.
+    """
+
+    experiment = clt.Experiment(metapopAB,
+                                ["S", "H"],
+                                "results.db")
+    experiment.run_static_inputs(3, 10, 2)
+
+    conn = sqlite3.connect("results.db")
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                        "AND name = 'results_data_key'").fetchone() is not None
+    assert dict(conn.execute("SELECT subpop_name, subpop_id FROM subpops").fetchall()) == \
+           experiment.subpop_ids
+    assert dict(conn.execute("SELECT state_var_name, state_var_id FROM state_vars").fetchall()) == \
+           experiment.state_var_ids
+
+    rows = conn.execute("SELECT * FROM results_data").fetchall()
+
+    conn.close()
+
+    # Same rows, inserted a few at a time
+    Path("results_small_buffer.db").unlink(missing_ok=True)
+    small_buffer_experiment = clt.Experiment(metapopAB, ["S", "H"], "results_small_buffer.db")
+    small_buffer_experiment.create_results_sql_table()
+
+    results_writer = clt.BulkSQLResultsWriter("results_small_buffer.db", max_buffered_rows=5)
+    for ix in range(0, len(rows), 3):
+        results_writer.add_rows(np.asarray(rows[ix:ix + 3], dtype=float))
+    results_writer.close()
+
+    conn = sqlite3.connect("results_small_buffer.db")
+    assert conn.execute("SELECT * FROM results_data").fetchall() == rows
+    assert pd.read_sql_query("SELECT * FROM results", conn).equals(experiment.results_df)
+    conn.close()
+
+    Path("results.db").unlink()
+    Path("results_small_buffer.db").unlink()
+
+
+@pytest.mark.parametrize("experiment_model", experiment_models_list)
+def test_npy_storage_backend_matches_sqlite(experiment_model):
+    """
+    Results stored in memory-mapped ".npy" arrays should give the
+    same `get_state_var_df` DataFrames (for any filters) and the
+    same results CSV as results stored in the SQL database.
+    """
+
+    experiments = {}
+
+    for storage_backend in ("sqlite", "npy"):
+        experiment = clt.Experiment(experiment_model,
+                                    ["S", "H"],
+                                    f"results_{storage_backend}.db",
+                                    storage_backend=storage_backend)
+        experiment.run_random_inputs(num_reps=3,
+                                     simulation_end_day=20,
+                                     random_inputs_RNG=np.random.Generator(np.random.MT19937(10)),
+                                     random_inputs_spec={name: {"beta_baseline": [0.5, 2]}
+                                                         for name in experiment.inputs_realizations.keys()},
+                                     days_between_save_history=3,
+                                     results_filename=f"results_{storage_backend}.csv",
+                                     reps_per_batch=2)
+        experiments[storage_backend] = experiment
+
+    subpop_name = experiment_model.name if isinstance(experiment_model, clt.SubpopModel) else "subpopB"
+
+    for filters in ({},
+                    {"subpop_name": subpop_name},
+                    {"age_group": 1},
+                    {"subpop_name": subpop_name, "age_group": 0, "risk_group": 0}):
+        sqlite_df = experiments["sqlite"].get_state_var_df("H", **filters)
+        npy_df = experiments["npy"].get_state_var_df("H", **filters)
+        pd.testing.assert_frame_equal(sqlite_df, npy_df, check_names=False)
+
+    assert experiments["npy"].get_state_var_df("H", risk_group=1).empty
+
+    S_array = experiments["npy"].get_state_var_array("S")
+    assert np.shape(S_array)[:3] == (3, 7, len(experiments["npy"].subpop_ids))
+    assert list(experiments["npy"].get_timepoints()) == [3, 6, 9, 12, 15, 18, 20]
+
+    # Rows are in a different order (grouped by state variable for "npy")
+    key_columns = ["subpop_name", "state_var_name", "age_group", "risk_group", "rep", "timepoint"]
+    sqlite_results_df = pd.read_csv("results_sqlite.csv", index_col=0).sort_values(key_columns)
+    npy_results_df = pd.read_csv("results_npy.csv", index_col=0).sort_values(key_columns)
+    pd.testing.assert_frame_equal(sqlite_results_df.reset_index(drop=True),
+                                  npy_results_df.reset_index(drop=True))
+
+    for storage_backend in ("sqlite", "npy"):
+        Path(f"results_{storage_backend}.db").unlink()
+        Path(f"results_{storage_backend}.csv").unlink()
+    shutil.rmtree("results_npy_results")
+
+
+@pytest.mark.parametrize("experiment_model", experiment_models_list)
+def test_summary_storage_backend_matches_full_results(experiment_model):
+    """
+    Running summary statistics (mean, variance, quantiles, and
+    exceedance probabilities) saved by the "summary" storage backend
+    should match statistics computed from the full results saved
+    by the "sqlite" backend.
+    """
+
+    experiments = {}
+
+    for storage_backend in ("sqlite", "summary"):
+        experiment = clt.Experiment(experiment_model,
+                                    ["H", "D"],
+                                    f"results_{storage_backend}.db",
+                                    storage_backend=storage_backend,
+                                    exceedance_thresholds={"H": [1e4]})
+        experiment.run_random_inputs(num_reps=4,
+                                     simulation_end_day=30,
+                                     random_inputs_RNG=np.random.Generator(np.random.MT19937(10)),
+                                     random_inputs_spec={name: {"beta_baseline": [0.5, 2]}
+                                                         for name in experiment.inputs_realizations.keys()},
+                                     days_between_save_history=5,
+                                     reps_per_batch=3)
+        experiments[storage_backend] = experiment
+
+    H_df = experiments["sqlite"].get_state_var_df("H")
+    H_summary_df = experiments["summary"].get_state_var_summary_df("H")
+
+    assert list(H_summary_df.index) == list(H_df.columns)
+    assert (H_summary_df["num_reps"] == 4).all()
+    assert np.allclose(H_summary_df["mean"], H_df.mean(axis=0))
+    assert np.allclose(H_summary_df["variance"], H_df.var(axis=0))
+    assert np.allclose(H_summary_df["quantile_0.5"], H_df.median(axis=0))
+    assert np.allclose(H_summary_df["exceedance_prob_10000"], (H_df > 1e4).mean(axis=0))
+
+    # No exceedance thresholds for "D"
+    assert not any(column.startswith("exceedance")
+                   for column in experiments["summary"].get_state_var_summary_df("D").columns)
+
+    for subpop_name in experiments["summary"].subpop_ids:
+        D_df = experiments["sqlite"].get_state_var_df("D", subpop_name=subpop_name)
+        D_summary_df = experiments["summary"].get_state_var_summary_df("D", subpop_name)
+        assert np.allclose(D_summary_df["mean"], D_df.mean(axis=0))
+
+    with pytest.raises(clt.ExperimentError):
+        experiments["summary"].get_state_var_df("H")
+
+    for storage_backend in ("sqlite", "summary"):
+        Path(f"results_{storage_backend}.db").unlink()
+
+
+def test_P2_quantiles_estimator():
+    """
+    P-squared quantile estimates should be close to sample quantiles,
+    and exact when all observations are equal.
+    """
+
+    observations = np.random.Generator(np.random.MT19937(10)).normal(size=(5000, 3))
+
+    estimator = clt.P2QuantilesEstimator((3,), (0.1, 0.5, 0.9))
+    for observation in observations:
+        estimator.update(observation)
+
+    assert np.allclose(estimator.get_estimates(),
+                       np.quantile(observations, (0.1, 0.5, 0.9), axis=0),
+                       atol=0.05)
+
+    estimator = clt.P2QuantilesEstimator((2,), (0.5,))
+    for i in range(10):
+        estimator.update(np.array([1.0, 2.0]))
+
+    assert np.array_equal(estimator.get_estimates(), [[1.0, 2.0]])
+
+
+def test_state_var_df_filters_pushed_into_sql():
+    """
+    `get_state_var_df` filters and sums in SQL -- results should match
+    filtering and summing the full results table in pandas, and queries
+    with no matching rows should return empty DataFrames (with the
+    query's columns, for `get_sql_table_as_df`).
+    """
+
+    experiment = clt.Experiment(metapopAB,
+                                ["S", "H"],
+                                "results.db")
+    experiment.run_static_inputs(2, 10, 3)
+
+    results_df = experiment.results_df
+    H_results_df = results_df[(results_df["state_var_name"] == "H") &
+                              (results_df["subpop_name"] == "subpopB") &
+                              (results_df["age_group"] == 1)]
+    expected_df = H_results_df.groupby(["rep", "timepoint"])["value"].sum().unstack()
+
+    assert np.allclose(experiment.get_state_var_df("H", subpop_name="subpopB", age_group=1),
+                       expected_df)
+
+    assert experiment.get_state_var_df("H", subpop_name="subpopC").empty
+
+    conn = sqlite3.connect("results.db")
+    empty_df = clt.get_sql_table_as_df(conn,
+                                       "SELECT * FROM results WHERE rep = ?",
+                                       sql_query_params=(100,),
+                                       chunk_size=2)
+    conn.close()
+
+    assert empty_df.empty
+    assert list(empty_df.columns) == list(results_df.columns)
+
+    Path("results.db").unlink()
+
+
+def test_resume_matches_uninterrupted_experiment(monkeypatch):
+    """
+    An experiment that stops partway through (after checkpointing)
+    and is resumed in a new `Experiment` instance should give the
+    same results as the experiment run without stopping -- completed
+    replications are skipped and RNG states and inputs are restored.
+    """
+
+    stochastic_config_dict = copy.deepcopy(config_dict)
+    stochastic_config_dict["transition_type"] = "binomial"
+
+    def create_experiment(database_filename):
+        subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                          params_dict,
+                                          stochastic_config_dict,
+                                          calendar_df,
+                                          np.random.Generator(np.random.MT19937(88888)),
+                                          name="subpopC")
+
+        return clt.Experiment(subpop_model,
+                              ["S", "H"],
+                              database_filename,
+                              checkpoint_every_reps=1)
+
+    def run(experiment):
+        experiment.run_random_inputs(num_reps=4,
+                                     simulation_end_day=20,
+                                     random_inputs_RNG=np.random.Generator(np.random.MT19937(10)),
+                                     random_inputs_spec={"subpopC": {"beta_baseline": [0.5, 2]}},
+                                     days_between_save_history=2)
+
+    uninterrupted_experiment = create_experiment("results_uninterrupted.db")
+    run(uninterrupted_experiment)
+
+    # Stop while simulating the third replication
+    simulate_rep_batch = clt.Experiment.simulate_rep_batch
+
+    def stopping_simulate_rep_batch(self, first_rep, *args):
+        if first_rep == 2:
+            raise KeyboardInterrupt
+        return simulate_rep_batch(self, first_rep, *args)
+
+    monkeypatch.setattr(clt.Experiment, "simulate_rep_batch", stopping_simulate_rep_batch)
+
+    with pytest.raises(KeyboardInterrupt):
+        run(create_experiment("results_resumed.db"))
+
+    monkeypatch.undo()
+
+    resumed_experiment = create_experiment("results_resumed.db")
+    assert resumed_experiment.load_checkpoint()["num_completed_reps"] == 2
+
+    resumed_experiment.resume()
+
+    assert resumed_experiment.results_df.equals(uninterrupted_experiment.results_df)
+    assert resumed_experiment.load_checkpoint()["num_completed_reps"] == 4
+
+    with pytest.raises(clt.ExperimentError):
+        resumed_experiment.resume()
+
+    for database_filename in ("results_uninterrupted.db", "results_resumed.db"):
+        Path(database_filename).unlink()
+
+
+def test_experiment_profiler_times_logging_and_phases():
+    """
+    An `Experiment` with a profiler should record time spent simulating
+        each replication (including the model's phases) and logging
+        results, should leave the model uninstrumented after the run,
+        and should not support worker processes.
+    """
+
+    subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                      params_dict,
+                                      config_dict,
+                                      calendar_df,
+                                      np.random.Generator(np.random.MT19937(88888)),
+                                      name="subpopC")
+
+    profiler = clt.PhaseProfiler()
+
+    experiment = clt.Experiment(subpop_model, ["S", "H"], "results.db", profiler=profiler)
+    experiment.run_static_inputs(3, 10, 2)
+
+    report_df = profiler.get_report_df().set_index("stack")
+
+    assert report_df.loc["experiment;simulate_rep_batch", "num_calls"] == 3
+    assert report_df.loc["experiment;simulate_rep_batch;get_current_vals_rows", "num_calls"] == 3 * 5
+    assert report_df.loc["experiment;simulate_rep_batch;subpopC;prepare_daily_state", "num_calls"] == 3 * 10
+    assert report_df.loc["experiment;log_results;add_rows", "num_calls"] == 3
+    assert report_df.loc["experiment;log_results;close", "num_calls"] == 1
+
+    # The model is not instrumented after the run
+    assert subpop_model.profiler is None
+    assert "simulate_timesteps" not in vars(subpop_model)
+
+    profiler.write_flamegraph("profile.txt")
+    flamegraph_stacks = [line.rsplit(" ", 1)[0] for line in Path("profile.txt").read_text().splitlines()]
+    assert set(flamegraph_stacks) <= set(report_df.index)
+
+    Path("results.db").unlink()
+    Path("profile.txt").unlink()
+
+    workers_experiment = clt.Experiment(subpop_model, ["S", "H"], "results.db", profiler=profiler)
+
+    with pytest.raises(clt.ExperimentError):
+        workers_experiment.run_static_inputs(3, 10, 2, num_workers=2)
+
+    Path("results.db").unlink(missing_ok=True)
+
+
+def test_clt_base_import_is_lazy():
+    """
+    Importing `clt_base` should not import pandas, sciris, matplotlib,
+        or the experiments and plotting modules -- they are imported
+        when first used, and their public names still work (including
+        with `from clt_base import *`).
+    """
+
+    import subprocess
+    import sys
+
+    code = ("import sys, types, clt_base as clt\n"
+            "heavy_modules = ['pandas', 'sciris', 'matplotlib', 'clt_base.experiments', 'clt_base.plotting']\n"
+            "assert not any(name in sys.modules for name in heavy_modules)\n"
+            "assert not hasattr(clt, 'not_a_name')\n"
+            "assert 'Experiment' in dir(clt)\n"
+            "assert not any(name in sys.modules for name in heavy_modules)\n"
+            "assert 'importlib' not in clt.__all__ and 'lazy_names_submodules' not in clt.__all__\n"
+            "assert clt.Experiment.__module__ == 'clt_base.experiments'\n"
+            "assert callable(clt.plot_subpop_total_infected_deaths)\n"
+            "namespace = {}\n"
+            "exec('from clt_base import *', namespace)\n"
+            "assert namespace['Experiment'] is clt.Experiment\n"
+            "assert namespace['ExperimentError'] is clt.ExperimentError\n"
+            "assert namespace['plot_metapop_epi_metrics'] is clt.plot_metapop_epi_metrics\n"
+            "assert namespace['SubpopModel'] is clt.SubpopModel\n"
+            "for submodule_name in set(clt.lazy_names_submodules.values()):\n"
+            "    submodule = sys.modules['clt_base.' + submodule_name]\n"
+            "    defined_names = [name for name, val in vars(submodule).items()\n"
+            "                     if isinstance(val, type | types.FunctionType)\n"
+            "                     and val.__module__ == submodule.__name__]\n"
+            "    listed_names = [name for name, val in clt.lazy_names_submodules.items()\n"
+            "                    if val == submodule_name]\n"
+            "    assert sorted(defined_names) == sorted(listed_names)\n")
+
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parent)
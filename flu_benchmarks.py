@@ -0,0 +1,473 @@
+# Benchmark suite for simulation hot paths of the flu model
+# Times simulating timesteps for each transition type, metapopulation
+#   models with many (synthetic) subpopulations, experiments with SQL
+#   logging, and wastewater on and off -- reports timesteps/sec,
+#   reps/sec, and peak memory, and writes results to a JSON file
+#   so that speed can be compared across releases
+# Usage: python flu_benchmarks.py [--output benchmark_results.json] [--quick]
+#   (see python flu_benchmarks.py --help for all options)
+
+###########################################################
+######################## IMPORTS ##########################
+###########################################################
+
+import argparse
+import copy
+import datetime
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import clt_base as clt
+import flu_model as flu
+
+###########################################################
+################# READ INPUT FILES ########################
+###########################################################
+
+# Synthetic inputs are generated from the demo input files
+base_path = Path(__file__).parent / "flu_demo_input_files"
+
+compartments_epi_metrics_dict = \
+    clt.load_json_new_dict(base_path / "compartments_epi_metrics_init_vals.json")
+params_dict = clt.load_json_new_dict(base_path / "common_params.json")
+config_dict = clt.load_json_new_dict(base_path / "config.json")
+calendar_df = pd.read_csv(base_path / "school_work_calendar.csv", index_col=0)
+
+# Synthetic subpopulations share the demo parameter arrays
+#   (see clt.SharedParams) rather than each holding a copy
+shared_params = clt.SharedParams(params_dict)
+
+# Travel proportions arrays for more subpopulations than this are sparse
+max_num_subpops_dense_travel = 50
+
+# Initial values that are population counts -- the others (immunity
+#   epi metrics) are not scaled with population size
+compartments_names = ("S", "E", "IP", "IS", "IA", "H", "R", "D")
+
+###########################################################
+############# SYNTHETIC INPUTS ############################
+###########################################################
+
+
+def create_synthetic_subpop_model(RNG: np.random.Generator,
+                                  name: str = "",
+                                  config_updates: dict = None,
+                                  **flu_subpop_model_kwargs) -> flu.FluSubpopModel:
+    """
+    Returns `FluSubpopModel` with the demo parameters and
+        calendar, and with the demo initial compartment values
+        scaled by a random factor in [0.5, 2], so that
+        subpopulations have different sizes.
+
+    Args:
+        RNG (np.random.Generator):
+            used to draw the population scale factor, and
+            used as the model's random number generator.
+        name (str):
+            name of `FluSubpopModel`.
+        config_updates (dict):
+            if specified, values in the demo config to replace.
+        flu_subpop_model_kwargs:
+            passed to `FluSubpopModel` (for example, `wastewater_enabled`).
+    """
+
+    scaled_compartments_epi_metrics_dict = copy.deepcopy(compartments_epi_metrics_dict)
+
+    population_scale = RNG.uniform(0.5, 2)
+
+    # Epi metrics (immunity levels) are not population counts
+    for key in compartments_names:
+        scaled_compartments_epi_metrics_dict[key] = \
+            np.round(np.asarray(compartments_epi_metrics_dict[key]) * population_scale)
+
+    return flu.FluSubpopModel(scaled_compartments_epi_metrics_dict,
+                              shared_params.get_params_dict(),
+                              {**config_dict, **(config_updates or {})},
+                              calendar_df,
+                              RNG,
+                              name=name,
+                              **flu_subpop_model_kwargs)
+
+
+def create_synthetic_travel_proportions(num_subpops: int,
+                                        RNG: np.random.Generator,
+                                        num_destinations: int = 5) -> "np.ndarray | scipy.sparse.csr_array":
+    """
+    Returns |L| x |L| travel proportions array, where |L| is
+        `num_subpops` -- residents of each subpopulation stay in their
+        own subpopulation with proportion in [0.6, 0.9], and the
+        rest travel to up to `num_destinations` random destinations.
+        Sparse (CSR) if `num_subpops` is greater than
+        `max_num_subpops_dense_travel`.
+    """
+
+    num_destinations = min(num_destinations, num_subpops - 1)
+
+    travel_proportions_array = np.diag(RNG.uniform(0.6, 0.9, size=num_subpops))
+
+    for origin in range(num_subpops):
+        destinations = RNG.choice(np.delete(np.arange(num_subpops), origin),
+                                  size=num_destinations,
+                                  replace=False)
+        travel_proportions_array[origin, destinations] = \
+            RNG.uniform(0, 1 - travel_proportions_array[origin, origin], size=num_destinations) / num_destinations
+
+    if num_subpops > max_num_subpops_dense_travel:
+        # scipy is only needed for sparse travel proportions
+        from scipy import sparse
+        return sparse.csr_array(travel_proportions_array)
+
+    return travel_proportions_array
+
+
+def create_synthetic_metapop_model(num_subpops: int,
+                                   seed: int,
+                                   **flu_subpop_model_kwargs) -> flu.FluMetapopModel:
+    """
+    Returns `FluMetapopModel` with `num_subpops` synthetic subpopulations
+        (see `create_synthetic_subpop_model`) and synthetic travel
+        proportions (see `create_synthetic_travel_proportions`). Each
+        subpopulation has an independent random number generator.
+    """
+
+    seed_seqs = np.random.SeedSequence(seed).spawn(num_subpops + 1)
+
+    subpop_names_mapping = {f"subpop{ix}": ix for ix in range(num_subpops)}
+
+    subpop_models = {name: create_synthetic_subpop_model(np.random.default_rng(seed_seqs[ix]),
+                                                         name,
+                                                         **flu_subpop_model_kwargs)
+                     for name, ix in subpop_names_mapping.items()}
+
+    travel_proportions = create_synthetic_travel_proportions(num_subpops,
+                                                             np.random.default_rng(seed_seqs[-1]))
+
+    return flu.FluMetapopModel(flu.FluInterSubpopRepo(subpop_models,
+                                                      subpop_names_mapping,
+                                                      travel_proportions))
+
+###########################################################
+################# TIMING & MEMORY #########################
+###########################################################
+
+
+def time_simulate_timesteps(subpop_model: clt.SubpopModel,
+                            num_days: int) -> float:
+    """
+    Simulates `subpop_model` for `num_days` days with
+        `SubpopModel.simulate_until_day`, and returns total wall time
+        in seconds spent in `SubpopModel.simulate_timesteps` (timed
+        with a `clt.PhaseProfiler`).
+    """
+
+    profiler = clt.PhaseProfiler()
+    profiler.instrument(subpop_model, ["simulate_timesteps"])
+
+    try:
+        subpop_model.simulate_until_day(num_days)
+    finally:
+        clt.remove_instrumentation(subpop_model, ["simulate_timesteps"])
+
+    return profiler.stats[("simulate_timesteps",)][0]
+
+
+def run_benchmark(name: str,
+                  create_run,
+                  num_timesteps: int = None,
+                  num_reps: int = None,
+                  repeats: int = 3,
+                  measure_memory: bool = True,
+                  **benchmark_params) -> dict:
+    """
+    Times a benchmark scenario, and measures its peak memory in a
+        separate run (with `tracemalloc`, which slows down the run).
+
+    Args:
+        name (str):
+            name of scenario.
+        create_run (callable):
+            takes no arguments and returns a new run of the scenario -- a
+            callable that takes no arguments. Setup done by `create_run`
+            (for example, creating models) is not timed. If the run returns
+            a number, it is used as the elapsed time in seconds (so runs can
+            time only part of their work), otherwise the whole run is timed.
+        num_timesteps (Optional[int]):
+            number of timesteps simulated in each run -- if specified,
+            timesteps/sec is reported.
+        num_reps (Optional[int]):
+            number of replications simulated in each run -- if specified,
+            reps/sec is reported.
+        repeats (positive int):
+            number of timed runs -- the fastest run is reported.
+        measure_memory (bool):
+            if True, peak memory allocated by Python (and numpy)
+            during one more run is reported.
+        benchmark_params:
+            scenario settings to report.
+
+    Returns:
+        dict:
+            results of the benchmark.
+    """
+
+    elapsed_times = []
+
+    for _ in range(repeats):
+        run = create_run()
+
+        start = time.perf_counter()
+        elapsed = run()
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+
+        elapsed_times.append(elapsed)
+
+    seconds = min(elapsed_times)
+
+    result = {"name": name,
+              "params": benchmark_params,
+              "seconds": seconds,
+              "seconds_all_repeats": elapsed_times,
+              "timesteps_per_sec": num_timesteps / seconds if num_timesteps else None,
+              "reps_per_sec": num_reps / seconds if num_reps else None,
+              "peak_memory_bytes": None}
+
+    if measure_memory:
+        run = create_run()
+
+        tracemalloc.start()
+        run()
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"{name}: {seconds:.3f} s")
+
+    return result
+
+###########################################################
+################# BENCHMARK SCENARIOS #####################
+###########################################################
+
+
+def benchmark_transition_types(num_days: int,
+                               repeats: int,
+                               measure_memory: bool) -> list:
+    """
+    Times `SubpopModel.simulate_timesteps` for each `clt.TransitionTypes` value.
+    """
+
+    results = []
+
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    for transition_type in clt.TransitionTypes:
+        def create_run():
+            subpop_model = create_synthetic_subpop_model(np.random.default_rng(0),
+                                                         config_updates={"transition_type": transition_type,
+                                                                         "save_daily_history": False})
+            return lambda: time_simulate_timesteps(subpop_model, num_days)
+
+        results.append(run_benchmark(f"simulate_timesteps[{transition_type.value}]",
+                                     create_run,
+                                     num_timesteps=num_days * timesteps_per_day,
+                                     repeats=repeats,
+                                     measure_memory=measure_memory,
+                                     transition_type=transition_type.value,
+                                     num_days=num_days,
+                                     timesteps_per_day=timesteps_per_day))
+
+    return results
+
+
+def benchmark_metapop_num_subpops(nums_subpops: list,
+                                  num_days: int,
+                                  repeats: int,
+                                  measure_memory: bool) -> list:
+    """
+    Times `FluMetapopModel.simulate_until_day` for metapopulation
+        models with each number of synthetic subpopulations in `nums_subpops`.
+        Timesteps/sec counts each subpopulation's timesteps.
+    """
+
+    results = []
+
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    for num_subpops in nums_subpops:
+        def create_run():
+            metapop_model = create_synthetic_metapop_model(num_subpops, seed=num_subpops)
+            return lambda: metapop_model.simulate_until_day(num_days)
+
+        results.append(run_benchmark(f"metapop_simulate_until_day[L={num_subpops}]",
+                                     create_run,
+                                     num_timesteps=num_subpops * num_days * timesteps_per_day,
+                                     repeats=repeats,
+                                     measure_memory=measure_memory,
+                                     num_subpops=num_subpops,
+                                     sparse_travel=num_subpops > max_num_subpops_dense_travel,
+                                     num_days=num_days,
+                                     timesteps_per_day=timesteps_per_day))
+
+    return results
+
+
+def benchmark_experiments(num_reps: int,
+                          num_days: int,
+                          repeats: int,
+                          measure_memory: bool) -> list:
+    """
+    Times `Experiment.run_static_inputs` (with results logged to
+        a SQL database) on a `FluSubpopModel` and on a `FluMetapopModel`
+        with 2 subpopulations, simulating replications one after
+        another and in batches.
+    """
+
+    results = []
+
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    for model_type in ("subpop", "metapop"):
+        for reps_per_batch in (1, num_reps):
+            def create_run():
+                if model_type == "subpop":
+                    model = create_synthetic_subpop_model(np.random.default_rng(0), name="subpop0")
+                else:
+                    model = create_synthetic_metapop_model(2, seed=0)
+
+                def run():
+                    with tempfile.TemporaryDirectory() as dirname:
+                        experiment = clt.Experiment(model,
+                                                    ["S", "IS", "H", "D"],
+                                                    str(Path(dirname) / "results.db"))
+                        experiment.run_static_inputs(num_reps,
+                                                     num_days,
+                                                     days_between_save_history=1,
+                                                     reps_per_batch=reps_per_batch)
+
+                return run
+
+            num_subpops = 1 if model_type == "subpop" else 2
+
+            results.append(run_benchmark(f"experiment_sql[{model_type}, reps_per_batch={reps_per_batch}]",
+                                         create_run,
+                                         num_timesteps=num_reps * num_subpops * num_days * timesteps_per_day,
+                                         num_reps=num_reps,
+                                         repeats=repeats,
+                                         measure_memory=measure_memory,
+                                         model_type=model_type,
+                                         num_subpops=num_subpops,
+                                         reps_per_batch=reps_per_batch,
+                                         num_days=num_days,
+                                         timesteps_per_day=timesteps_per_day))
+
+    return results
+
+
+def benchmark_wastewater(num_days: int,
+                         repeats: int,
+                         measure_memory: bool) -> list:
+    """
+    Times `FluSubpopModel.simulate_until_day` with wastewater
+        disabled, and enabled with each convolution mode.
+    """
+
+    results = []
+
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    for wastewater_enabled, convolution_mode in ((False, None),
+                                                 (True, "direct"),
+                                                 (True, "streaming")):
+        def create_run():
+            wastewater_kwargs = {"wastewater_enabled": wastewater_enabled}
+            if wastewater_enabled:
+                wastewater_kwargs["wastewater_convolution_mode"] = convolution_mode
+
+            subpop_model = create_synthetic_subpop_model(np.random.default_rng(0), **wastewater_kwargs)
+            return lambda: subpop_model.simulate_until_day(num_days)
+
+        name = f"wastewater[{convolution_mode}]" if wastewater_enabled else "wastewater[off]"
+
+        results.append(run_benchmark(name,
+                                     create_run,
+                                     num_timesteps=num_days * timesteps_per_day,
+                                     repeats=repeats,
+                                     measure_memory=measure_memory,
+                                     wastewater_enabled=wastewater_enabled,
+                                     convolution_mode=convolution_mode,
+                                     num_days=num_days,
+                                     timesteps_per_day=timesteps_per_day))
+
+    return results
+
+
+def get_git_commit() -> str | None:
+    """
+    Returns hash of current git commit, or `None` if it is not available.
+    """
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              cwd=Path(__file__).parent,
+                              capture_output=True,
+                              text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+###########################################################
+######################## RUN ##############################
+###########################################################
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark simulation hot paths of the flu model.")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="JSON file in which to save results.")
+    parser.add_argument("--num-days", type=int, default=100,
+                        help="number of simulation days in each scenario.")
+    parser.add_argument("--num-reps", type=int, default=20,
+                        help="number of replications in experiment scenarios.")
+    parser.add_argument("--num-subpops", type=int, nargs="+", default=[2, 50, 500],
+                        help="numbers of synthetic subpopulations in metapopulation scenarios.")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="number of timed runs of each scenario (the fastest is reported).")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not measure peak memory (skips the extra run of each scenario).")
+    parser.add_argument("--quick", action="store_true",
+                        help="short runs for a smoke test -- overrides other settings.")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.num_days, args.num_reps, args.num_subpops, args.repeats = 10, 4, [2, 50], 1
+
+    measure_memory = not args.no_memory
+
+    benchmarks = benchmark_transition_types(args.num_days, args.repeats, measure_memory) + \
+                 benchmark_metapop_num_subpops(args.num_subpops, args.num_days, args.repeats, measure_memory) + \
+                 benchmark_experiments(args.num_reps, args.num_days, args.repeats, measure_memory) + \
+                 benchmark_wastewater(args.num_days, args.repeats, measure_memory)
+
+    results = {"metadata": {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+                            "git_commit": get_git_commit(),
+                            "python_version": platform.python_version(),
+                            "numpy_version": np.__version__,
+                            "platform": platform.platform(),
+                            "settings": vars(args)},
+               "benchmarks": benchmarks}
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    print(pd.DataFrame(benchmarks)[["name", "seconds", "timesteps_per_sec",
+                                    "reps_per_sec", "peak_memory_bytes"]].to_string(index=False))
@@ -60,15 +60,21 @@ jumped_bit_generator = bit_generator.jumped(1)
 #   subpopulation to have different aforementioned values,
 #   we could read in two separate sets of files -- one
 #   for each subpopulation
+# Both subpopulations share the (read-only) parameter arrays of
+#   a SharedParams instance rather than each holding a copy --
+#   values that differ across subpopulations can be passed as
+#   overrides, e.g. shared_params.get_params_dict({"beta_baseline": 10})
+shared_params = clt.SharedParams(params_dict)
+
 north = flu.FluSubpopModel(compartments_epi_metrics_dict,
-                           params_dict,
+                           shared_params.get_params_dict(),
                            config_dict,
                            calendar_df,
                            np.random.Generator(bit_generator),
                            name="north")
 
 south = flu.FluSubpopModel(compartments_epi_metrics_dict,
-                           params_dict,
+                           shared_params.get_params_dict(),
                            config_dict,
                            calendar_df,
                            np.random.Generator(jumped_bit_generator),
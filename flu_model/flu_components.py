@@ -1,19 +1,43 @@
+from __future__ import annotations
+
 import datetime
 import copy
+import hashlib
+import weakref
 
 import numpy as np
-import pandas as pd
-import sciris as sc
 
 from dataclasses import dataclass
 from typing import Optional
 from pathlib import Path
 
 import clt_base as clt
+from clt_base.utils import lazy_import, pd, sc
+
+# scipy is only needed for sparse travel proportions (or sewershed
+#   membership) and for FFT convolution of wastewater -- scipy.sparse
+#   is imported in the sparse-only code paths (see `check_is_sparse`),
+#   and scipy.signal is loaded when first used
+signal = lazy_import("scipy.signal")
 
 base_path = Path(__file__).parent.parent / "flu_demo_input_files"
 
 
+def check_is_sparse(array) -> bool:
+    """
+    Returns True if `array` is a scipy sparse matrix or array --
+        without importing scipy if `array` is not one
+        (scipy.sparse is always loaded if `array` is one).
+    """
+
+    if not type(array).__module__.startswith("scipy.sparse"):
+        return False
+
+    from scipy import sparse
+
+    return sparse.issparse(array)
+
+
 # Note: for dataclasses, Optional is used to help with static type checking
 # -- it means that an attribute can either hold a value with the specified
 # datatype or it can be None
@@ -326,8 +350,8 @@ class RecoveredToSusceptible(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       params.R_to_S_rate)
+        return params.R_to_S_rate * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class ExposedToAsymp(clt.TransitionVariable):
@@ -344,8 +368,8 @@ class ExposedToAsymp(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       params.E_to_I_rate * params.E_to_IA_prop)
+        return params.E_to_I_rate * params.E_to_IA_prop * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class ExposedToPresymp(clt.TransitionVariable):
@@ -362,8 +386,8 @@ class ExposedToPresymp(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       params.E_to_I_rate * (1 - params.E_to_IA_prop))
+        return params.E_to_I_rate * (1 - params.E_to_IA_prop) * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class PresympToSymp(clt.TransitionVariable):
@@ -376,8 +400,8 @@ class PresympToSymp(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       params.IP_to_IS_rate)
+        return params.IP_to_IS_rate * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class SympToRecovered(clt.TransitionVariable):
@@ -394,8 +418,8 @@ class SympToRecovered(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       (1 - params.IS_to_H_adjusted_prop) * params.IS_to_R_rate)
+        return (1 - params.IS_to_H_adjusted_prop) * params.IS_to_R_rate * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class AsympToRecovered(clt.TransitionVariable):
@@ -408,8 +432,8 @@ class AsympToRecovered(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       params.IA_to_R_rate)
+        return params.IA_to_R_rate * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class HospToRecovered(clt.TransitionVariable):
@@ -426,8 +450,8 @@ class HospToRecovered(clt.TransitionVariable):
     def get_current_rate(self,
                          state: FluSubpopState,
                          params: FluSubpopParams) -> np.ndarray:
-        return np.full((params.num_age_groups, params.num_risk_groups),
-                       (1 - params.H_to_D_adjusted_prop) * params.H_to_R_rate)
+        return (1 - params.H_to_D_adjusted_prop) * params.H_to_R_rate * \
+               np.ones((params.num_age_groups, params.num_risk_groups))
 
 
 class SympToHosp(clt.TransitionVariable):
@@ -568,12 +592,251 @@ class PopulationImmunityInf(clt.EpiMetric):
         return np.asarray(final_change, dtype=np.float64)
 
 
+def compute_viral_load_overlap_add(viral_shedding: np.ndarray,
+                                   S_to_E_history: np.ndarray) -> np.ndarray:
+    """
+    Computes viral load on every timestep of an exposed inflow
+        history in one pass, using overlap-add FFT convolution --
+        for example, to recompute wastewater viral loads post-hoc
+        from S_to_E recorded on every timestep (see
+        `Wastewater.compute_viral_load_history`), or for other
+        shedding parameters.
+
+    Args:
+        viral_shedding (np.ndarray of nonnegative floats):
+            1D viral shedding kernel in the same (reversed in time)
+            order as `Wastewater.viral_shedding` and
+            `compute_viral_shedding_kernel` -- the last element is
+            the shedding (per exposed person) on the timestep of exposure.
+        S_to_E_history (np.ndarray of nonnegative floats):
+            array whose first axis is time (in timesteps) and holds
+            the number of newly exposed people on each timestep --
+            any other axes (for example, batched replications or
+            age-risk groups) are convolved independently.
+
+    Returns:
+        np.ndarray:
+            array of the same shape as `S_to_E_history` whose
+            element t is the viral load on timestep t -- equal to
+            what `Wastewater` computes timestep by timestep.
+    """
+
+    S_to_E_history = np.asarray(S_to_E_history, dtype=float)
+
+    if len(S_to_E_history) == 0:
+        return np.zeros(np.shape(S_to_E_history))
+
+    # Kernel is reversed into time order (element k is the shedding
+    #   k timesteps after exposure), and needs as many axes as the
+    #   history for convolution along axis 0
+    kernel = np.reshape(np.asarray(viral_shedding)[::-1],
+                        (-1,) + (1,) * (S_to_E_history.ndim - 1))
+
+    return signal.oaconvolve(S_to_E_history, kernel, axes=0)[:len(S_to_E_history)]
+
+
+# Viral shedding kernels shared by all `Wastewater` instances --
+#   keys are (viral_shed_duration, viral_shed_magnitude, viral_shed_peak,
+#   viral_shed_feces_mass, timesteps_per_day) tuples
+viral_shedding_kernels_cache = {}
+
+
+def compute_viral_shedding_kernel(viral_shed_duration: float,
+                                  viral_shed_magnitude: float,
+                                  viral_shed_peak: float,
+                                  viral_shed_feces_mass: float,
+                                  timesteps_per_day: int) -> np.ndarray:
+    """
+    Computes viral shedding per exposed person on each timestep of
+        the shedding duration, integrating the log10 viral shedding curve
+        magnitude * t / (peak ** 2 + t ** 2) (with t in days since exposure)
+        with the trapezoidal rule over each timestep. On the first
+        timestep, only the right endpoint is counted.
+
+    Returns:
+        np.ndarray:
+            1D array of length int(viral_shed_duration * timesteps_per_day)
+            -- REVERSED in time, so that the last element is the shedding
+            on the timestep of exposure, which is the order
+            `Wastewater.update_current_val` uses in its dot product.
+    """
+
+    time_idx = np.arange(int(viral_shed_duration * timesteps_per_day))
+    timesteps_per_day = np.float64(timesteps_per_day)
+
+    cur_time_point = time_idx / timesteps_per_day
+    next_time_point = (time_idx + 1) / timesteps_per_day
+
+    cur_time_viral_shedding = 10 ** (viral_shed_magnitude * cur_time_point /
+                                     (viral_shed_peak ** 2 + cur_time_point ** 2))
+    next_time_viral_shedding = 10 ** (viral_shed_magnitude * next_time_point /
+                                      (viral_shed_peak ** 2 + next_time_point ** 2))
+
+    # Trapezoidal integral -- the left endpoint is left out on the first timestep
+    cur_time_viral_shedding[:1] = 0
+
+    viral_shedding = viral_shed_feces_mass * 0.5 * \
+                     (cur_time_viral_shedding + next_time_viral_shedding) / timesteps_per_day
+
+    return viral_shedding[::-1].copy()
+
+
+def get_viral_shedding_kernel(viral_shed_duration: float,
+                              viral_shed_magnitude: float,
+                              viral_shed_peak: float,
+                              viral_shed_feces_mass: float,
+                              timesteps_per_day: int) -> np.ndarray:
+    """
+    Returns read-only viral shedding kernel from
+        `viral_shedding_kernels_cache`, computing it with
+        `compute_viral_shedding_kernel` only for new parameter values --
+        so the kernel is computed once per distinct set of parameters
+        across replications and subpopulations.
+
+    See `compute_viral_shedding_kernel` for arguments and return value.
+    """
+
+    key = (float(viral_shed_duration),
+           float(viral_shed_magnitude),
+           float(viral_shed_peak),
+           float(viral_shed_feces_mass),
+           int(timesteps_per_day))
+
+    if key not in viral_shedding_kernels_cache:
+        viral_shedding = compute_viral_shedding_kernel(*key)
+        viral_shedding.flags.writeable = False
+        viral_shedding_kernels_cache[key] = viral_shedding
+
+    return viral_shedding_kernels_cache[key]
+
+
+def get_zeroed_buffer(buffer: Optional[np.ndarray],
+                      shape: tuple) -> np.ndarray:
+    """
+    Returns `buffer` filled with zeros in-place if it has the
+        given shape, and otherwise returns a new array of zeros --
+        so that buffers are not reallocated for every replication.
+    """
+
+    if buffer is not None and np.shape(buffer) == shape:
+        buffer.fill(0)
+        return buffer
+
+    return np.zeros(shape)
+
+
 # test on the wastewater viral load simulation
 class Wastewater(clt.EpiMetric):
+    """
+    Wastewater viral load -- discrete convolution of the number
+        of newly exposed people per timestep with the viral
+        shedding kernel.
+
+    Attributes:
+        S_to_E (SusceptibleToExposed):
+            SusceptibleToExposed TransitionVariable in the SubpopModel.
+        S_to_E_history (np.ndarray):
+            "direct" mode only -- ring buffer with the number of newly
+            exposed people on the last `len(viral_shedding)` timesteps
+            (the number on timestep t is in slot t % `len(viral_shedding)`),
+            so memory is bounded by the kernel length for any
+            simulation horizon.
+        S_to_E_timesteps_history (clt.HistoryBuffer):
+            if `record_S_to_E_timesteps` is True, the number of newly
+            exposed people on every timestep simulated since the
+            last reset (summed over age-risk groups, unless
+            `age_risk_resolved`) -- see `self.compute_viral_load_history`.
+            Empty otherwise.
+        convolution_mode (str):
+            either "direct" or "streaming".
+            If "direct", each timestep computes the dot product of the
+            shedding kernel with the S_to_E history window, so each
+            timestep costs O(kernel length).
+            If "streaming", each day's exposed inflow is convolved
+            with the kernel once via FFT (uniformly partitioned
+            overlap-add) and its contributions to future timesteps are
+            kept in `pending_viral_load`, so each timestep only
+            costs O(`timesteps_per_day`) plus the amortized
+            per-day FFT, and no S_to_E history is stored.
+        pending_viral_load (np.ndarray):
+            "streaming" mode only -- element j is the viral load
+            accumulated so far for timestep j of the current day
+            (and of the following days, for j >= `timesteps_per_day`).
+        day_S_to_E (np.ndarray):
+            "streaming" mode only -- number of newly exposed people
+            on each timestep of the current day.
+        kernel_fft (np.ndarray):
+            "streaming" mode only -- FFT of the time-ordered
+            viral shedding kernel, padded to `fft_len`.
+        fft_len (int):
+            "streaming" mode only -- FFT length for one day of
+            exposed inflow convolved with the kernel.
+
+    See `__init__` docstring for other attributes.
+    """
+
+    # Viral shedding kernel is not saved -- it is looked up again from
+    #   the saved viral shedding parameters when restoring a snapshot
+    snapshot_attrs_names = ("current_val",
+                            "flag_preprocessed",
+                            "viral_shed_duration",
+                            "viral_shed_magnitude",
+                            "viral_shed_peak",
+                            "viral_shed_feces_mass",
+                            "num_timesteps",
+                            "S_to_E_history",
+                            "S_to_E_timesteps_history",
+                            "cur_time_stamp",
+                            "val_list_len",
+                            "current_val_list",
+                            "cur_idx_timestep",
+                            "pending_viral_load",
+                            "day_S_to_E",
+                            "kernel_fft",
+                            "fft_len")
+
+    def __init__(self,
+                 init_val,
+                 S_to_E,
+                 convolution_mode: str = "direct",
+                 age_risk_resolved: bool = False,
+                 record_S_to_E_timesteps: bool = False):
+        """
+        Args:
+            init_val (np.ndarray | float):
+                initial value of wastewater viral load.
+            S_to_E (SusceptibleToExposed):
+                SusceptibleToExposed TransitionVariable in the SubpopModel.
+            convolution_mode (str):
+                either "direct" (default) or "streaming" --
+                see class docstring.
+            age_risk_resolved (bool):
+                if True, viral load is kept separately for each
+                age-risk group (|A| x |R| values per day) instead of
+                summed over age-risk groups (one value per day).
+            record_S_to_E_timesteps (bool):
+                if True, records the number of newly exposed people
+                on every timestep in `self.S_to_E_timesteps_history`, so
+                that viral loads can be recomputed post-hoc (see
+                `self.compute_viral_load_history`). Memory then grows
+                with the simulation horizon, so it is False by default.
+        """
 
-    def __init__(self, init_val, S_to_E):
         super().__init__(init_val)
         self.S_to_E = S_to_E
+        self.age_risk_resolved = age_risk_resolved
+        self.record_S_to_E_timesteps = record_S_to_E_timesteps
+        self.S_to_E_timesteps_history = clt.HistoryBuffer()
+
+        if convolution_mode not in ("direct", "streaming"):
+            raise clt.SubpopModelError("Wastewater convolution_mode must be "
+                                       "\"direct\" or \"streaming\".")
+
+        self.convolution_mode = convolution_mode
+        self.pending_viral_load = None
+        self.day_S_to_E = None
+        self.kernel_fft = None
+        self.fft_len = None
         # preprocess
         self.flag_preprocessed = False
         self.viral_shedding = []
@@ -581,8 +844,7 @@ class Wastewater(clt.EpiMetric):
         self.viral_shed_magnitude = None
         self.viral_shed_peak = None
         self.viral_shed_feces_mass = None
-        self.S_to_E_len = 5000  # preset to match the simulation time horizon
-        self.S_to_E_history = np.zeros(self.S_to_E_len)
+        self.S_to_E_history = None
         self.cur_time_stamp = -1
         self.num_timesteps = None
         self.val_list_len = None
@@ -595,7 +857,8 @@ class Wastewater(clt.EpiMetric):
                                   num_timesteps: int):
         if not self.flag_preprocessed:  # preprocess the viral shedding function if not done yet
             self.val_list_len = num_timesteps
-            self.current_val_list = np.zeros(self.val_list_len)
+            val_shape = np.shape(state.S) if self.age_risk_resolved else np.shape(state.S)[:-2]
+            self.current_val_list = np.zeros((self.val_list_len,) + val_shape)
             self.preprocess(params, num_timesteps)
         return 0
 
@@ -605,56 +868,211 @@ class Wastewater(clt.EpiMetric):
             in-place.
         """
         # record number of exposed people per day
+        # sum over age-risk groups only (unless age-risk resolved) -- any
+        #   leading axis holds batched replications, which are tracked separately
         self.cur_time_stamp += 1
-        self.S_to_E_history[self.cur_time_stamp] = np.sum(self.S_to_E.current_val)
-        current_val = 0
+
+        if self.age_risk_resolved:
+            num_exposed = np.array(self.S_to_E.current_val, dtype=float)
+        else:
+            num_exposed = np.sum(self.S_to_E.current_val, axis=(-2, -1))
+
+        if self.record_S_to_E_timesteps:
+            self.S_to_E_timesteps_history.append(num_exposed)
+
+        if self.convolution_mode == "streaming":
+            current_val = self.get_streaming_current_val(num_exposed)
+            self.current_val = current_val
+            self.cur_idx_timestep = (self.cur_idx_timestep + 1) % self.val_list_len
+            self.current_val_list[self.cur_idx_timestep] = current_val
+            return
 
         # attribute access shortcut
         cur_time_stamp = self.cur_time_stamp
+        viral_shedding = self.viral_shedding
+        len_kernel = len(viral_shedding)
 
-        # discrete convolution
-        len_duration = self.viral_shed_duration * self.num_timesteps
+        if cur_time_stamp == 0:
+            self.S_to_E_history = get_zeroed_buffer(self.S_to_E_history,
+                                                    (len_kernel,) + np.shape(num_exposed))
 
-        if self.cur_time_stamp >= len_duration - 1:
-            current_val = self.S_to_E_history[
-                          (cur_time_stamp - len_duration + 1):(cur_time_stamp + 1)] @ self.viral_shedding
-        else:
-            current_val = self.S_to_E_history[
-                          :(cur_time_stamp + 1)] @ self.viral_shedding[-(cur_time_stamp + 1):]
+        S_to_E_history = self.S_to_E_history
+        S_to_E_history[cur_time_stamp % len_kernel] = num_exposed
+
+        # discrete convolution
+        # slot (cur_time_stamp + 1) % len_kernel holds the oldest exposed
+        #   inflow in the window, which is weighted by viral_shedding[0] --
+        #   slots for timesteps before the start of the simulation hold zeros
+        # contracting the kernel with the first axis of S_to_E_history applies the
+        #   convolution along the time axis for any batched or age-risk axes
+        oldest_slot = (cur_time_stamp + 1) % len_kernel
+
+        current_val = np.tensordot(viral_shedding[:len_kernel - oldest_slot],
+                                   S_to_E_history[oldest_slot:], axes=1) + \
+                      np.tensordot(viral_shedding[len_kernel - oldest_slot:],
+                                   S_to_E_history[:oldest_slot], axes=1)
 
         self.current_val = current_val
-        self.cur_idx_timestep += 1
+        self.cur_idx_timestep = (self.cur_idx_timestep + 1) % self.val_list_len
         self.current_val_list[self.cur_idx_timestep] = current_val
 
+    def get_streaming_current_val(self,
+                                  num_exposed: np.ndarray | float) -> np.ndarray | float:
+        """
+        Returns viral load on the current timestep in "streaming"
+            mode, adding the contributions of `num_exposed` to the rest
+            of the current day directly, and, on the last timestep of
+            the day, adding the contributions of the whole day's exposed
+            inflow to the following days with one FFT convolution.
+
+        Args:
+            num_exposed (np.ndarray | float):
+                number of newly exposed people on the current timestep
+                (with a leading axis for batched replications, if any).
+
+        Returns:
+            np.ndarray | float:
+                viral load on the current timestep.
+        """
+
+        timesteps_per_day = self.num_timesteps
+        kernel = self.viral_shedding[::-1]
+        len_kernel = len(kernel)
+        day_timestep = self.cur_time_stamp % timesteps_per_day
+
+        if self.cur_time_stamp == 0:
+            self.fft_len = 1 << int(np.ceil(np.log2(timesteps_per_day + len_kernel - 1)))
+            self.kernel_fft = np.fft.rfft(kernel, n=self.fft_len)
+            self.pending_viral_load = \
+                get_zeroed_buffer(self.pending_viral_load,
+                                  (timesteps_per_day + len_kernel,) + np.shape(num_exposed))
+            self.day_S_to_E = get_zeroed_buffer(self.day_S_to_E,
+                                                (timesteps_per_day,) + np.shape(num_exposed))
+
+        pending_viral_load = self.pending_viral_load
+
+        # Contributions to the remaining timesteps of the current day
+        num_remaining = min(timesteps_per_day - day_timestep, len_kernel)
+        pending_viral_load[day_timestep:day_timestep + num_remaining] += \
+            np.multiply.outer(kernel[:num_remaining], num_exposed)
+
+        current_val = copy.deepcopy(pending_viral_load[day_timestep])
+
+        self.day_S_to_E[day_timestep] = num_exposed
+
+        if day_timestep == timesteps_per_day - 1:
+            day_convolution = np.fft.irfft(
+                np.fft.rfft(self.day_S_to_E, n=self.fft_len, axis=0) *
+                np.reshape(self.kernel_fft, (-1,) + (1,) * (self.day_S_to_E.ndim - 1)),
+                n=self.fft_len, axis=0)
+
+            # Contributions to the following days -- the current day's
+            #   contributions were already added timestep by timestep
+            num_later = timesteps_per_day + len_kernel - 1
+            pending_viral_load[timesteps_per_day:num_later] += \
+                day_convolution[timesteps_per_day:num_later]
+
+            # Shift so that index 0 is the first timestep of the next day
+            pending_viral_load[:-timesteps_per_day] = pending_viral_load[timesteps_per_day:]
+            pending_viral_load[-timesteps_per_day:] = 0
+
+        return current_val
+
     def preprocess(self,
                    params: FluSubpopParams,
                    num_timesteps: int):
+        """
+        Stores the viral shedding parameters and gets the viral
+            shedding kernel for these parameters -- computed once per
+            distinct set of parameters (see `get_viral_shedding_kernel`).
+            Sets `self.flag_preprocessed` to True so that this is done
+            once per simulation rather than every timestep.
+        """
+
         # store the parameters locally
         self.viral_shed_duration = copy.deepcopy(params.viral_shed_duration)
         self.viral_shed_magnitude = copy.deepcopy(params.viral_shed_magnitude)
         self.viral_shed_peak = copy.deepcopy(params.viral_shed_peak)
         self.viral_shed_feces_mass = copy.deepcopy(params.viral_shed_feces_mass)
         self.num_timesteps = copy.deepcopy(num_timesteps)
-        num_timesteps = np.float64(num_timesteps)
-        self.viral_shedding = []
-        # trapezoidal integral
-        for time_idx in range(int(params.viral_shed_duration * self.num_timesteps)):
-            cur_time_point = time_idx / num_timesteps
-            next_time_point = (time_idx + 1) / num_timesteps
-            next_time_log_viral_shedding = params.viral_shed_magnitude * next_time_point / \
-                                           (params.viral_shed_peak ** 2 + next_time_point ** 2)
-            if time_idx == 0:
-                interval_viral_shedding = params.viral_shed_feces_mass * 0.5 * (
-                        10 ** next_time_log_viral_shedding) / num_timesteps
-            else:
-                cur_time_log_viral_shedding = params.viral_shed_magnitude * cur_time_point / \
-                                              (params.viral_shed_peak ** 2 + cur_time_point ** 2)
-                interval_viral_shedding = params.viral_shed_feces_mass * 0.5 \
-                                          * (
-                                                  10 ** cur_time_log_viral_shedding + 10 ** next_time_log_viral_shedding) / num_timesteps
-            self.viral_shedding.append(interval_viral_shedding)
-        self.viral_shedding.reverse()
-        self.viral_shedding = np.array(self.viral_shedding)
+
+        self.viral_shedding = get_viral_shedding_kernel(params.viral_shed_duration,
+                                                        params.viral_shed_magnitude,
+                                                        params.viral_shed_peak,
+                                                        params.viral_shed_feces_mass,
+                                                        num_timesteps)
+
+        self.flag_preprocessed = True
+
+    def restore_snapshot(self,
+                         snapshot: dict) -> None:
+        """
+        Restores viral shedding bookkeeping and buffers saved by
+            `self.get_snapshot`, and gets the viral shedding kernel
+            for the restored parameters (see `get_viral_shedding_kernel`).
+        """
+
+        super().restore_snapshot(snapshot)
+
+        if self.flag_preprocessed:
+            self.viral_shedding = get_viral_shedding_kernel(self.viral_shed_duration,
+                                                            self.viral_shed_magnitude,
+                                                            self.viral_shed_peak,
+                                                            self.viral_shed_feces_mass,
+                                                            self.num_timesteps)
+        else:
+            self.viral_shedding = []
+
+    def get_daily_viral_load(self) -> np.ndarray | float:
+        """
+        Returns viral load accumulated during the current (or most
+            recently simulated) day.
+        """
+
+        return np.sum(self.current_val_list, axis=0)
+
+    def compute_viral_load_history(self,
+                                   daily: bool = False) -> np.ndarray:
+        """
+        Recomputes viral loads since the last reset post-hoc from
+            `self.S_to_E_timesteps_history` with one overlap-add FFT
+            convolution (see `compute_viral_load_overlap_add`) --
+            for example, to check or compare against the viral loads
+            computed during the simulation.
+
+        Args:
+            daily (bool):
+                if True, returns viral loads summed over the timesteps
+                of each simulated day, like `self.history_vals_list`.
+                Otherwise, returns the viral load on every timestep.
+
+        Returns:
+            np.ndarray:
+                array whose leading axis is timesteps (or days, if `daily`).
+
+        Raises:
+            SubpopModelError:
+                if `self.record_S_to_E_timesteps` is False.
+        """
+
+        if not self.record_S_to_E_timesteps:
+            raise clt.SubpopModelError("Viral load history can only be recomputed "
+                                       "if Wastewater records S_to_E on every timestep -- "
+                                       "set record_S_to_E_timesteps to True.")
+
+        S_to_E_timesteps_history = self.S_to_E_timesteps_history.as_array()
+
+        if len(S_to_E_timesteps_history) == 0:
+            return S_to_E_timesteps_history
+
+        viral_load_history = compute_viral_load_overlap_add(self.viral_shedding,
+                                                            S_to_E_timesteps_history)
+
+        if daily:
+            return viral_load_history.reshape((-1, self.num_timesteps) +
+                                              viral_load_history.shape[1:]).sum(axis=1)
+
+        return viral_load_history
 
     def save_history(self) -> None:
         """
@@ -662,28 +1080,33 @@ class Wastewater(clt.EpiMetric):
             to history_vals_list in place
 
         """
-        daily_viral_load = np.sum(self.current_val_list)
+        daily_viral_load = self.get_daily_viral_load()
         self.history_vals_list.append(daily_viral_load)
         # reset the index of current_val_list
         self.cur_idx_timestep = -1
 
     def reset(self) -> None:
         """
-        Resets history_vals_list attribute to empty list.
+        Clears history_vals_list attribute and resets
+            viral shedding bookkeeping.
         """
+        super().reset()
+        self.S_to_E_timesteps_history.clear()
         self.flag_preprocessed = False
         self.viral_shedding = []
         self.viral_shed_duration = None
         self.viral_shed_magnitude = None
         self.viral_shed_peak = None
         self.viral_shed_feces_mass = None
-        self.S_to_E_len = 5000  # preset to match the simulation time horizon
-        self.S_to_E_history = np.zeros(self.S_to_E_len)
+        # S_to_E_history, pending_viral_load, and day_S_to_E are kept so that
+        #   the next simulation can reuse them -- they are zeroed on its first timestep
         self.cur_time_stamp = -1
         self.num_timesteps = None
         self.val_list_len = None
         self.current_val_list = None
         self.cur_idx_timestep = -1
+        self.kernel_fft = None
+        self.fft_len = None
 
 
 class BetaReduct(clt.DynamicVal):
@@ -700,6 +1123,8 @@ class BetaReduct(clt.DynamicVal):
     TODO: replace with realistic function.
     """
 
+    snapshot_attrs_names = ("current_val", "permanent_lockdown")
+
     def __init__(self, init_val, is_enabled):
         super().__init__(init_val, is_enabled)
         self.permanent_lockdown = False
@@ -755,26 +1180,96 @@ class AbsoluteHumidity(clt.Schedule):
     and lower in the winter in the US).
     """
 
+    # Only depends on the date
+    timeline_params_names = ()
+
     def update_current_val(self,
                            subpop_params: FluSubpopParams,
                            current_date: datetime.date) -> None:
         self.current_val = absolute_humidity_func(current_date)
 
 
+# Compiled calendars, keyed by id of calendar_df -- see compile_calendar
+#   Each value is a (weak reference to calendar_df, compiled calendar) tuple,
+#   so that SubpopModel instances that use the same calendar_df share
+#   one compiled calendar -- entries are removed when their calendar_df
+#   is garbage collected
+compiled_calendars_cache = {}
+
+
+def compile_calendar(calendar_df: pd.DataFrame) -> tuple[datetime.date, np.ndarray]:
+    """
+    Converts calendar_df into an array indexed by days since the
+        first date in calendar_df, so that looking up the type of a
+        given day is a single array index rather than a DataFrame filter.
+        Results are cached, so each calendar_df is only compiled once --
+        so calendar_df must not be edited in place after it is first
+        compiled (create a new DataFrame for a different calendar).
+
+    Args:
+        calendar_df (pd.DataFrame):
+            has a "date" column (datetime.date or strings in format "YYYY-MM-DD")
+            and columns "is_school_day" and "is_work_day" (bool or 0/1).
+
+    Returns:
+        tuple[datetime.date, np.ndarray]:
+            first date in calendar_df, and (number of days from first to last
+            date) x 2 array whose row d holds "is_school_day" and "is_work_day"
+            for the date d days after the first date -- rows for dates that are
+            not in calendar_df are NaN.
+    """
+
+    cached = compiled_calendars_cache.get(id(calendar_df))
+
+    if cached is not None and cached[0]() is calendar_df:
+        return cached[1]
+
+    dates = pd.to_datetime(pd.Series(calendar_df["date"]).astype(str), format="%Y-%m-%d").dt.date
+
+    start_date = min(dates)
+    day_indices = np.asarray([(date - start_date).days for date in dates])
+
+    day_types_array = np.full((np.max(day_indices) + 1, 2), np.nan)
+    day_types_array[day_indices] = \
+        np.column_stack((np.asarray(calendar_df["is_school_day"], dtype=float),
+                         np.asarray(calendar_df["is_work_day"], dtype=float)))
+
+    compiled_calendar = (start_date, day_types_array)
+
+    compiled_calendars_cache[id(calendar_df)] = (weakref.ref(calendar_df), compiled_calendar)
+
+    weakref.finalize(calendar_df, compiled_calendars_cache.pop, id(calendar_df), None)
+
+    return compiled_calendar
+
+
 class FluContactMatrix(clt.Schedule):
     """
     Flu contact matrix.
 
     Attributes:
-        timeseries_df (pd.DataFrame):
+        calendar_df (pd.DataFrame):
             has a "date" column with strings in format "YYYY-MM-DD"
             of consecutive calendar days, and other columns
             named "is_school_day" (bool) and "is_work_day" (bool)
-            corresponding to type of day.
+            corresponding to type of day. Must not be edited in place
+            after the model is created -- see compile_calendar.
+        calendar_start_date (datetime.date):
+            first date in calendar_df.
+        day_types_array (np.ndarray):
+            calendar_df compiled into an array indexed by days since
+            calendar_start_date -- see compile_calendar.
+        timeline_key (tuple):
+            (calendar_start_date, hash of day_types_array) tuple
+            returned by get_timeline_key.
 
     See parent class docstring for other attributes.
     """
 
+    timeline_params_names = ("total_contact_matrix",
+                             "school_contact_matrix",
+                             "work_contact_matrix")
+
     def __init__(self,
                  init_val: Optional[np.ndarray | float] = None,
                  calendar_df: pd.DataFrame = None):
@@ -783,20 +1278,35 @@ class FluContactMatrix(clt.Schedule):
 
         self.calendar_df = calendar_df
 
+        self.calendar_start_date, self.day_types_array = compile_calendar(calendar_df)
+
+        # Calendar does not change after the model is created (see compile_calendar),
+        #   so it is hashed once rather than every time a timeline is looked up
+        self.timeline_key = (self.calendar_start_date,
+                             hashlib.sha1(self.day_types_array.tobytes()).hexdigest())
+
+    def get_timeline_key(self) -> tuple:
+        return self.timeline_key
+
     def update_current_val(self,
                            subpop_params: FluSubpopParams,
                            current_date: datetime.date) -> None:
 
-        df = self.calendar_df
+        day_index = (current_date - self.calendar_start_date).days
 
-        try:
-            current_row = df[df["date"] == current_date].iloc[0]
-        except IndexError:
-            print(f"Error: {current_date} is not in the Calendar's calendar_df.")
+        if 0 <= day_index < len(self.day_types_array):
+            is_school_day, is_work_day = self.day_types_array[day_index]
+        else:
+            is_school_day = is_work_day = np.nan
+
+        if np.isnan(is_school_day) or np.isnan(is_work_day):
+            raise clt.SubpopModelError(f"{current_date} is not in the calendar_df of "
+                                       f"FluContactMatrix -- the calendar must include "
+                                       f"every simulated date.")
 
         self.current_val = subpop_params.total_contact_matrix - \
-                           (1 - current_row["is_school_day"]) * subpop_params.school_contact_matrix - \
-                           (1 - current_row["is_work_day"]) * subpop_params.work_contact_matrix
+                           (1 - is_school_day) * subpop_params.school_contact_matrix - \
+                           (1 - is_work_day) * subpop_params.work_contact_matrix
 
 
 def compute_wtd_presymp_asymp(subpop_state: FluSubpopState,
@@ -818,9 +1328,9 @@ def compute_wtd_presymp_asymp(subpop_state: FluSubpopState,
 
     # sum over risk groups
     wtd_IP = \
-        subpop_params.IP_relative_inf * np.sum(subpop_state.IP, axis=1, keepdims=True)
+        subpop_params.IP_relative_inf * np.sum(subpop_state.IP, axis=-1, keepdims=True)
     wtd_IA = \
-        subpop_params.IA_relative_inf * np.sum(subpop_state.IA, axis=1, keepdims=True)
+        subpop_params.IA_relative_inf * np.sum(subpop_state.IA, axis=-1, keepdims=True)
 
     return wtd_IP + wtd_IA
 
@@ -891,6 +1401,28 @@ def compute_pop_by_age(subpop_params: FluSubpopParams) -> np.ndarray:
     return np.sum(subpop_params.total_pop_age_risk, axis=1, keepdims=True)
 
 
+def matmul_subpop_vals(travel_matrix: np.ndarray,
+                       subpop_vals: np.ndarray) -> np.ndarray:
+    """
+    Multiplies |M| x |L| `travel_matrix` (dense or scipy sparse -- usually
+        square, with |M| = |L|) with stacked per-subpopulation values
+        `subpop_vals`, whose leading axis corresponds to subpopulations --
+        element m of the result is the sum over l of `travel_matrix[m, l]`
+        times `subpop_vals[l]`. Trailing axes are flattened so that sparse
+        matrices only do work proportional to their number of nonzero elements.
+
+    Returns:
+        np.ndarray:
+            same shape as `subpop_vals`, except for the leading axis,
+            which has length |M|.
+    """
+
+    num_subpops = np.shape(subpop_vals)[0]
+
+    return np.asarray(travel_matrix @ subpop_vals.reshape(num_subpops, -1)).reshape(
+        (np.shape(travel_matrix)[0],) + np.shape(subpop_vals)[1:])
+
+
 class FluInterSubpopRepo(clt.InterSubpopRepo):
     """
     Holds collection of SubpopState instances, with
@@ -908,12 +1440,18 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
             the name of the subpopulation and the row/column position in
             travel_proportions_array (and other associated indices used for
             intermediate computation on this class).
-        travel_proportions_array (np.ndarray):
+        travel_proportions_array (np.ndarray | scipy.sparse.csr_array):
             |L| x |L| array, where |L| is the number of subpopulations
             (associated SubpopModel instances). Element i,j corresponds to
             proportion of subpopulation i that travels to subpopulation j
             (elements must be in [0,1]). The mapping of subpopulations is given by
-            subpop_names_mapping.
+            subpop_names_mapping. May be a scipy sparse matrix/array (stored in
+            CSR format), in which case memory and daily computation scale with
+            the number of nonzero travel proportions rather than |L|^2.
+        travel_proportions_between_subpops (np.ndarray | scipy.sparse.csr_array):
+            same as travel_proportions_array, but with the diagonal (residents
+            traveling within their own subpopulation) set to 0 -- sparse if
+            travel_proportions_array is sparse.
         sum_prop_residents_traveling_out_array (np.ndarray):
             |L| x 1 array, where |L| is the number of subpopulations (associated
             SubpopModel instances). Element l is the  sum of the proportion of
@@ -942,11 +1480,19 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
         super().__init__(subpop_models)
 
         self.subpop_names_mapping = subpop_names_mapping
+
+        if check_is_sparse(travel_proportions_array):
+            from scipy import sparse
+            travel_proportions_array = sparse.csr_array(travel_proportions_array)
+
         self.travel_proportions_array = travel_proportions_array
 
         self.sum_prop_residents_traveling_out_array = \
             self.compute_sum_prop_residents_traveling_out()
 
+        self.travel_proportions_between_subpops = \
+            self.compute_travel_proportions_between_subpops()
+
         #   This attribute will be set to an array using method compute_shared_quantities()
         #   during the associated MetapopModel's simulate_until_day() method.
         self.force_of_infection_array = None
@@ -954,31 +1500,119 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
     def compute_shared_quantities(self):
         """
         Updates force_of_infection_array attribute in-place.
+
+        All subpopulations are handled at once -- per-subpopulation
+        quantities are stacked into arrays whose leading axis corresponds
+        to subpopulations (ordered according to subpop_names_mapping), and
+        sums over other subpopulations are matrix products with
+        travel_proportions_between_subpops (travel_proportions_array with
+        its diagonal removed, because residents traveling within their home
+        subpopulation are handled by the home region movement term). Gives the same force of
+        infection as summing inf_from_home_region_movement, inf_from_visitors,
+        and inf_from_residents_traveling for each subpopulation, without
+        looping over pairs of subpopulations.
         """
 
-        force_of_infection_array = []
+        stack = self.stack_subpop_vals
+
+        common_coeff = stack(lambda subpop_model: compute_common_coeff_force_of_infection(subpop_model.state,
+                                                                                         subpop_model.params))
+        wtd_no_symp_by_age = stack(lambda subpop_model: compute_wtd_presymp_asymp(subpop_model.state,
+                                                                                 subpop_model.params))
+        symp_by_age = stack(lambda subpop_model: np.sum(subpop_model.state.IS, axis=-1, keepdims=True))
+        effective_pop_by_age = stack(lambda subpop_model: compute_pop_by_age(subpop_model.params))
+
+        contact_matrix = stack(lambda subpop_model: subpop_model.state.flu_contact_matrix)
+        prop_time_away_by_age = stack(lambda subpop_model: subpop_model.params.prop_time_away_by_age)
+        contact_mult_symp = stack(lambda subpop_model: subpop_model.params.contact_mult_symp)
+        contact_mult_travel = stack(lambda subpop_model: subpop_model.params.contact_mult_travel)
+
+        sum_prop_residents_traveling_out = \
+            self.sum_prop_residents_traveling_out_array.reshape((-1,) + (1,) * (common_coeff.ndim - 1))
+
+        # Element i,j is the proportion of subpopulation i that travels to
+        #   subpopulation j, for i != j, and 0 on the diagonal
+        travel_proportions_between_subpops = self.travel_proportions_between_subpops
+
+        wtd_infected_by_age = wtd_no_symp_by_age + symp_by_age
+
+        # Home region movement
+        wtd_infected_to_pop_ratio = np.divide(wtd_infected_by_age, effective_pop_by_age)
+
+        inf_from_home_region_movement = \
+            common_coeff * (1 - prop_time_away_by_age * sum_prop_residents_traveling_out) * \
+            np.matmul(contact_matrix, wtd_infected_to_pop_ratio)
 
-        wtd_no_symp_by_age_cache = self.create_wtd_no_symp_by_age_cache()
-        effective_pop_by_age_cache = self.create_pop_by_age_cache()
+        # Visitors -- element l is the sum over other subpopulations k of the
+        #   proportion of k's residents traveling to l times k's weighted infected
+        wtd_no_symp_visitors_by_age = matmul_subpop_vals(travel_proportions_between_subpops.T,
+                                                         wtd_no_symp_by_age)
+        symp_visitors_by_age = matmul_subpop_vals(travel_proportions_between_subpops.T,
+                                                  symp_by_age)
+
+        wtd_infected_visitors_to_pop_ratio = \
+            np.divide(wtd_no_symp_visitors_by_age + contact_mult_symp * symp_visitors_by_age,
+                      effective_pop_by_age)
+
+        inf_from_visitors = \
+            common_coeff * contact_mult_travel * \
+            np.matmul(contact_matrix, prop_time_away_by_age * wtd_infected_visitors_to_pop_ratio)
+
+        # Residents traveling -- element l is the sum over other subpopulations j
+        #   of the proportion of l's residents traveling to j times the ratio of
+        #   weighted infected to effective population at j
+        wtd_infected_to_pop_dest_ratio = matmul_subpop_vals(travel_proportions_between_subpops,
+                                                            wtd_infected_to_pop_ratio)
+
+        inf_from_residents_traveling = \
+            common_coeff * contact_mult_travel * wtd_infected_to_pop_dest_ratio * \
+            np.matmul(contact_matrix, prop_time_away_by_age)
+
+        self.force_of_infection_array = \
+            inf_from_home_region_movement + inf_from_visitors + inf_from_residents_traveling
+
+    def stack_subpop_vals(self,
+                          get_subpop_val) -> np.ndarray:
+        """
+        Stacks a quantity computed for each subpopulation into one array.
+
+        Args:
+            get_subpop_val (Callable):
+                function that takes a SubpopModel and returns its value of
+                the quantity -- a scalar or an array whose last two axes
+                are age groups and risk groups (or age groups and age groups,
+                or singleton axes), with an optional leading batched
+                replications axis.
+
+        Returns:
+            np.ndarray:
+                |L| x ... array, where |L| is the number of subpopulations,
+                ordered according to subpop_names_mapping. Every subpopulation's
+                value is broadcast to have a leading batched replications axis
+                if the SubpopModel instances simulate batched replications, so
+                that stacked arrays for different quantities broadcast
+                against each other.
+        """
 
-        # Extract subpop names in correct order corresponding to their mapping
         subpop_names_ordered = sorted(self.subpop_names_mapping, key=self.subpop_names_mapping.get)
 
+        num_batched_reps = self.subpop_models[subpop_names_ordered[0]].num_batched_reps
+        batch_shape = () if num_batched_reps is None else (num_batched_reps,)
+
+        subpop_vals = []
+
         for subpop_name in subpop_names_ordered:
-            force_of_infection = \
-                self.inf_from_home_region_movement(subpop_name,
-                                                   wtd_no_symp_by_age_cache,
-                                                   effective_pop_by_age_cache) + \
-                self.inf_from_visitors(subpop_name,
-                                       wtd_no_symp_by_age_cache,
-                                       effective_pop_by_age_cache) + \
-                self.inf_from_residents_traveling(subpop_name,
-                                                  wtd_no_symp_by_age_cache,
-                                                  effective_pop_by_age_cache)
+            val = np.asarray(get_subpop_val(self.subpop_models[subpop_name]), dtype=float)
 
-            force_of_infection_array.append(force_of_infection)
+            # Scalars are treated as 1 x 1 arrays
+            subpop_vals.append(val.reshape((1,) * max(2 - val.ndim, 0) + val.shape))
 
-        self.force_of_infection_array = np.asarray(force_of_infection_array)
+        # Values may have different (but compatible) shapes across
+        #   subpopulations -- e.g. |A| x 1 for one and |A| x |R| for another
+        stacked_shape = np.broadcast_shapes(batch_shape + (1, 1),
+                                            *[np.shape(val) for val in subpop_vals])
+
+        return np.stack([np.broadcast_to(val, stacked_shape) for val in subpop_vals])
 
     def prop_residents_traveling_pairwise(self,
                                           origin_subpop_name: str,
@@ -1010,9 +1644,34 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
         # For each subpopulation (row index), sum the travel proportions
         #   in that row but subtract the diagonal element (because
         #   we are excluding residents who travel within their home subpopulation).
+        if check_is_sparse(travel_proportions_array):
+            return np.asarray(travel_proportions_array.sum(axis=1)).reshape(-1, 1) - \
+                   travel_proportions_array.diagonal().reshape(-1, 1)
+
         return np.sum(travel_proportions_array, axis=1, keepdims=True) - \
                np.diag(travel_proportions_array).reshape(-1, 1)
 
+    def compute_travel_proportions_between_subpops(self) -> np.ndarray:
+        """
+        Returns |L| x |L| array, where |L| is the number of subpopulations,
+        equal to travel_proportions_array with its diagonal set to 0 --
+        only includes residents traveling to a different subpopulation.
+        Stays in CSR format (without storing zeros) if travel_proportions_array
+        is sparse.
+        """
+
+        travel_proportions_array = self.travel_proportions_array
+
+        if check_is_sparse(travel_proportions_array):
+            travel_proportions_between_subpops = travel_proportions_array.copy()
+            travel_proportions_between_subpops.setdiag(0)
+            travel_proportions_between_subpops.eliminate_zeros()
+            return travel_proportions_between_subpops
+
+        travel_proportions_array = np.asarray(travel_proportions_array)
+
+        return travel_proportions_array - np.diag(np.diag(travel_proportions_array))
+
     def create_wtd_no_symp_by_age_cache(self) -> dict:
         """
         Creates cache (dictionary) of weighted sum of
@@ -1078,8 +1737,8 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
             pop_healthy_by_age[subpop_name] = \
                 (pop_by_age_cache[subpop_name] -
                  subpop_model.params.contact_mult_symp *
-                 np.sum(subpop_state.IS, axis=1, keepdims=True) +
-                 np.sum(subpop_state.H, axis=1, keepdims=True))
+                 np.sum(subpop_state.IS, axis=-1, keepdims=True) +
+                 np.sum(subpop_state.H, axis=-1, keepdims=True))
 
         return pop_healthy_by_age
 
@@ -1161,7 +1820,7 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
         contact_matrix = subpop_state.flu_contact_matrix
         wtd_infected_by_age = \
             wtd_no_symp_by_age_cache[subpop_name] + \
-            np.sum(subpop_state.IS, axis=1, keepdims=True)
+            np.sum(subpop_state.IS, axis=-1, keepdims=True)
 
         wtd_infected_to_pop_ratio = np.divide(wtd_infected_by_age,
                                               effective_pop_by_age_cache[subpop_name])
@@ -1221,7 +1880,7 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
 
                 wtd_infected_visitors_by_age = \
                     wtd_no_symp_by_age_cache[visitors_subpop_name] + \
-                    contact_mult_symp * np.sum(visitors_subpop_state.IS, axis=1, keepdims=True)
+                    contact_mult_symp * np.sum(visitors_subpop_state.IS, axis=-1, keepdims=True)
 
                 wtd_infected_to_pop_ratio = \
                     np.divide(wtd_infected_visitors_by_age,
@@ -1286,7 +1945,7 @@ class FluInterSubpopRepo(clt.InterSubpopRepo):
                 # Weighted infected at DESTINATION subpopulation
                 wtd_infected_dest_by_age = \
                     wtd_no_symp_by_age_cache[dest_subpop_name] + \
-                    np.sum(dest_subpop_state.IS, axis=1, keepdims=True)
+                    np.sum(dest_subpop_state.IS, axis=-1, keepdims=True)
 
                 # Ratio of weighted infected (at destination) to
                 #   effective population (at destination)
@@ -1381,7 +2040,10 @@ class FluSubpopModel(clt.SubpopModel):
                  calendar_df: pd.DataFrame,
                  RNG: np.random.Generator,
                  name: str = "",
-                 wastewater_enabled: bool = False):
+                 wastewater_enabled: bool = False,
+                 wastewater_convolution_mode: str = "direct",
+                 wastewater_age_risk_resolved: bool = False,
+                 wastewater_record_S_to_E_timesteps: bool = False):
         """
         Args:
             compartments_epi_metrics (dict):
@@ -1392,7 +2054,9 @@ class FluSubpopModel(clt.SubpopModel):
             params (dict):
                 holds epidemiological parameter values -- keys and
                 values respectively must match field names and
-                format of FluSubpopParams.
+                format of FluSubpopParams. To share parameter arrays
+                across many subpopulations, use the dictionaries
+                returned by `clt.SharedParams.get_params_dict`.
             config (dict):
                 holds configuration values -- keys and values
                 respectively must match field names and format of
@@ -1412,6 +2076,16 @@ class FluSubpopModel(clt.SubpopModel):
             wastewater_enabled (bool):
                 if True, includes "wastewater" EpiMetric. Otherwise,
                 excludes it.
+            wastewater_convolution_mode (str):
+                "direct" (default) or "streaming" -- see
+                `Wastewater` docstring.
+            wastewater_age_risk_resolved (bool):
+                if True, "wastewater" EpiMetric keeps viral load
+                for each age-risk group -- see `Wastewater` docstring.
+            wastewater_record_S_to_E_timesteps (bool):
+                if True, "wastewater" EpiMetric records S_to_E on every
+                timestep, so that viral loads can be recomputed post-hoc --
+                see `Wastewater.compute_viral_load_history`.
         """
 
         # Assign config, params, and state to model-specific
@@ -1419,6 +2093,9 @@ class FluSubpopModel(clt.SubpopModel):
         # and sim state information
 
         self.wastewater_enabled = wastewater_enabled
+        self.wastewater_convolution_mode = wastewater_convolution_mode
+        self.wastewater_age_risk_resolved = wastewater_age_risk_resolved
+        self.wastewater_record_S_to_E_timesteps = wastewater_record_S_to_E_timesteps
 
         if not all(isinstance(val, datetime.date) for val in calendar_df["date"]):
             try:
@@ -1436,7 +2113,8 @@ class FluSubpopModel(clt.SubpopModel):
         #   and generally use deep copies to avoid modification of the same
         #   object. But in this function call, using deep copies is unnecessary
         #   (redundant) because the parent class SubpopModel's __init__()
-        #   creates deep copies.
+        #   creates deep copies. Read-only arrays (e.g. from a clt.SharedParams
+        #   instance's get_params_dict()) are shared rather than copied.
         super().__init__(state, params, config, RNG, name)
 
     def create_interaction_terms(self) -> sc.objdict:
@@ -1592,7 +2270,10 @@ class FluSubpopModel(clt.SubpopModel):
         if self.wastewater_enabled:
             epi_metrics.wastewater = \
                 Wastewater(getattr(self.state, "wastewater"),  # initial value is set to null for now
-                           transition_variables.S_to_E)
+                           transition_variables.S_to_E,
+                           self.wastewater_convolution_mode,
+                           self.wastewater_age_risk_resolved,
+                           self.wastewater_record_S_to_E_timesteps)
 
         epi_metrics.pop_immunity_hosp = \
             PopulationImmunityHosp(getattr(self.state, "pop_immunity_hosp"),
@@ -1600,10 +2281,20 @@ class FluSubpopModel(clt.SubpopModel):
 
         return epi_metrics
 
+    def get_model_checks_report(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame:
+                one row per failed input check -- see
+                `get_model_checks_report`.
+        """
+
+        return get_model_checks_report([self])
+
     def run_model_checks(self,
                          include_printing=True):
         """
-        Run flu model checks.
+        Run flu model checks -- see `get_model_checks_report`.
 
         Input checks:
             - SubpopState and SubpopParams instances should have
@@ -1614,66 +2305,159 @@ class FluSubpopModel(clt.SubpopModel):
                 total population computed at initialization
                 (user should not change initial values
                 after initialization).
+
+        Returns:
+            bool:
+                True if all checks pass.
         """
 
         if include_printing:
             print(">>> Running FluSubpopModel checks... \n")
             print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
 
-        error_counter = 0
+        return print_model_checks_report(self.get_model_checks_report(), include_printing)
 
-        state = self.state
-        params = self.params
-
-        for name, val in list(vars(state).items()) + list(vars(params).items()):
-            if isinstance(val, np.ndarray):
-                flattened_array = val.flatten()
-                for val in flattened_array:
-                    if val < 0:
-                        if include_printing:
-                            print(f"STOP! INPUT ERROR: {name} should not have negative values.")
-                        error_counter += 1
-            elif isinstance(val, float):
-                if val < 0:
-                    if include_printing:
-                        print(f"STOP! INPUT ERROR: {name} should not be negative.")
-                    error_counter += 1
-
-        compartment_population_sum = np.zeros((self.params.num_age_groups,
-                                               self.params.num_risk_groups))
-
-        for name, compartment in self.compartments.items():
-            compartment_population_sum += compartment.current_val
-            flattened_current_val = compartment.current_val.flatten()
-            for val in flattened_current_val:
-                if val != int(val):
-                    if include_printing:
-                        print(f"STOP! INPUT ERROR: {name} should not have non-integer values.")
-                    error_counter += 1
-                if val < 0:
-                    if include_printing:
-                        print(f"STOP! INPUT ERROR: {name} should not have negative values.")
-                    error_counter += 1
-
-        if (compartment_population_sum != self.params.total_pop_age_risk).any():
-            if include_printing:
-                print(f"STOP! INPUT ERROR: sum of population in compartments must \n"
-                      f"match specified total population value. Check \n"
-                      f"\"total_pop_age_risk\" in model's \"params\" attribute \n"
-                      f"and check compartments in state variables' init vals JSON.")
-            error_counter += 1
 
-        if error_counter == 0:
-            if include_printing:
-                print("OKAY! FluSubpopModel instance has passed input checks: \n"
-                      "Compartment populations are nonnegative whole numbers \n"
-                      "and add up to \"total_pop_age_risk\" in model's \n"
-                      "\"params attribute.\" Fixed parameters are nonnegative.")
-            return True
-        else:
-            if include_printing:
-                print(f"Need to fix {error_counter} errors before simulating model.")
-            return False
+def get_model_checks_report(subpop_models: list) -> pd.DataFrame:
+    """
+    Checks inputs of all `FluSubpopModel` instances in `subpop_models`
+        at once -- values of all checked arrays (of all subpopulations)
+        are concatenated, and the number of violations of each check is
+        counted for each subpopulation and array with a few array
+        operations, rather than element by element.
+
+    Input checks:
+        - "nonnegative": numerical arrays and floats in each model's
+            `SubpopState` and `SubpopParams` should not be negative.
+        - "integer": current values of compartments should be integers.
+        - "total_population": population sum of compartments should
+            match "total_pop_age_risk" in each model's params.
+
+    Args:
+        subpop_models (list[FluSubpopModel]):
+            models to check.
+
+    Returns:
+        pd.DataFrame:
+            one row per failed check of an array, with columns
+            "subpop_name", "check", "name" (name of state variable or
+            parameter), "num_violations" (number of elements
+            that fail the check), and "message". Empty if all
+            checks pass.
+    """
+
+    # Each segment is one array (or float) of one subpopulation --
+    #   segments_info[i] is (subpop_name, name) of segment i
+    nonnegative_segments_info = []
+    nonnegative_vals = []
+
+    integer_segments_info = []
+    integer_vals = []
+
+    population_mismatch_subpop_names = []
+
+    for subpop_model in subpop_models:
+        for name, val in list(vars(subpop_model.state).items()) + list(vars(subpop_model.params).items()):
+            if (isinstance(val, np.ndarray) and np.issubdtype(val.dtype, np.number)) or \
+                    isinstance(val, float):
+                nonnegative_segments_info.append((subpop_model.name, name))
+                nonnegative_vals.append(np.ravel(val))
+
+        compartments_vals = np.stack([np.asarray(compartment.current_val, dtype=float)
+                                      for compartment in subpop_model.compartments.values()])
+
+        for name, compartment_vals in zip(subpop_model.compartments.keys(), compartments_vals):
+            for check_segments_info, check_vals in ((nonnegative_segments_info, nonnegative_vals),
+                                                    (integer_segments_info, integer_vals)):
+                check_segments_info.append((subpop_model.name, name))
+                check_vals.append(np.ravel(compartment_vals))
+
+        if (np.sum(compartments_vals, axis=0) != subpop_model.params.total_pop_age_risk).any():
+            population_mismatch_subpop_names.append(subpop_model.name)
+
+    nonnegative_violations = count_segment_violations(nonnegative_vals, lambda vals: vals < 0)
+    integer_violations = count_segment_violations(integer_vals, lambda vals: vals != np.round(vals))
+
+    rows = []
+
+    for check, segments_info, violations, message in \
+            (("nonnegative", nonnegative_segments_info, nonnegative_violations,
+              "{name} should not have negative values."),
+             ("integer", integer_segments_info, integer_violations,
+              "{name} should not have non-integer values.")):
+        for segment_ix in np.flatnonzero(violations):
+            subpop_name, name = segments_info[segment_ix]
+            rows.append({"subpop_name": subpop_name,
+                         "check": check,
+                         "name": name,
+                         "num_violations": int(violations[segment_ix]),
+                         "message": message.format(name=name)})
+
+    for subpop_name in population_mismatch_subpop_names:
+        rows.append({"subpop_name": subpop_name,
+                     "check": "total_population",
+                     "name": "total_pop_age_risk",
+                     "num_violations": 1,
+                     "message": "sum of population in compartments must \n"
+                                "match specified total population value. Check \n"
+                                "\"total_pop_age_risk\" in model's \"params\" attribute \n"
+                                "and check compartments in state variables' init vals JSON."})
+
+    return pd.DataFrame(rows, columns=["subpop_name", "check", "name", "num_violations", "message"])
+
+
+def count_segment_violations(segments_vals: list,
+                             check_violation) -> np.ndarray:
+    """
+    Returns number of elements of each array in `segments_vals` for which
+        `check_violation` is True -- `check_violation` is applied once to
+        all arrays concatenated together.
+
+    Args:
+        segments_vals (list[np.ndarray]):
+            1D arrays.
+        check_violation (callable):
+            takes 1D array and returns boolean array of the same size.
+
+    Returns:
+        np.ndarray:
+            element i is the number of violations in `segments_vals[i]`.
+    """
+
+    if not segments_vals:
+        return np.zeros(0, dtype=int)
+
+    segments_sizes = [len(vals) for vals in segments_vals]
+    segments_ids = np.repeat(np.arange(len(segments_vals)), segments_sizes)
+
+    return np.bincount(segments_ids,
+                       weights=check_violation(np.concatenate(segments_vals)),
+                       minlength=len(segments_vals)).astype(int)
+
+
+def print_model_checks_report(report_df: pd.DataFrame,
+                              include_printing: bool = True) -> bool:
+    """
+    Prints failed checks in `report_df` (see `get_model_checks_report`),
+        and returns True if all checks passed.
+    """
+
+    if report_df.empty:
+        if include_printing:
+            print("OKAY! FluSubpopModel instance has passed input checks: \n"
+                  "Compartment populations are nonnegative whole numbers \n"
+                  "and add up to \"total_pop_age_risk\" in model's \n"
+                  "\"params attribute.\" Fixed parameters are nonnegative.")
+        return True
+
+    if include_printing:
+        for subpop_name, message, num_violations in \
+                zip(report_df["subpop_name"], report_df["message"], report_df["num_violations"]):
+            location = f" in {subpop_name}" if subpop_name else ""
+            print(f"STOP! INPUT ERROR{location}: {message} ({num_violations} values)")
+        print(f"Need to fix {report_df['num_violations'].sum()} errors before simulating model.")
+
+    return False
 
 
 class FluMetapopModel(clt.MetapopModel):
@@ -1683,8 +2467,147 @@ class FluMetapopModel(clt.MetapopModel):
     the repository holds all subpopulation models included
     in the metapopulation model, and also a DataFrame with
     travel proportions information.
+
+    Attributes:
+        sewershed_membership (Optional[np.ndarray | sparse.csr_array]):
+            |S| x |L| array, where |S| is the number of sewersheds and
+            |L| is the number of subpopulations (ordered according to
+            subpop_names_mapping) -- element s, l is the proportion of
+            subpopulation l's wastewater that goes to sewershed s.
+            Scipy sparse arrays are converted to CSR format.
+        sewershed_wastewater_history (clt.HistoryBuffer):
+            daily wastewater viral load of each sewershed --
+            element d has shape |S| x ..., where the trailing axes
+            are the shape of each subpopulation's daily viral load
+            (for example, batched replications and age-risk groups).
+
+    See `__init__` docstring for other attributes.
     """
 
+    def __init__(self,
+                 inter_subpop_repo: FluInterSubpopRepo,
+                 name: str = "",
+                 sewershed_membership: Optional[np.ndarray | scipy.sparse.sparray] = None):
+        """
+        Params:
+            inter_subpop_repo (FluInterSubpopRepo):
+                manages collection of subpopulation models with
+                methods for querying information.
+            name (str):
+                unique identifier for `MetapopModel`.
+            sewershed_membership (Optional[np.ndarray | sparse.sparray]):
+                if not `None`, every subpopulation model must have
+                wastewater enabled (all with the same
+                `wastewater_age_risk_resolved`), and their daily
+                wastewater viral loads are aggregated into sewersheds --
+                see class docstring.
+        """
+
+        super().__init__(inter_subpop_repo, name)
+
+        if sewershed_membership is not None:
+
+            if check_is_sparse(sewershed_membership):
+                from scipy import sparse
+                sewershed_membership = sparse.csr_array(sewershed_membership)
+            else:
+                sewershed_membership = np.asarray(sewershed_membership, dtype=float)
+
+            if np.ndim(sewershed_membership) != 2 or \
+                    np.shape(sewershed_membership)[1] != len(self.subpop_models):
+                raise clt.MetapopModelError("sewershed_membership must have "
+                                            "one column for each subpopulation.")
+
+            if not all(subpop_model.wastewater_enabled
+                       for subpop_model in self.subpop_models.values()):
+                raise clt.MetapopModelError("Every subpopulation model must have wastewater "
+                                            "enabled to aggregate wastewater by sewershed.")
+
+            if len(set(subpop_model.wastewater_age_risk_resolved
+                       for subpop_model in self.subpop_models.values())) > 1:
+                raise clt.MetapopModelError("Subpopulation models must all have the same "
+                                            "wastewater_age_risk_resolved value.")
+
+        self.sewershed_membership = sewershed_membership
+        self.sewershed_wastewater_history = clt.HistoryBuffer()
+
+    def save_daily_history(self) -> None:
+        """
+        If `self.sewershed_membership` is not `None`, aggregates the
+            daily wastewater viral load of every subpopulation into
+            sewersheds with one (sparse) matrix multiplication, and
+            appends the result to `self.sewershed_wastewater_history`.
+            Called by `clt.MetapopModel.simulate_until_day` only if
+            every subpopulation model saves daily history.
+
+        Raises:
+            MetapopModelError:
+                if subpopulations' daily viral loads have different
+                shapes (e.g. age-risk resolved viral loads of
+                subpopulations with different numbers of age groups).
+        """
+
+        if self.sewershed_membership is None:
+            return
+
+        subpop_names_mapping = self.inter_subpop_repo.subpop_names_mapping
+        subpop_names_ordered = sorted(subpop_names_mapping, key=subpop_names_mapping.get)
+
+        daily_viral_loads = [np.asarray(self.subpop_models[subpop_name].epi_metrics.wastewater.get_daily_viral_load())
+                             for subpop_name in subpop_names_ordered]
+
+        # Broadcasting would count a subpopulation's viral load once
+        #   for every age-risk group of the others, so shapes must match
+        daily_viral_loads_shapes = set(np.shape(val) for val in daily_viral_loads)
+
+        if len(daily_viral_loads_shapes) > 1:
+            raise clt.MetapopModelError(f"Daily wastewater viral loads of subpopulations have "
+                                        f"different shapes {sorted(daily_viral_loads_shapes)} -- "
+                                        f"cannot aggregate them into sewersheds.")
+
+        stacked_daily_viral_loads = np.stack(daily_viral_loads)
+
+        self.sewershed_wastewater_history.append(
+            matmul_subpop_vals(self.sewershed_membership, stacked_daily_viral_loads))
+
+    def reset_simulation(self):
+        """
+        Resets all `SubpopModel` instances and clears
+            `self.sewershed_wastewater_history`.
+        """
+
+        super().reset_simulation()
+        self.sewershed_wastewater_history.clear()
+
+    def get_snapshot(self,
+                     include_history: bool = False) -> dict:
+        """
+        Extends `clt.MetapopModel.get_snapshot` -- if `include_history`
+            is True, also saves `self.sewershed_wastewater_history`.
+        """
+
+        snapshot = super().get_snapshot(include_history)
+
+        if include_history:
+            snapshot["sewershed_wastewater_history"] = self.sewershed_wastewater_history.as_array()
+
+        return snapshot
+
+    def restore_snapshot(self,
+                         snapshot: dict) -> None:
+        """
+        Extends `clt.MetapopModel.restore_snapshot` -- restores
+            `self.sewershed_wastewater_history` if it was saved,
+            and otherwise clears it.
+        """
+
+        super().restore_snapshot(snapshot)
+
+        if "sewershed_wastewater_history" in snapshot:
+            self.sewershed_wastewater_history.set_vals(snapshot["sewershed_wastewater_history"])
+        else:
+            self.sewershed_wastewater_history.clear()
+
     def check_travel_proportions(self,
                                  include_printing=True):
         """
@@ -1712,7 +2635,7 @@ class FluMetapopModel(clt.MetapopModel):
         subpop_names = self.inter_subpop_repo.subpop_names_mapping
         num_subpop_names = len(subpop_names)
         travel_proportions_array = self.inter_subpop_repo.travel_proportions_array
-        if np.size(travel_proportions_array) != \
+        if np.shape(travel_proportions_array) != \
                 (num_subpop_names, num_subpop_names):
             error_counter += 1
             if include_printing:
@@ -1725,7 +2648,13 @@ class FluMetapopModel(clt.MetapopModel):
                       "name of an associated SubpopModel instance.")
 
         # Check if other values are between 0 and 1
-        if not ((travel_proportions_array >= 0).all() and (travel_proportions_array <= 1).all()):
+        # Only stored (nonzero) values need to be checked for sparse arrays
+        if check_is_sparse(travel_proportions_array):
+            travel_proportions_vals = travel_proportions_array.data
+        else:
+            travel_proportions_vals = np.asarray(travel_proportions_array)
+
+        if not ((travel_proportions_vals >= 0).all() and (travel_proportions_vals <= 1).all()):
             error_counter += 1
             if include_printing:
                 print("All numerical values must be between 0 and 1 "
@@ -1741,9 +2670,35 @@ class FluMetapopModel(clt.MetapopModel):
                 print(f"Need to fix {error_counter} errors before simulating model.")
             return False
 
-    def run_model_checks(self):
+    def get_model_checks_report(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame:
+                one row per failed input check of any
+                subpopulation model -- all subpopulation models are
+                checked at once (see `get_model_checks_report`).
+        """
 
-        self.check_travel_proportions()
+        return get_model_checks_report(list(self.subpop_models.values()))
 
-        for subpop_model in self.subpop_models.values():
-            subpop_model.run_model_checks()
+    def run_model_checks(self,
+                         include_printing=True):
+        """
+        Runs travel proportions checks (see `self.check_travel_proportions`)
+            and input checks of all subpopulation models (see
+            `self.get_model_checks_report`).
+
+        Returns:
+            bool:
+                True if all checks pass.
+        """
+
+        travel_proportions_ok = self.check_travel_proportions(include_printing)
+
+        if include_printing:
+            print(">>> Running FluSubpopModel checks... \n")
+            print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+
+        subpop_models_ok = print_model_checks_report(self.get_model_checks_report(), include_printing)
+
+        return travel_proportions_ok and subpop_models_ok
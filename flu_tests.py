@@ -24,6 +24,7 @@ import clt_base as clt
 import numpy as np
 import pandas as pd
 import copy
+import datetime
 import pytest
 
 from pathlib import Path
@@ -475,3 +476,989 @@ def test_wastewater_when_beta_zero(model):
         ww_history = model.epi_metrics["wastewater"].history_vals_list
         tol = 1e-6
         assert np.sum(np.abs(ww_history) < tol) == len(ww_history)
+
+
+@pytest.mark.parametrize("transition_type", ["binomial_deterministic",
+                                             "binomial_taylor_approx_deterministic",
+                                             "poisson_deterministic"])
+def test_batched_reps_match_serial_deterministic(transition_type):
+    """
+    With deterministic transitions, every batched replication
+        (leading replications axis) should exactly match a model
+        simulated without batching.
+    """
+
+    new_config_dict = copy.deepcopy(config_dict)
+    new_config_dict["transition_type"] = transition_type
+
+    serial_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                      params_dict,
+                                      new_config_dict,
+                                      calendar_df,
+                                      np.random.default_rng(starting_random_seed))
+
+    batched_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                       params_dict,
+                                       new_config_dict,
+                                       calendar_df,
+                                       np.random.default_rng(starting_random_seed))
+
+    batched_model.set_num_batched_reps(4)
+
+    serial_model.simulate_until_day(100)
+    batched_model.simulate_until_day(100)
+
+    for name, compartment in serial_model.compartments.items():
+        batched_history = np.asarray(batched_model.compartments[name].history_vals_list)
+        assert np.shape(batched_history)[1] == 4
+        for rep in range(4):
+            assert np.array_equal(batched_history[:, rep],
+                                  np.asarray(compartment.history_vals_list))
+
+
+@pytest.mark.parametrize("transition_type", ["binomial", "binomial_taylor_approx"])
+def test_batched_reps_population_is_constant(transition_type):
+    """
+    Each batched replication should conserve its own total population
+        and keep integer-valued compartments. Switching back to a single
+        replication should drop the leading replications axis.
+    """
+
+    new_config_dict = copy.deepcopy(config_dict)
+    new_config_dict["transition_type"] = transition_type
+
+    subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                      params_dict,
+                                      new_config_dict,
+                                      calendar_df,
+                                      np.random.default_rng(starting_random_seed))
+
+    subpop_model.set_num_batched_reps(5)
+    subpop_model.simulate_until_day(100)
+
+    total_by_rep = np.zeros(5)
+    for compartment in subpop_model.compartments.values():
+        assert np.shape(compartment.current_val)[0] == 5
+        assert (compartment.current_val == np.asarray(compartment.current_val, dtype=int)).all()
+        total_by_rep += np.sum(compartment.current_val, axis=(1, 2))
+
+    assert np.allclose(total_by_rep, np.sum(subpop_model.params.total_pop_age_risk))
+
+    subpop_model.set_num_batched_reps(None)
+    subpop_model.simulate_until_day(10)
+
+    for compartment in subpop_model.compartments.values():
+        assert np.shape(compartment.current_val) == np.shape(compartment.init_val)
+
+
+@pytest.mark.parametrize("transition_type", ["binomial",
+                                             "binomial_taylor_approx",
+                                             "poisson"])
+def test_joint_realization_matches_sampling_each_age_risk_group(transition_type):
+    """
+    Joint transitions sample all age-risk groups in a single
+        (broadcast) random draw -- with the same seed, this should give
+        exactly the same realizations as sampling each age-risk
+        group separately.
+    """
+
+    new_config_dict = copy.deepcopy(config_dict)
+    new_config_dict["transition_type"] = transition_type
+
+    subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                      params_dict,
+                                      new_config_dict,
+                                      calendar_df,
+                                      np.random.default_rng(starting_random_seed))
+
+    subpop_model.simulate_until_day(50)
+
+    num_timesteps = subpop_model.config.timesteps_per_day
+
+    for tvargroup in subpop_model.transition_variable_groups.values():
+
+        realizations = tvargroup.get_joint_realization(np.random.default_rng(1),
+                                                       num_timesteps)
+
+        RNG = np.random.default_rng(1)
+        origin_val = tvargroup.origin.current_val
+        expected_realizations = np.zeros(np.shape(realizations))
+
+        if transition_type == "poisson":
+            rates_array = tvargroup.get_current_rates_array()
+            for ix in np.ndindex(np.shape(origin_val)):
+                for outflow_ix in range(len(tvargroup.transition_variables)):
+                    expected_realizations[(outflow_ix,) + ix] = RNG.poisson(
+                        origin_val[ix] * rates_array[(outflow_ix,) + ix] / num_timesteps)
+        else:
+            if transition_type == "binomial":
+                probabilities_array = tvargroup.get_probabilities_array(num_timesteps)
+            else:
+                total_rate = tvargroup.get_total_rate()
+                probabilities_array = np.vstack((tvargroup.get_current_rates_array() / num_timesteps,
+                                                 np.expand_dims(1 - total_rate / num_timesteps, axis=0)))
+            for ix in np.ndindex(np.shape(origin_val)):
+                expected_realizations[(slice(None),) + ix] = RNG.multinomial(
+                    int(origin_val[ix]), probabilities_array[(slice(None),) + ix])
+
+        assert np.array_equal(realizations, expected_realizations)
+
+
+def test_history_preallocated_and_zero_copy():
+    """
+    Daily history is stored in one preallocated array per state variable,
+        sized when `simulate_until_day` is called and grown if the
+        simulation is extended. Converting history to a numpy array
+        should not copy, and history should be cleared on reset.
+    """
+
+    subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                      params_dict,
+                                      config_dict,
+                                      calendar_df,
+                                      np.random.default_rng(starting_random_seed))
+
+    subpop_model.config.save_daily_history = True
+
+    S_history = subpop_model.compartments["S"].history_vals_list
+
+    subpop_model.simulate_until_day(20)
+    assert len(S_history.vals) == 20
+
+    subpop_model.simulate_until_day(50)
+    assert len(S_history) == 50
+    assert np.shape(np.asarray(S_history)) == (50,) + np.shape(subpop_model.compartments["S"].init_val)
+    assert np.shares_memory(np.asarray(S_history), S_history.vals)
+    assert np.array_equal(S_history[-1], subpop_model.compartments["S"].current_val)
+
+    # Each day's value is stored separately -- history is not aliased
+    #   to current_val
+    assert not np.array_equal(S_history[0], S_history[-1])
+
+    subpop_model.reset_simulation()
+
+    for svar in subpop_model.all_state_variables.values():
+        assert len(svar.history_vals_list) == 0
+
+
+@pytest.mark.parametrize("num_batched_reps", [None, 3])
+def test_packed_compartments_match_unpacked(num_batched_reps):
+    """
+    Packing compartments into one contiguous buffer should not
+        change simulation results (with the same seed), and
+        compartments' current values and the corresponding
+        `SubpopState` fields should be views into the buffer.
+        Changing `config.pack_compartments` after the model is created
+        should have no effect.
+    """
+
+    models = []
+
+    for pack_compartments in (False, True):
+        new_config_dict = copy.deepcopy(config_dict)
+        new_config_dict["pack_compartments"] = pack_compartments
+
+        subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                          params_dict,
+                                          new_config_dict,
+                                          calendar_df,
+                                          np.random.default_rng(starting_random_seed))
+
+        subpop_model.config.pack_compartments = not pack_compartments
+
+        subpop_model.set_num_batched_reps(num_batched_reps)
+        subpop_model.simulate_until_day(50)
+
+        models.append(subpop_model)
+
+    check_state_variables_same_history(models[0], models[1])
+
+    assert models[0].compartments_buffer is None
+
+    for name, compartment in models[0].compartments.items():
+        assert getattr(models[0].state, name) is compartment.current_val
+
+    packed_model = models[1]
+
+    assert np.shape(packed_model.compartments_buffer) == \
+           (len(packed_model.compartments),) + np.shape(packed_model.compartments.S.current_val)
+
+    for ix, (name, compartment) in enumerate(packed_model.compartments.items()):
+        assert np.shares_memory(compartment.current_val, packed_model.compartments_buffer)
+        assert getattr(packed_model.state, name) is compartment.current_val
+        assert np.array_equal(packed_model.compartments_buffer[ix], compartment.current_val)
+
+
+def test_stoichiometry_matrix():
+    """
+    Each column of the stoichiometry matrix should have exactly one -1
+        (the transition variable's origin compartment) and one +1
+        (its destination compartment), so columns sum to 0 and
+        compartment updates conserve total population.
+    """
+
+    stoichiometry_matrix = subpopA_model.stoichiometry_matrix
+
+    assert np.shape(stoichiometry_matrix) == (len(subpopA_model.compartments),
+                                              len(subpopA_model.transition_variables))
+
+    compartments = list(subpopA_model.compartments.values())
+
+    for tvar_ix, tvar in enumerate(subpopA_model.transition_variables.values()):
+        column = stoichiometry_matrix[:, tvar_ix]
+        assert column[compartments.index(tvar.origin)] == -1
+        assert column[compartments.index(tvar.destination)] == 1
+        assert np.sum(np.abs(column)) == 2
+
+
+def test_metapop_force_of_infection_matches_pairwise():
+    """
+    `FluInterSubpopRepo.compute_shared_quantities` computes the force of
+        infection for all subpopulations at once -- it should match
+        summing the pairwise (per-subpopulation) computations in
+        `inf_from_home_region_movement`, `inf_from_visitors`, and
+        `inf_from_residents_traveling`, including with batched replications.
+    """
+
+    subpop_names = ["subpopA", "subpopB", "subpopC"]
+
+    subpop_models = {}
+
+    for ix, subpop_name in enumerate(subpop_names):
+        new_params_dict = copy.deepcopy(params_dict)
+        new_params_dict["beta_baseline"] = params_dict["beta_baseline"] * (1 + 0.2 * ix)
+
+        subpop_models[subpop_name] = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                        new_params_dict,
+                                                        config_dict,
+                                                        calendar_df,
+                                                        np.random.default_rng(starting_random_seed + ix),
+                                                        name=subpop_name)
+
+    travel_proportions_array = np.array([[0.8, 0.1, 0.3],
+                                         [0.05, 0.9, 0.2],
+                                         [0.4, 0.15, 0.7]])
+
+    inter_subpop_repo = flu.FluInterSubpopRepo(subpop_models,
+                                               {subpop_name: ix for ix, subpop_name in enumerate(subpop_names)},
+                                               travel_proportions_array)
+
+    metapop_model = flu.FluMetapopModel(inter_subpop_repo)
+
+    for num_batched_reps in (None, 2):
+
+        metapop_model.set_num_batched_reps(num_batched_reps)
+        metapop_model.simulate_until_day(30)
+
+        inter_subpop_repo.compute_shared_quantities()
+
+        wtd_no_symp_by_age_cache = inter_subpop_repo.create_wtd_no_symp_by_age_cache()
+        pop_by_age_cache = inter_subpop_repo.create_pop_by_age_cache()
+
+        for ix, subpop_name in enumerate(subpop_names):
+            pairwise_force_of_infection = \
+                inter_subpop_repo.inf_from_home_region_movement(subpop_name,
+                                                                wtd_no_symp_by_age_cache,
+                                                                pop_by_age_cache) + \
+                inter_subpop_repo.inf_from_visitors(subpop_name,
+                                                    wtd_no_symp_by_age_cache,
+                                                    pop_by_age_cache) + \
+                inter_subpop_repo.inf_from_residents_traveling(subpop_name,
+                                                               wtd_no_symp_by_age_cache,
+                                                               pop_by_age_cache)
+
+            assert np.allclose(inter_subpop_repo.force_of_infection_array[ix],
+                               pairwise_force_of_infection)
+
+
+def test_metapop_sparse_travel_proportions():
+    """
+    A MetapopModel whose travel proportions are a scipy sparse array
+        (loaded from a CSV of nonzero travel proportions) should
+        give the same results as the same model with a dense
+        travel proportions array.
+    """
+
+    sparse = pytest.importorskip("scipy.sparse")
+
+    subpop_names_mapping = {"subpopA": 0, "subpopB": 1, "subpopC": 2}
+
+    travel_proportions_array = np.array([[0.8, 0.1, 0.0],
+                                         [0.0, 0.9, 0.2],
+                                         [0.4, 0.0, 0.7]])
+
+    rows, cols = np.nonzero(travel_proportions_array)
+    subpop_names = list(subpop_names_mapping.keys())
+
+    pd.DataFrame({"origin_subpop_name": [subpop_names[i] for i in rows],
+                  "dest_subpop_name": [subpop_names[j] for j in cols],
+                  "travel_proportion": travel_proportions_array[rows, cols]}).to_csv(
+        "travel_proportions.csv", index=False)
+
+    sparse_travel_proportions = clt.load_sparse_travel_proportions_csv("travel_proportions.csv",
+                                                                       subpop_names_mapping)
+
+    with pytest.raises(clt.MetapopModelError, match="subpopC"):
+        clt.load_sparse_travel_proportions_csv("travel_proportions.csv",
+                                               {"subpopA": 0, "subpopB": 1})
+
+    Path("travel_proportions.csv").unlink()
+
+    assert sparse.issparse(sparse_travel_proportions)
+    assert np.array_equal(sparse_travel_proportions.toarray(), travel_proportions_array)
+
+    metapop_models = []
+
+    for travel_proportions in (travel_proportions_array, sparse_travel_proportions):
+        subpop_models = {}
+
+        for ix, subpop_name in enumerate(subpop_names):
+            subpop_models[subpop_name] = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                            params_dict,
+                                                            config_dict,
+                                                            calendar_df,
+                                                            np.random.default_rng(starting_random_seed + ix),
+                                                            name=subpop_name)
+
+        metapop_model = flu.FluMetapopModel(flu.FluInterSubpopRepo(subpop_models,
+                                                                   subpop_names_mapping,
+                                                                   travel_proportions))
+
+        assert metapop_model.check_travel_proportions(include_printing=False)
+
+        metapop_model.simulate_until_day(50)
+
+        metapop_models.append(metapop_model)
+
+    assert sparse.issparse(metapop_models[1].inter_subpop_repo.travel_proportions_between_subpops)
+
+    for subpop_name in subpop_names:
+        for name, compartment in metapop_models[0].subpop_models[subpop_name].compartments.items():
+            assert np.allclose(np.asarray(compartment.history_vals_list),
+                               np.asarray(metapop_models[1].subpop_models[subpop_name].compartments[name].history_vals_list))
+
+
+def test_contact_matrix_calendar_lookup():
+    """
+    `FluContactMatrix` looks up the type of each day in a compiled
+        calendar array -- this should match filtering calendar_df for
+        every date, the compiled calendar should be shared by subpopulations
+        with the same calendar_df (and removed from the cache when calendar_df
+        is garbage collected), and simulating a date that is not in
+        the calendar should raise an error.
+    """
+
+    subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                      params_dict,
+                                      config_dict,
+                                      calendar_df,
+                                      np.random.default_rng(starting_random_seed))
+
+    other_subpop_model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                            params_dict,
+                                            config_dict,
+                                            calendar_df,
+                                            np.random.default_rng(starting_random_seed))
+
+    contact_matrix = subpop_model.schedules.flu_contact_matrix
+    params = subpop_model.params
+
+    assert contact_matrix.day_types_array is other_subpop_model.schedules.flu_contact_matrix.day_types_array
+
+    df = subpop_model.calendar_df
+
+    for date in df["date"]:
+        contact_matrix.update_current_val(params, date)
+
+        current_row = df[df["date"] == date].iloc[0]
+        expected = params.total_contact_matrix - \
+                   (1 - current_row["is_school_day"]) * params.school_contact_matrix - \
+                   (1 - current_row["is_work_day"]) * params.work_contact_matrix
+
+        assert np.array_equal(contact_matrix.current_val, expected)
+
+    with pytest.raises(clt.SubpopModelError):
+        contact_matrix.update_current_val(params, max(df["date"]) + datetime.timedelta(days=1))
+
+    import gc
+
+    temporary_calendar_df = calendar_df.copy()
+    temporary_calendar_df_id = id(temporary_calendar_df)
+    flu.compile_calendar(temporary_calendar_df)
+
+    assert temporary_calendar_df_id in flu.compiled_calendars_cache
+
+    del temporary_calendar_df
+    gc.collect()
+
+    assert temporary_calendar_df_id not in flu.compiled_calendars_cache
+
+
+def test_schedule_timelines_shared_and_invalidated(monkeypatch):
+    """
+    Schedule values looked up in cached timelines should match computing
+        them every day, subpopulations with the same parameters should share
+        the same timeline, and changing a parameter the schedule depends on
+        should use a new timeline. Parameters are only fingerprinted again
+        when they are assigned new values.
+    """
+
+    def create_subpop_model():
+        return flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                  params_dict,
+                                  config_dict,
+                                  calendar_df,
+                                  np.random.default_rng(starting_random_seed))
+
+    subpop_model = create_subpop_model()
+    other_subpop_model = create_subpop_model()
+    uncached_subpop_model = create_subpop_model()
+
+    for schedule in uncached_subpop_model.schedules.values():
+        schedule.timeline_params_names = None
+
+    for model in (subpop_model, other_subpop_model, uncached_subpop_model):
+        model.simulate_until_day(50)
+
+    assert "flu_contact_matrix" in subpop_model.schedule_timelines
+    assert not uncached_subpop_model.schedule_timelines
+
+    for name, timeline in subpop_model.schedule_timelines.items():
+        assert timeline is other_subpop_model.schedule_timelines[name]
+        assert not timeline.flags.writeable
+
+    check_state_variables_same_history(subpop_model, uncached_subpop_model)
+
+    old_timeline = subpop_model.schedule_timelines.flu_contact_matrix
+
+    subpop_model.reset_simulation()
+    subpop_model.params.work_contact_matrix = subpop_model.params.work_contact_matrix * 0.5
+    subpop_model.simulate_until_day(50)
+
+    new_timeline = subpop_model.schedule_timelines.flu_contact_matrix
+
+    assert new_timeline is not old_timeline
+    assert not np.array_equal(new_timeline, old_timeline)
+
+    fingerprinted_params_names = []
+
+    def compute_params_fingerprint(params, params_names):
+        fingerprinted_params_names.append(params_names)
+        return clt.compute_params_fingerprint(params, params_names)
+
+    monkeypatch.setattr(clt.base_components, "compute_params_fingerprint", compute_params_fingerprint)
+
+    for day in range(51, 60):
+        subpop_model.simulate_until_day(day)
+
+    assert not fingerprinted_params_names
+
+    subpop_model.params.work_contact_matrix = subpop_model.params.work_contact_matrix * 2
+    subpop_model.simulate_until_day(60)
+
+    assert len(fingerprinted_params_names) == 1
+    # Timelines may cover more days than simulated, if a longer one was cached
+    assert np.array_equal(subpop_model.schedule_timelines.flu_contact_matrix[:50], old_timeline[:50])
+
+
+@pytest.mark.parametrize("num_batched_reps", [None, 3])
+def test_wastewater_streaming_matches_direct(num_batched_reps):
+    """
+    Wastewater viral load computed in "streaming" mode (one FFT per day)
+        should match the "direct" convolution on every timestep, and
+        invalid convolution modes should be rejected.
+    """
+
+    wastewater_models = {}
+
+    for mode in ("direct", "streaming"):
+        model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                   params_dict,
+                                   config_dict,
+                                   calendar_df,
+                                   np.random.default_rng(starting_random_seed),
+                                   wastewater_enabled=True,
+                                   wastewater_convolution_mode=mode)
+        model.set_num_batched_reps(num_batched_reps)
+        model.simulate_until_day(60)
+        wastewater_models[mode] = model
+
+    direct_wastewater = wastewater_models["direct"].epi_metrics.wastewater
+    streaming_wastewater = wastewater_models["streaming"].epi_metrics.wastewater
+
+    assert np.allclose(np.asarray(direct_wastewater.history_vals_list),
+                       np.asarray(streaming_wastewater.history_vals_list),
+                       rtol=1e-10)
+
+    # S_to_E is not recorded on every timestep unless requested
+    assert len(direct_wastewater.S_to_E_timesteps_history) == 0
+
+    with pytest.raises(clt.SubpopModelError):
+        direct_wastewater.compute_viral_load_history()
+
+    with pytest.raises(clt.SubpopModelError):
+        flu.Wastewater(0, None, "recursive")
+
+
+@pytest.mark.parametrize("num_batched_reps", [None, 3])
+def test_viral_load_overlap_add_matches_wastewater(num_batched_reps):
+    """
+    Recomputing wastewater viral loads post-hoc from the S_to_E recorded
+        on every timestep (`Wastewater.compute_viral_load_history`, which
+        uses scipy) should match the viral loads computed during the simulation.
+    """
+
+    pytest.importorskip("scipy.signal")
+
+    model = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                               params_dict,
+                               config_dict,
+                               calendar_df,
+                               np.random.default_rng(starting_random_seed),
+                               wastewater_enabled=True,
+                               wastewater_record_S_to_E_timesteps=True)
+    model.set_num_batched_reps(num_batched_reps)
+    model.simulate_until_day(30)
+    model.simulate_until_day(60)
+
+    wastewater = model.epi_metrics.wastewater
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    assert len(wastewater.S_to_E_timesteps_history) == 60 * timesteps_per_day
+
+    assert np.allclose(wastewater.compute_viral_load_history(daily=True),
+                       np.asarray(wastewater.history_vals_list),
+                       rtol=1e-10)
+
+    # Viral loads on the timesteps of the last day
+    assert np.allclose(wastewater.compute_viral_load_history()[-timesteps_per_day:],
+                       wastewater.current_val_list,
+                       rtol=1e-10)
+
+    assert np.allclose(flu.compute_viral_load_overlap_add(wastewater.viral_shedding,
+                                                          wastewater.S_to_E_timesteps_history),
+                       wastewater.compute_viral_load_history())
+
+    # The S_to_E ring buffer only holds one kernel length of timesteps
+    assert len(wastewater.S_to_E_history) == len(wastewater.viral_shedding) < 60 * timesteps_per_day
+
+    model.reset_simulation()
+
+    assert len(wastewater.S_to_E_timesteps_history) == 0
+
+
+def test_viral_shedding_kernel_cached_and_matches_loop():
+    """
+    The vectorized viral shedding kernel should match the
+        trapezoidal integral computed timestep by timestep, be computed
+        once and shared by all `Wastewater` instances with the same
+        parameters, and preprocessing should only happen once per simulation.
+    """
+
+    params = clt.make_dataclass_from_dict(flu.FluSubpopParams, params_dict)
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    def log_viral_shedding(time_point):
+        return params.viral_shed_magnitude * time_point / \
+               (params.viral_shed_peak ** 2 + time_point ** 2)
+
+    expected_kernel = []
+
+    for time_idx in range(int(params.viral_shed_duration * timesteps_per_day)):
+        cur_time_point = time_idx / timesteps_per_day
+        next_time_point = (time_idx + 1) / timesteps_per_day
+        interval_viral_shedding = 10 ** log_viral_shedding(next_time_point)
+        if time_idx > 0:
+            interval_viral_shedding += 10 ** log_viral_shedding(cur_time_point)
+        expected_kernel.append(params.viral_shed_feces_mass * 0.5 *
+                               interval_viral_shedding / timesteps_per_day)
+
+    wastewater_models = [flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                            params_dict,
+                                            config_dict,
+                                            calendar_df,
+                                            np.random.default_rng(starting_random_seed),
+                                            wastewater_enabled=True) for i in range(2)]
+
+    for model in wastewater_models:
+        model.simulate_until_day(5)
+
+    wastewater = wastewater_models[0].epi_metrics.wastewater
+
+    assert wastewater.flag_preprocessed
+    assert np.allclose(wastewater.viral_shedding, expected_kernel[::-1], rtol=1e-12)
+    assert wastewater.viral_shedding is wastewater_models[1].epi_metrics.wastewater.viral_shedding
+    assert not wastewater.viral_shedding.flags.writeable
+
+    # Kernel is looked up again (not recomputed) after reset
+    wastewater_models[0].reset_simulation()
+    wastewater_models[0].simulate_until_day(5)
+
+    assert wastewater_models[0].epi_metrics.wastewater.viral_shedding is \
+           wastewater_models[1].epi_metrics.wastewater.viral_shedding
+
+
+@pytest.mark.parametrize("num_batched_reps", [None, 2])
+def test_sewershed_wastewater_aggregation(num_batched_reps):
+    """
+    Age-risk-resolved wastewater summed over age-risk groups should
+        match the default (summed) wastewater, and sewershed wastewater
+        should be the sewershed membership matrix times the subpopulations'
+        daily wastewater viral loads. Sewershed history should not be saved
+        when subpopulations do not save history, and viral loads with
+        different shapes should not be aggregated.
+    """
+
+    subpop_names_mapping = {"subpopA": 0, "subpopB": 1, "subpopC": 2}
+    subpop_names = list(subpop_names_mapping.keys())
+
+    travel_proportions_array = np.array([[0.8, 0.1, 0.1],
+                                         [0.2, 0.7, 0.1],
+                                         [0.1, 0.1, 0.8]])
+
+    sewershed_membership = np.array([[1.0, 0.5, 0.0],
+                                     [0.0, 0.5, 1.0]])
+
+    metapop_models = []
+
+    for age_risk_resolved in (False, True):
+        subpop_models = {}
+
+        for ix, subpop_name in enumerate(subpop_names):
+            subpop_models[subpop_name] = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                            params_dict,
+                                                            config_dict,
+                                                            calendar_df,
+                                                            np.random.default_rng(starting_random_seed + ix),
+                                                            name=subpop_name,
+                                                            wastewater_enabled=True,
+                                                            wastewater_age_risk_resolved=age_risk_resolved)
+
+        metapop_model = flu.FluMetapopModel(flu.FluInterSubpopRepo(subpop_models,
+                                                                   subpop_names_mapping,
+                                                                   travel_proportions_array),
+                                            sewershed_membership=sewershed_membership)
+        metapop_model.set_num_batched_reps(num_batched_reps)
+        metapop_model.simulate_until_day(30)
+
+        metapop_models.append(metapop_model)
+
+    summed_model, resolved_model = metapop_models
+
+    summed_history = np.asarray(summed_model.sewershed_wastewater_history)
+    resolved_history = np.asarray(resolved_model.sewershed_wastewater_history)
+
+    assert resolved_history.shape[-2:] == np.shape(resolved_model.subpop_models.subpopA.compartments.S.current_val)[-2:]
+    assert np.allclose(np.sum(resolved_history, axis=(-2, -1)), summed_history, rtol=1e-10)
+
+    subpop_histories = np.stack([np.asarray(summed_model.subpop_models[subpop_name].epi_metrics.wastewater.history_vals_list)
+                                 for subpop_name in subpop_names], axis=1)
+
+    assert np.allclose(summed_history, np.einsum("sl,dl...->ds...", sewershed_membership, subpop_histories))
+
+    summed_model.reset_simulation()
+    assert len(summed_model.sewershed_wastewater_history) == 0
+
+    # Sewershed history is only saved if subpopulations save history
+    for subpop_model in summed_model.subpop_models.values():
+        subpop_model.config.save_daily_history = False
+
+    summed_model.simulate_until_day(10)
+    assert len(summed_model.sewershed_wastewater_history) == 0
+
+    # Viral loads with different shapes are not broadcast against each other
+    resolved_wastewater = resolved_model.subpop_models.subpopA.epi_metrics.wastewater
+    resolved_wastewater.get_daily_viral_load = lambda: np.zeros((1, 1))
+
+    with pytest.raises(clt.MetapopModelError):
+        resolved_model.save_daily_history()
+
+    with pytest.raises(clt.MetapopModelError):
+        flu.FluMetapopModel(summed_model.inter_subpop_repo,
+                            sewershed_membership=np.ones((2, 2)))
+
+
+@pytest.mark.parametrize("include_history", [False, True])
+def test_snapshot_restore_branches_match_continued_simulation(include_history):
+    """
+    Simulating from a restored snapshot should give exactly the same
+        results (including random transitions, wastewater, and sewershed
+        wastewater) as continuing the snapshotted simulation, both on
+        the snapshotted model and on a new model, and the same snapshot
+        can be restored more than once.
+    """
+
+    subpop_names_mapping = {"subpopA": 0, "subpopB": 1}
+
+    def create_metapop_model(seed):
+        subpop_models = {}
+
+        for ix, subpop_name in enumerate(subpop_names_mapping):
+            subpop_models[subpop_name] = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                            params_dict,
+                                                            {**config_dict, "pack_compartments": ix == 1},
+                                                            calendar_df,
+                                                            np.random.default_rng(seed + ix),
+                                                            name=subpop_name,
+                                                            wastewater_enabled=True,
+                                                            wastewater_convolution_mode=("direct", "streaming")[ix])
+
+        return flu.FluMetapopModel(flu.FluInterSubpopRepo(subpop_models,
+                                                          subpop_names_mapping,
+                                                          np.array([[0.9, 0.1], [0.2, 0.8]])),
+                                   sewershed_membership=np.array([[1.0, 0.5]]))
+
+    metapop_model = create_metapop_model(starting_random_seed)
+    metapop_model.simulate_until_day(20)
+
+    snapshot = metapop_model.snapshot(include_history)
+
+    metapop_model.simulate_until_day(40)
+
+    continued_vals = {(subpop_name, name): np.array(svar.current_val)
+                      for subpop_name, subpop_model in metapop_model.subpop_models.items()
+                      for name, svar in subpop_model.all_state_variables.items()}
+    continued_histories = {(subpop_name, name): np.array(svar.history_vals_list)
+                           for subpop_name, subpop_model in metapop_model.subpop_models.items()
+                           for name, svar in subpop_model.all_state_variables.items()}
+    continued_sewershed_history = np.array(metapop_model.sewershed_wastewater_history)
+
+    for restored_model in (metapop_model, create_metapop_model(0), metapop_model):
+        restored_model.restore(snapshot)
+
+        assert restored_model.current_simulation_day == 20
+        assert restored_model.current_real_date == \
+               metapop_model.subpop_models.subpopA.start_real_date + datetime.timedelta(days=20)
+
+        restored_model.simulate_until_day(40)
+
+        # Histories restart at the snapshot's day unless they were saved
+        num_history_days = 40 if include_history else 20
+
+        for subpop_name, subpop_model in restored_model.subpop_models.items():
+            for name, svar in subpop_model.all_state_variables.items():
+                assert np.array_equal(svar.current_val, continued_vals[(subpop_name, name)])
+                assert np.array_equal(np.array(svar.history_vals_list),
+                                      continued_histories[(subpop_name, name)][-num_history_days:])
+
+        assert np.array_equal(np.array(restored_model.sewershed_wastewater_history),
+                              continued_sewershed_history[-num_history_days:])
+
+    # subpopA_model does not have wastewater enabled
+    with pytest.raises(clt.SubpopModelError):
+        subpopA_model.restore(metapop_model.subpop_models.subpopA.snapshot())
+
+
+def test_phase_profiler_records_phases_without_changing_results():
+    """
+    Profiling a `MetapopModel` should record wall time and number of calls
+        of each phase, for each subpopulation and transition variable,
+        without changing simulation results -- and disabling profiling
+        should restore the models' original methods.
+    """
+
+    subpop_names_mapping = {"subpopA": 0, "subpopB": 1}
+
+    def create_metapop_model():
+        subpop_models = {subpop_name: flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                         params_dict,
+                                                         config_dict,
+                                                         calendar_df,
+                                                         np.random.default_rng(starting_random_seed + ix),
+                                                         name=subpop_name)
+                         for ix, subpop_name in enumerate(subpop_names_mapping)}
+
+        return flu.FluMetapopModel(flu.FluInterSubpopRepo(subpop_models,
+                                                          subpop_names_mapping,
+                                                          np.array([[0.9, 0.1], [0.2, 0.8]])))
+
+    profiled_model = create_metapop_model()
+
+    recorded_stacks = []
+    profiler = clt.PhaseProfiler(callbacks=[lambda stack, elapsed: recorded_stacks.append(stack)])
+    profiled_model.set_profiler(profiler)
+    profiled_model.simulate_until_day(10)
+
+    unprofiled_model = create_metapop_model()
+    unprofiled_model.simulate_until_day(10)
+
+    for subpop_name in subpop_names_mapping:
+        for name, compartment in profiled_model.subpop_models[subpop_name].compartments.items():
+            assert np.array_equal(np.asarray(compartment.history_vals_list),
+                                  np.asarray(unprofiled_model.subpop_models[subpop_name].compartments[name].history_vals_list))
+
+    report_df = profiler.get_report_df().set_index("stack")
+
+    timesteps_per_day = config_dict["timesteps_per_day"]
+
+    assert report_df.loc["metapop;compute_shared_quantities", "num_calls"] == 10
+    assert report_df.loc["subpopB;prepare_daily_state", "num_calls"] == 10
+    assert report_df.loc["subpopA;simulate_timesteps;sample_transitions", "num_calls"] == 10 * timesteps_per_day
+    assert report_df.loc["subpopA;simulate_timesteps;update_transition_rates;S_to_E;get_current_rate",
+                         "num_calls"] == 10 * timesteps_per_day
+    assert report_df.loc["subpopA;simulate_timesteps;sample_transitions;E_out;get_joint_realization",
+                         "num_calls"] == 10 * timesteps_per_day
+
+    # Self time excludes nested phases
+    assert np.isclose(report_df.loc["subpopA;simulate_timesteps", "total_seconds"],
+                      report_df.loc["subpopA;simulate_timesteps", "self_seconds"] +
+                      report_df.loc[["subpopA;simulate_timesteps;" + phase
+                                     for phase in ("update_transition_rates", "sample_transitions",
+                                                   "update_epi_metrics", "update_compartments")],
+                                    "total_seconds"].sum())
+
+    assert recorded_stacks.count(("subpopB", "prepare_daily_state")) == 10
+
+    profiled_model.set_profiler(None)
+    profiler.reset()
+    profiled_model.simulate_until_day(12)
+
+    assert len(profiler.stats) == 0
+    assert profiled_model.subpop_models.subpopA.transition_variable_groups.E_out.get_joint_realization.__func__ is \
+           clt.TransitionVariableGroup.get_multinomial_realization
+
+
+def test_model_checks_report():
+    """
+    Input checks of all subpopulations of a MetapopModel are run at
+        once by `get_model_checks_report` -- the report should be empty
+        for a valid model, and should have one row for each array
+        that fails a check, with the number of elements that fail.
+    """
+
+    subpop_models = {}
+
+    for ix, subpop_name in enumerate(["subpopA", "subpopB"]):
+        subpop_models[subpop_name] = flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                        params_dict,
+                                                        config_dict,
+                                                        calendar_df,
+                                                        np.random.default_rng(starting_random_seed + ix),
+                                                        name=subpop_name)
+
+    inter_subpop_repo = flu.FluInterSubpopRepo(subpop_models,
+                                               {"subpopA": 0, "subpopB": 1},
+                                               np.array([[0.9, 0.2], [0.1, 0.8]]))
+
+    metapop_model = flu.FluMetapopModel(inter_subpop_repo)
+
+    assert metapop_model.get_model_checks_report().empty
+    assert metapop_model.run_model_checks(include_printing=False)
+
+    subpopA_model = subpop_models["subpopA"]
+    subpopB_model = subpop_models["subpopB"]
+
+    subpopA_model.params.beta_baseline = -1.0
+
+    S_init_val = np.array(subpopB_model.compartments.S.current_val, dtype=float)
+    S_init_val[0, 0] += 0.5
+    S_init_val[1, 0] -= 0.5
+    subpopB_model.compartments.S.current_val = S_init_val
+    subpopB_model.compartments.R.current_val[0, 0] += 1
+
+    report_df = metapop_model.get_model_checks_report()
+
+    assert set(zip(report_df["subpop_name"], report_df["check"], report_df["name"],
+                   report_df["num_violations"])) == \
+        {("subpopA", "nonnegative", "beta_baseline", 1),
+         ("subpopB", "integer", "S", 2),
+         ("subpopB", "total_population", "total_pop_age_risk", 1)}
+
+    assert subpopA_model.get_model_checks_report()["subpop_name"].eq("subpopA").all()
+    assert not subpopA_model.run_model_checks(include_printing=False)
+    assert not subpopB_model.run_model_checks(include_printing=False)
+    assert not metapop_model.run_model_checks(include_printing=False)
+
+
+def test_shared_params_copy_on_write():
+    """
+    Subpopulations built from the same `SharedParams` instance should share
+        its (read-only) arrays, keep their own values for overridden fields,
+        and give the same results as subpopulations built from copies
+        of the parameters. Assigning a new value to a shared field of one
+        subpopulation should not change the other subpopulations.
+    """
+
+    shared_params = clt.SharedParams(params_dict)
+
+    with pytest.raises(clt.SubpopModelError):
+        shared_params.get_params_dict({"not_a_param": 1})
+
+    shared_models = []
+    copied_models = []
+
+    for ix in range(2):
+        overrides = {"beta_baseline": params_dict["beta_baseline"] * (1 + ix)}
+
+        shared_models.append(flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                shared_params.get_params_dict(overrides),
+                                                config_dict,
+                                                calendar_df,
+                                                np.random.default_rng(starting_random_seed + ix)))
+
+        copied_models.append(flu.FluSubpopModel(compartments_epi_metrics_dict,
+                                                {**copy.deepcopy(params_dict), **overrides},
+                                                config_dict,
+                                                calendar_df,
+                                                np.random.default_rng(starting_random_seed + ix)))
+
+    shared_A_params = shared_models[0].params
+    shared_B_params = shared_models[1].params
+
+    assert shared_A_params.school_contact_matrix is shared_B_params.school_contact_matrix
+    assert shared_A_params.school_contact_matrix is not params_dict["school_contact_matrix"]
+    assert params_dict["school_contact_matrix"].flags.writeable
+
+    with pytest.raises(ValueError):
+        shared_A_params.school_contact_matrix[0, 0] = 0
+
+    assert set(shared_params.get_overrides(shared_A_params)) == {"total_pop_age_risk"}
+    assert set(shared_params.get_overrides(shared_B_params)) == {"beta_baseline", "total_pop_age_risk"}
+
+    for shared_model, copied_model in zip(shared_models, copied_models):
+        shared_model.simulate_until_day(50)
+        copied_model.simulate_until_day(50)
+        check_state_variables_same_history(shared_model, copied_model)
+
+    shared_A_params.school_contact_matrix = np.zeros_like(shared_A_params.school_contact_matrix)
+
+    assert "school_contact_matrix" in shared_params.get_overrides(shared_A_params)
+    assert shared_B_params.school_contact_matrix is shared_params.base_params["school_contact_matrix"]
+    assert np.array_equal(shared_B_params.school_contact_matrix, params_dict["school_contact_matrix"])
+
+
+def test_dense_travel_metapop_does_not_import_scipy():
+    """
+    scipy is only needed for sparse travel proportions and FFT
+        convolution of wastewater -- importing `flu_model` and simulating
+        a MetapopModel with dense travel proportions should not import
+        scipy, so it also works when scipy is not installed. Importing
+        `flu_model` should not import pandas or sciris either.
+    """
+
+    import subprocess
+    import sys
+
+    code = ("import sys\n"
+            "sys.modules['scipy'] = None\n"
+            "import numpy as np, clt_base as clt, flu_model as flu\n"
+            "assert 'pandas' not in sys.modules and 'sciris' not in sys.modules\n"
+            "import pandas as pd\n"
+            "from pathlib import Path\n"
+            "base_path = Path('flu_demo_input_files')\n"
+            "subpop_models = {name: flu.FluSubpopModel(\n"
+            "    clt.load_json_new_dict(base_path / 'compartments_epi_metrics_init_vals.json'),\n"
+            "    clt.load_json_new_dict(base_path / 'common_params.json'),\n"
+            "    clt.load_json_new_dict(base_path / 'config.json'),\n"
+            "    pd.read_csv(base_path / 'school_work_calendar.csv', index_col=0),\n"
+            "    np.random.default_rng(ix), name=name)\n"
+            "    for ix, name in enumerate(['subpopA', 'subpopB'])}\n"
+            "metapop_model = flu.FluMetapopModel(flu.FluInterSubpopRepo(\n"
+            "    subpop_models, {'subpopA': 0, 'subpopB': 1}, np.array([[0.9, 0.2], [0.1, 0.8]])))\n"
+            "metapop_model.simulate_until_day(5)\n"
+            "assert sys.modules['scipy'] is None\n")
+
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).parent)
+
+    subprocess.run([sys.executable, "-c", "import sys, flu_model\nassert 'scipy' not in sys.modules"],
+                   check=True, cwd=Path(__file__).parent)